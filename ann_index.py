@@ -0,0 +1,97 @@
+# ann_index.py
+
+import os
+
+import faiss
+from dotenv import load_dotenv
+
+load_dotenv()
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# Index built by build_index.py; see README for the tradeoffs.
+INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "0"))  # 0 = derive from corpus size
+PQ_M = int(os.getenv("FAISS_PQ_M", "16"))
+HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+
+# Query-time defaults, overridable per retrieve() call.
+NPROBE = int(os.getenv("FAISS_NPROBE", "8"))
+EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+
+# IVF wants ~39 training points per centroid; PQ needs 256 for its 8-bit codebooks.
+MIN_POINTS_PER_LIST = 39
+MIN_PQ_POINTS = 256
+
+
+def _nlist(n, nlist=IVF_NLIST):
+    if nlist:
+        return min(nlist, n)
+    return max(1, min(int(4 * n ** 0.5), n // MIN_POINTS_PER_LIST))
+
+
+def _pq_m(dim, pq_m=PQ_M):
+    """Largest sub-quantizer count <= pq_m that divides dim."""
+    return next(m for m in range(min(pq_m, dim), 0, -1) if dim % m == 0)
+
+
+def resolve_kind(kind, n):
+    """Fall back to flat when the corpus is too small to train the requested index."""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {kind!r}, expected one of {INDEX_TYPES}")
+    if kind in ("ivf_flat", "ivf_pq") and n < MIN_POINTS_PER_LIST:
+        return "flat"
+    if kind == "ivf_pq" and n < MIN_PQ_POINTS:
+        return "flat"
+    return kind
+
+
+def factory_string(kind, dim, n, nlist=IVF_NLIST, pq_m=PQ_M, hnsw_m=HNSW_M):
+    if kind == "flat":
+        return "IDMap,Flat"
+    if kind == "ivf_flat":
+        return f"IDMap,IVF{_nlist(n, nlist)},Flat"
+    if kind == "ivf_pq":
+        return f"IDMap,IVF{_nlist(n, nlist)},PQ{_pq_m(dim, pq_m)}"
+    if kind == "hnsw":
+        return f"IDMap,HNSW{hnsw_m}"
+    raise ValueError(f"Unknown index type {kind!r}, expected one of {INDEX_TYPES}")
+
+
+def create_index(kind, embeddings, ids, **params):
+    """
+    Build, train and populate an id-mapped index of the given kind.
+
+    :param kind: one of INDEX_TYPES
+    :param embeddings: (n, dim) float32 matrix
+    :param ids: (n,) int64 FAISS ids
+    :param params: overrides for nlist / pq_m / hnsw_m
+    """
+    n, dim = embeddings.shape
+    kind = resolve_kind(kind, n)
+    index = faiss.index_factory(dim, factory_string(kind, dim, n, **params))
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add_with_ids(embeddings, ids)
+    return index
+
+
+def _inner(index):
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def search_params(index, nprobe=None, ef_search=None):
+    """SearchParameters for this index type, or None for exhaustive indexes."""
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=nprobe or NPROBE)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search or EF_SEARCH)
+    return None
+
+
+def supports_remove(index):
+    """HNSW graphs cannot drop vectors, so incremental builds must rebuild them."""
+    return not isinstance(_inner(index), faiss.IndexHNSW)
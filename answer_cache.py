@@ -0,0 +1,151 @@
+# answer_cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+from embedding_cache import normalize_text
+from sql_validator import referenced_tables
+from table_versions import table_versions
+
+load_dotenv()
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "300"))
+# Cosine similarity above which two questions are treated as the same question.
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+
+class AnswerCache:
+    """
+    Two-level cache of answered questions.
+
+    1. Exact: the normalized question text.
+    2. Semantic: nearest cached question by embedding, above `threshold`
+       cosine similarity, from a small inner-product FAISS index.
+
+    `lookup()` returns a dict with the cached `sql`, `sql_meta` and `answer`,
+    the level that matched (`kind`) and whether the SQL result is still
+    `fresh`. A result is stale once `ttl` has passed or any table it read was
+    bumped in `table_versions`. Entries are evicted least-recently-used.
+    """
+
+    def __init__(self, embed_fn, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL,
+                 threshold=ANSWER_CACHE_THRESHOLD, versions=table_versions):
+        self.embed_fn = embed_fn
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.versions = versions
+        self._entries = OrderedDict()  # normalized question -> entry
+        self._by_id = {}
+        self._index = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _vector(self, question):
+        vec = np.array([self.embed_fn(question)], dtype="float32")
+        faiss.normalize_L2(vec)
+        return vec
+
+    def _is_fresh(self, entry):
+        return time.monotonic() - entry["created_at"] < self.ttl and self.versions.is_current(entry["tables"])
+
+    def _result(self, entry, kind):
+        fresh = self._is_fresh(entry)
+        if kind == "exact":
+            self.exact_hits += 1
+        else:
+            self.semantic_hits += 1
+        if not fresh:
+            self.stale_hits += 1
+        return {"kind": kind, "fresh": fresh, "question": entry["question"], "sql": entry["sql"],
+                "sql_meta": entry["sql_meta"], "answer": entry["answer"]}
+
+    def lookup(self, question: str):
+        """Return the cached entry for this (or a near-identical) question, or None."""
+        key = normalize_text(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return self._result(entry, "exact")
+            if self._index is None or self._index.ntotal == 0:
+                self.misses += 1
+                return None
+
+        vec = self._vector(question)
+        with self._lock:
+            if self._index is not None and self._index.ntotal:
+                D, I = self._index.search(vec, 1)
+                entry = self._by_id.get(int(I[0][0]))
+                if entry is not None and D[0][0] >= self.threshold:
+                    self._entries.move_to_end(entry["key"])
+                    return self._result(entry, "semantic")
+            self.misses += 1
+            return None
+
+    def store(self, question: str, sql: str, sql_meta: dict, answer: str):
+        """Cache a successful answer, replacing any entry for the same question."""
+        key = normalize_text(question)
+        vec = self._vector(question)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._remove(old)
+            if self._index is None:
+                self._index = faiss.IndexIDMap(faiss.IndexFlatIP(vec.shape[1]))
+
+            entry = {
+                "id": self._next_id, "key": key, "question": question, "sql": sql,
+                "sql_meta": sql_meta, "answer": answer, "created_at": time.monotonic(),
+                "tables": self.versions.snapshot(referenced_tables(sql)),
+            }
+            self._next_id += 1
+            self._index.add_with_ids(vec, np.array([entry["id"]], dtype="int64"))
+            self._entries[key] = entry
+            self._by_id[entry["id"]] = entry
+
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._remove(evicted)
+
+    def refresh(self, question: str, sql_meta: dict):
+        """Record a re-executed SQL result for a cached entry, restarting its TTL."""
+        with self._lock:
+            entry = self._entries.get(normalize_text(question))
+            if entry is not None:
+                entry["sql_meta"] = sql_meta
+                entry["created_at"] = time.monotonic()
+                entry["tables"] = self.versions.snapshot(referenced_tables(entry["sql"]))
+
+    def _remove(self, entry):
+        self._by_id.pop(entry["id"], None)
+        self._index.remove_ids(np.array([entry["id"]], dtype="int64"))
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_id.clear()
+            self._index = None
@@ -1,19 +1,36 @@
 import os
 import json
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+import logging
+from datetime import datetime
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
+from sqlalchemy import insert, select
 from models import db, User, Conversation, Message
-from rag import answer_question
+from chat_history import conversation_page, exchange_rows, message_page, page_size
+import db_engines
+import metrics
+import warmup
+from metrics import span, trace
+from rag import answer_question, answer_question_stream
+from rag_batch import BATCH_CONCURRENCY, BATCH_MAX_QUESTIONS, BatchJob, read_questions
 from functools import wraps
 
 load_dotenv()
+# DEBUG also logs every SQL prompt; at INFO and above those messages are never built.
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_engines.engine_options('app', app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'devkey')
 db.init_app(app)
+# Chat-history writes share Flask-SQLAlchemy's pool; generated SQL gets its own read-only pool.
+with app.app_context():
+    db_engines.register_engine('app', db.engine)
 
 
 # -----------------------------
@@ -38,6 +55,31 @@ def login_required_api(f):
     return wrapper
 
 
+def get_or_create_conversation(user_id):
+    """
+    Conversation stored in the session, or a new one for this user. A new one
+    is only flushed; it is saved by the caller's commit.
+    """
+    conv_id = session.get('conversation_id')
+    if conv_id:
+        conversation = Conversation.query.filter_by(id=conv_id, user_id=user_id).first()
+    else:
+        conversation = None
+
+    # If no conversation exists, create one
+    if not conversation:
+        conversation = Conversation(user_id=user_id)
+        db.session.add(conversation)
+        db.session.flush()
+        session['conversation_id'] = conversation.id
+    return conversation
+
+
+def sse(event, data):
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 @app.cli.command('db_init')
 def db_init():
     with app.app_context():
@@ -45,6 +87,17 @@ def db_init():
         print('DB initialized.')
 
 
+@app.cli.command('db_upgrade')
+def db_upgrade():
+    """Add tables and indexes introduced since the database was initialized."""
+    with app.app_context():
+        db.create_all()
+        for table in (Conversation.__table__, Message.__table__):
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+        print('DB upgraded.')
+
+
 # -----------------------------
 # Routes
 # -----------------------------
@@ -135,43 +188,172 @@ def chat():
         return jsonify({'error': 'empty question'}), 400
 
     user_id = session['user_id']
+    asked_at = datetime.utcnow()
+    with trace('chat'):
+        # RAG answer (using fine-tuned OpenAI model in rag.py)
+        try:
+            assistant_text, meta = answer_question(text)
+        except Exception as e:
+            logger.exception("Error answering question")
+            assistant_text = f"Error processing question: {e}"
+            meta = {}
 
-    # Get conversation from session
-    conv_id = session.get('conversation_id')
-    if conv_id:
-        conversation = Conversation.query.filter_by(id=conv_id, user_id=user_id).first()
-    else:
-        conversation = None
+        # Conversation (if new) and both messages in one transaction
+        with span('persist'):
+            conversation = get_or_create_conversation(user_id)
+            db.session.execute(insert(Message), exchange_rows(conversation.id, text, assistant_text, meta, asked_at))
+            db.session.commit()
+        logger.debug("Assistant reply: %s", assistant_text)
 
-    # If no conversation exists, create one
-    if not conversation:
-        conversation = Conversation(user_id=user_id)
-        db.session.add(conversation)
+    return jsonify({'reply': assistant_text, 'meta': meta, 'conversation_id': conversation.id})
+
+@app.route('/api/chat/stream', methods=['POST'])
+@login_required_api
+def chat_stream():
+    """
+    Server-sent events version of /api/chat: progress events, answer tokens
+    as they arrive, then "done" once the assistant message is saved.
+    """
+    data = request.json
+    text = data.get('text', '').strip()
+    if not text:
+        return jsonify({'error': 'empty question'}), 400
+
+    # Resolved before streaming so the session cookie can carry a new conversation;
+    # the commit also ends the lookup's transaction instead of holding it open while answering.
+    asked_at = datetime.utcnow()
+    with span('persist'):
+        conversation_id = get_or_create_conversation(session['user_id']).id
         db.session.commit()
-        session['conversation_id'] = conversation.id
 
-    # Save user message
-    user_msg = Message(conversation_id=conversation.id, sender='user', text=text)
-    db.session.add(user_msg)
-    db.session.commit()
+    def events():
+        assistant_text, meta = "", {}
+        with trace('chat_stream'):
+            try:
+                for event, payload in answer_question_stream(text):
+                    if event == "done":
+                        assistant_text, meta = payload["answer"], payload["meta"]
+                    else:
+                        yield sse(event, payload)
+            except Exception as e:
+                logger.exception("Error answering question")
+                assistant_text = f"Error processing question: {e}"
+                meta = {}
+                yield sse("error", {"error": assistant_text})
 
-    # RAG answer (using fine-tuned OpenAI model in rag.py)
-    try:
-        print(f"User question: {text}")
-        assistant_text, meta = answer_question(text)
-    except Exception as e:
-        assistant_text = f"Error processing question: {e}"
-        meta = {}
-
-    # Save assistant message
-    bot_msg = Message(conversation_id=conversation.id, sender='assistant',
-                      text=assistant_text, meta=json.dumps(meta))
-    print(f"Assistant reply: {assistant_text}")
-    db.session.add(bot_msg)
+            with span('persist'):
+                db.session.execute(insert(Message),
+                                   exchange_rows(conversation_id, text, assistant_text, meta, asked_at))
+                db.session.commit()
+        yield sse("done", {'reply': assistant_text, 'meta': meta, 'conversation_id': conversation_id})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/chat/batch', methods=['POST'])
+@login_required_api
+def chat_batch():
+    """
+    Answer many questions in one call. Takes {"questions": [...]} or a JSONL
+    body, streams one JSON line per question as answers complete, then a
+    {"stats": ...} line. All messages are saved in one commit at the end.
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and 'questions' in data:
+        questions = data['questions'] or []
+        try:
+            concurrency = int(data.get('concurrency', BATCH_CONCURRENCY))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'concurrency must be an integer'}), 400
+    else:
+        # Anything else, including a one-line JSONL body sent as JSON, is a list of questions.
+        try:
+            questions = read_questions(request.get_data(as_text=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        concurrency = BATCH_CONCURRENCY
+    questions = [q.strip() for q in questions if isinstance(q, str) and q.strip()]
+    if not questions:
+        return jsonify({'error': 'no questions'}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'at most {BATCH_MAX_QUESTIONS} questions per batch'}), 413
+
+    conversation_id = get_or_create_conversation(session['user_id']).id
     db.session.commit()
+    job = BatchJob(questions, min(max(1, concurrency), BATCH_CONCURRENCY))
 
-    return jsonify({'reply': assistant_text, 'meta': meta, 'conversation_id': conversation.id})
+    def lines():
+        results = []
+        with trace('chat_batch'):
+            for result in job:
+                results.append(result)
+                yield json.dumps(result, default=str) + "\n"
+
+            with span('persist'):
+                rows = []
+                for result in sorted(results, key=lambda r: r['index']):
+                    reply = result['reply']
+                    if reply is None:
+                        reply = f"Error processing question: {result['error']}"
+                    rows.extend(exchange_rows(conversation_id, result['question'], reply, result['meta']))
+                db.session.execute(insert(Message), rows)
+                db.session.commit()
+        yield json.dumps({'stats': job.stats(), 'conversation_id': conversation_id}) + "\n"
+
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/conversations', methods=['GET'])
+@login_required_api
+def list_conversations():
+    """The user's conversations, newest first. Pass ?before=<next_before> for the next page."""
+    return jsonify(conversation_page(db.session, session['user_id'], request.args.get('before', type=int),
+                                     page_size(request.args.get('limit'))))
+
+
+@app.route('/api/conversations/<int:conversation_id>/messages', methods=['GET'])
+@login_required_api
+def list_messages(conversation_id):
+    """
+    A conversation's messages, newest first, ?before=<next_before> for older
+    ones. meta (SQL and result rows) is only included with ?meta=1.
+    """
+    owned = db.session.execute(select(Conversation.id).where(
+        Conversation.id == conversation_id, Conversation.user_id == session['user_id'])).scalar()
+    if owned is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(message_page(db.session, conversation_id, request.args.get('before', type=int),
+                                page_size(request.args.get('limit')), with_meta=request.args.get('meta') == '1'))
+
+
+@app.route('/ready')
+def ready():
+    """200 once this worker has warmed up (index, models, DB pools), 503 until then."""
+    if warmup.is_ready():
+        return jsonify({'ready': True, 'pid': os.getpid(), 'warm_up': warmup.timings()})
+    warmup.start_background()
+    return jsonify({'ready': False, 'pid': os.getpid()}), 503
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage latency histograms, token counters, cache and pool stats (Prometheus text format)."""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({'error': 'metrics disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/metrics/traces')
+def recent_traces():
+    """The last TRACE_KEEP sampled request traces (TRACE_SAMPLE_RATE > 0)."""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({'error': 'metrics disabled'}), 404
+    return jsonify(list(metrics.recent_traces))
 
 
 if __name__ == '__main__':
+    warmup.warm_up()
+    warmup.warm_up_worker()
     app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,152 @@
+# asgi.py
+#
+# ASGI entry point: POST /api/chat is served natively by the async pipeline
+# (rag_async), every other route is the regular Flask app.
+#
+#   uvicorn asgi:application --workers 4
+#
+# Requires asgiref, an ASGI server, and an async DB driver (aiomysql for MySQL).
+
+import asyncio
+import json
+import logging
+from datetime import datetime
+from http.cookies import SimpleCookie
+
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import insert, select
+
+from app import app as flask_app
+from models import Conversation, Message
+from chat_history import exchange_rows
+import db_engines
+import warmup
+from metrics import span, trace
+from rag_async import answer_question_async
+
+logger = logging.getLogger(__name__)
+_flask = WsgiToAsgi(flask_app)
+conversations = Conversation.__table__
+messages = Message.__table__
+
+
+# -----------------------------
+# Flask session cookie
+# -----------------------------
+def _session_serializer():
+    return flask_app.session_interface.get_signing_serializer(flask_app)
+
+
+def load_session(scope) -> dict:
+    """Decode the signed Flask session cookie, or return an empty session."""
+    cookie = SimpleCookie()
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            cookie.load(value.decode("latin-1"))
+    morsel = cookie.get(flask_app.config["SESSION_COOKIE_NAME"])
+    if morsel is None:
+        return {}
+    try:
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        return dict(_session_serializer().loads(morsel.value, max_age=max_age))
+    except Exception:
+        return {}
+
+
+def session_cookie_header(session: dict):
+    value = _session_serializer().dumps(session)
+    return (b"set-cookie", f"{flask_app.config['SESSION_COOKIE_NAME']}={value}; HttpOnly; Path=/".encode())
+
+
+# -----------------------------
+# Chat persistence
+# -----------------------------
+async def persist_exchange(user_id, conversation_id, question, answer, meta, asked_at):
+    """
+    Find or create the conversation and store the question and the reply in
+    one transaction; returns the conversation id.
+    """
+    with span("persist"):
+        async with db_engines.get_async_engine("app").begin() as conn:
+            if conversation_id:
+                conversation_id = (await conn.execute(
+                    select(conversations.c.id).where(conversations.c.id == conversation_id,
+                                                     conversations.c.user_id == user_id))).scalar()
+            if not conversation_id:
+                result = await conn.execute(insert(conversations).values(user_id=user_id))
+                conversation_id = result.inserted_primary_key[0]
+            await conn.execute(insert(messages), exchange_rows(conversation_id, question, answer, meta, asked_at))
+    return conversation_id
+
+
+# -----------------------------
+# ASGI plumbing
+# -----------------------------
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload, default=str).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), *headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def chat(scope, receive, send):
+    session = load_session(scope)
+    if "user_id" not in session:
+        return await send_json(send, 401, {"error": "unauthenticated"})
+
+    try:
+        data = json.loads(await read_body(receive) or b"{}")
+    except ValueError:
+        data = {}
+    text = (data.get("text") or "").strip()
+    if not text:
+        return await send_json(send, 400, {"error": "empty question"})
+
+    asked_at = datetime.utcnow()
+    with trace("chat_async"):
+        try:
+            assistant_text, meta = await answer_question_async(text)
+        except Exception as e:
+            logger.exception("Error answering question")
+            assistant_text = f"Error processing question: {e}"
+            meta = {}
+        conversation_id = await persist_exchange(session["user_id"], session.get("conversation_id"), text,
+                                                 assistant_text, meta, asked_at)
+
+    headers = ()
+    if session.get("conversation_id") != conversation_id:
+        session["conversation_id"] = conversation_id
+        headers = (session_cookie_header(session),)
+    await send_json(send, 200, {"reply": assistant_text, "meta": meta, "conversation_id": conversation_id}, headers)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await asyncio.to_thread(warmup.warm_up)
+            if db_engines.DB_WARMUP:
+                await db_engines.warm_up_async()
+            await asyncio.to_thread(warmup.warm_up_worker)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await db_engines.dispose_all_async()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http" and scope["path"] == "/api/chat" and scope["method"] == "POST":
+        return await chat(scope, receive, send)
+    return await _flask(scope, receive, send)
@@ -0,0 +1,108 @@
+"""
+Recall / latency / memory tradeoffs of the index types in ann_index.py.
+
+Builds each index type over a synthetic clustered corpus, then reports
+recall@k against the exact (flat) results, single-query p50/p99 latency for
+a sweep of nprobe / efSearch values, build time and serialized size.
+
+Usage:
+    python -m benchmarks.bench_ann --sizes 10000 100000 1000000 --dim 128
+    python -m benchmarks.bench_ann --sizes 5000000 --types flat ivf_pq
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+import ann_index
+
+SWEEPS = {
+    "flat": [None],
+    "ivf_flat": [1, 8, 32, 128],
+    "ivf_pq": [1, 8, 32, 128],
+    "hnsw": [16, 64, 256],
+}
+
+
+def make_corpus(n, dim, nq, clusters=256, seed=0):
+    """Gaussian blobs, closer to real embedding distributions than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype("float32")
+    xb = centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim)).astype("float32")
+    xq = centers[rng.integers(clusters, size=nq)] + 0.3 * rng.normal(size=(nq, dim)).astype("float32")
+    return xb.astype("float32"), xq.astype("float32")
+
+
+def index_bytes(index):
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        path = f.name
+    try:
+        faiss.write_index(index, path)
+        return os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+
+def recall_at_k(found, truth):
+    k = truth.shape[1]
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def time_queries(index, xq, k, params):
+    samples, results = [], []
+    for q in xq:
+        start = time.perf_counter()
+        if params is None:
+            _, I = index.search(q[None, :], k)
+        else:
+            _, I = index.search(q[None, :], k, params=params)
+        samples.append((time.perf_counter() - start) * 1000)
+        results.append(I[0])
+    return (np.array(results), statistics.median(samples),
+            statistics.quantiles(samples, n=100, method="inclusive")[98])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", choices=ann_index.INDEX_TYPES, default=list(ann_index.INDEX_TYPES))
+    args = parser.parse_args()
+
+    print(f"{'vectors':>9} {'type':>9} {'param':>6} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'build s':>8} {'MB':>9}")
+    for n in args.sizes:
+        xb, xq = make_corpus(n, args.dim, args.queries)
+        ids = np.arange(n, dtype="int64")
+        exact = faiss.IndexFlatL2(args.dim)
+        exact.add(xb)
+        _, truth = exact.search(xq, args.k)
+        del exact
+
+        for requested in args.types:
+            kind = ann_index.resolve_kind(requested, n)  # report what was built, not what was asked for
+            start = time.perf_counter()
+            index = ann_index.create_index(kind, xb, ids)
+            build_s = time.perf_counter() - start
+            size_mb = index_bytes(index) / 1e6
+
+            for value in SWEEPS[kind]:
+                if kind.startswith("ivf"):
+                    params = ann_index.search_params(index, nprobe=value)
+                else:
+                    params = ann_index.search_params(index, ef_search=value)
+                found, p50, p99 = time_queries(index, xq, args.k, params)
+                print(f"{n:>9} {kind:>9} {value or '-':>6} {recall_at_k(found, truth):>9.3f} "
+                      f"{p50:>8.3f} {p99:>8.3f} {build_s:>8.1f} {size_mb:>9.1f}")
+            del index
+
+
+if __name__ == "__main__":
+    main()
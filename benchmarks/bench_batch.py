@@ -0,0 +1,79 @@
+"""
+Bulk workload: the same questions sent one at a time (one answer_question()
+after another, as a reporting job looping over /api/chat does) vs. one
+rag_batch.BatchJob.
+
+Runs locally against the stub OpenAI server (fixed latency per request)
+and a seeded SQLite database. The question list repeats a share of its
+questions, as reporting jobs do; caches are off so only the batch's own
+deduplication counts. Reports questions per second, OpenAI requests and
+DB connection checkouts for each.
+
+Usage:
+    python -m benchmarks.bench_batch --questions 200 --duplicates 0.25 --concurrency 8 --latency 0.05
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from benchmarks.fixtures import install_retriever, use_local_backends
+from benchmarks.stub_llm import StubLLMServer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--duplicates", type=float, default=0.25, help="share of questions that repeat another")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub seconds per OpenAI request")
+    args = parser.parse_args()
+
+    stub = StubLLMServer(latency=args.latency).start()
+    workdir = tempfile.mkdtemp()
+    use_local_backends(workdir, stub, ANSWER_CACHE="0", SQL_CACHE="0")
+
+    # Imported after the environment is set: clients and caches read it at import time.
+    import db_engines
+    import rag
+    import rag_batch
+    import retriever
+
+    install_retriever(workdir, [{"id": f"example-{i}", "text": f"Q: question {i}\nSQL: SELECT {i};"}
+                                for i in range(200)])
+    rng = random.Random(0)
+    n_unique = max(1, int(args.questions * (1 - args.duplicates)))
+    base = [f"report question {i}" for i in range(n_unique)]
+    questions = base + [rng.choice(base) for _ in range(args.questions - n_unique)]
+    rng.shuffle(questions)
+
+    def run(name, fn):
+        retriever.embedding_cache.clear()
+        calls = dict(stub.calls)
+        checkouts = db_engines.pool_stats()["query"]["checkouts"] if "query" in db_engines.pool_stats() else 0
+        start = time.perf_counter()
+        fn()
+        wall = time.perf_counter() - start
+        used = {k: stub.calls[k] - calls[k] for k in calls}
+        checkouts = db_engines.pool_stats()["query"]["checkouts"] - checkouts
+        print(f"{name:>8}  {len(questions) / wall:8.1f} questions/s  {wall:6.2f} s  embeddings requests "
+              f"{used['embeddings']:4d}  chat requests {used['chat']:4d}  DB checkouts {checkouts:4d}")
+
+    def one_at_a_time():
+        for q in questions:
+            rag.answer_question(q)
+
+    def batch():
+        job = rag_batch.BatchJob(questions, args.concurrency)
+        for _ in job:
+            pass
+
+    print(f"{len(questions)} questions, {len(set(questions))} unique, concurrency {args.concurrency}, "
+          f"stub latency {args.latency * 1000:.0f} ms")
+    run("serial", one_at_a_time)
+    run("batch", batch)
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Burst of identical questions (a dashboard refresh): OpenAI requests and
+wall time with and without single-flight coalescing.
+
+Each scenario fires --requests copies of one question, started at random
+offsets within --spread seconds, from threads (sync pipeline), asyncio
+tasks (async pipeline) and --processes worker processes with a few threads
+each (coalescing per process vs. across processes through a lock dir).
+Answer caching is off, so only in-flight requests can be shared.
+
+Usage:
+    python -m benchmarks.bench_coalesce --requests 50 --spread 0.2 --latency 0.05 --processes 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks.fixtures import build_stub_index, use_local_backends
+from benchmarks.stub_llm import StubLLMServer
+
+QUESTION = "How many employees are in each department?"
+
+
+def burst_threads(n, spread, fn):
+    rng = random.Random(0)
+    offsets = [rng.uniform(0, spread) for _ in range(n)]
+    start = time.perf_counter()
+
+    def worker(offset):
+        time.sleep(max(0.0, start + offset - time.perf_counter()))
+        fn()
+
+    threads = [threading.Thread(target=worker, args=(o,)) for o in offsets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def _worker_process(workdir, lock_dir, n, spread, barrier, durations):
+    os.environ["COALESCE_LOCK_DIR"] = lock_dir
+    import rag
+    import retriever
+
+    retriever._RETRIEVER = retriever.Retriever(os.path.join(workdir, "faiss_index.bin"),
+                                               os.path.join(workdir, "faiss_docs.bin"),
+                                               os.path.join(workdir, "none.version"))
+    retriever.get_retriever().state()
+    barrier.wait()
+    start = time.perf_counter()
+    burst_threads(n, spread, lambda: rag.answer_question(QUESTION))
+    durations.put(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--spread", type=float, default=0.2, help="seconds over which the burst arrives")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub seconds per OpenAI request")
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    stub = StubLLMServer(latency=args.latency).start()
+    workdir = tempfile.mkdtemp()
+    use_local_backends(workdir, stub, ANSWER_CACHE="0", SQL_CACHE="0", COALESCE_LOCK_DIR="")
+    build_stub_index(workdir, [{"id": f"example-{i}", "text": f"Q: question {i}\nSQL: SELECT {i};"}
+                               for i in range(200)])
+
+    import rag
+    import rag_async
+    import retriever
+
+    retriever._RETRIEVER = retriever.Retriever(os.path.join(workdir, "faiss_index.bin"),
+                                               os.path.join(workdir, "faiss_docs.bin"),
+                                               os.path.join(workdir, "none.version"))
+
+    def report(name, calls, start, wall=None):
+        wall = time.perf_counter() - start if wall is None else wall
+        used = {k: stub.calls[k] - calls[k] for k in calls}
+        print(f"{name:<38} {wall:6.2f} s   chat requests {used['chat']:4d}   embeddings requests {used['embeddings']:4d}")
+
+    def measure(name, fn):
+        calls, start = dict(stub.calls), time.perf_counter()
+        fn()
+        report(name, calls, start)
+
+    def threads():
+        burst_threads(args.requests, args.spread, lambda: rag.answer_question(QUESTION))
+
+    async def tasks():
+        # One event loop for both runs: the async OpenAI client keeps connections bound to it.
+        async def one(offset):
+            await asyncio.sleep(offset)
+            await rag_async.answer_question_async(QUESTION)
+
+        for enabled in (False, True):
+            rng = random.Random(0)
+            rag_async.COALESCE_ENABLED = enabled
+            retriever.embedding_cache.clear()
+            calls, start = dict(stub.calls), time.perf_counter()
+            await asyncio.gather(*(one(rng.uniform(0, args.spread)) for _ in range(args.requests)))
+            report(f"asyncio, {'coalesced' if enabled else 'independent'}", calls, start)
+        await rag_async.get_async_engine().dispose()
+
+    def processes(name, lock_dir):
+        ctx = multiprocessing.get_context("spawn")
+        per_process = max(1, args.requests // args.processes)
+        barrier, durations = ctx.Barrier(args.processes + 1), ctx.Queue()
+        procs = [ctx.Process(target=_worker_process,
+                             args=(workdir, lock_dir, per_process, args.spread, barrier, durations))
+                 for _ in range(args.processes)]
+        for p in procs:
+            p.start()
+        calls = dict(stub.calls)
+        barrier.wait()  # processes are loaded; only the burst is timed, by the workers themselves
+        wall = max(durations.get() for _ in procs)
+        for p in procs:
+            p.join()
+        report(name, calls, 0, wall)
+
+    print(f"{args.requests} identical questions within {args.spread * 1000:.0f} ms, "
+          f"stub latency {args.latency * 1000:.0f} ms")
+    for enabled in (False, True):
+        rag.COALESCE_ENABLED = enabled
+        retriever.embedding_cache.clear()
+        measure(f"threads, {'coalesced' if enabled else 'independent'}", threads)
+    asyncio.run(tasks())
+
+    for lock_dir, label in (("", "per process"), (tempfile.mkdtemp(), "across processes (lock dir)")):
+        processes(f"{args.processes} processes, {label}", lock_dir)
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Prompt tokens for SQL generation: the old context (top-10 retrieved docs
+joined) vs context_builder.build_context(), over the training questions.
+
+Each question is held out: examples with the same question text are removed
+from the corpus before retrieval. Without an LLM in the loop, accuracy is
+approximated by two checks on the context itself:
+
+  schema coverage   every table the reference SQL reads has its schema chunk
+  example support   an example with the same SQL template as the reference
+                    (slot values aside) is in the context
+
+Retrieval is BM25 only by default; --openai adds real embeddings (hybrid
+ranking, MMR over cosine similarity), which needs an API key.
+
+Usage:
+    python -m benchmarks.bench_context --budget 450 [--openai]
+"""
+import argparse
+import statistics
+
+import numpy as np
+
+import build_index
+import rag
+from context_builder import build_context, message_tokens, schema_table
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from local_sql import sql_template, template_key
+from sql_validator import analyze_sql
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=int, default=450)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--old-k", type=int, default=10)
+    parser.add_argument("--openai", action="store_true")
+    args = parser.parse_args()
+
+    docs = build_index.load_docs()
+    texts = [d["text"] for d in docs]
+    schema_docs = [t for d, t in zip(docs, texts) if d["id"].startswith("schema-")]
+    vectors = np.array([build_index.embed(t) for t in texts], dtype="float32") if args.openai else None
+    examples = [(i, t.split("\nSQL: ", 1)) for i, t in enumerate(texts) if t.startswith("Q: ")]
+
+    rows = []
+    for i, (question, ref_sql) in examples:
+        question = question[3:]
+        held_out = {j for j, (q, _) in examples if q[3:] == question}
+        keep = [j for j in range(len(texts)) if j not in held_out]
+        lexical = BM25Index.build({j: {"text": texts[j]} for j in keep})
+        ranking = lexical.search(question, len(keep))[0].tolist()
+        ranking += [j for j in keep if j not in set(ranking)]
+        if vectors is not None:
+            q_vec = np.array(build_index.embed(question), dtype="float32")
+            dense = sorted(keep, key=lambda j: float(np.linalg.norm(vectors[j] - q_vec)))
+            ranking = reciprocal_rank_fusion([dense, ranking])
+
+        old_docs = [texts[j] for j in ranking[:args.old_k]]
+        cand = ranking[:args.candidates]
+        new_docs, stats = build_context(question, [texts[j] for j in cand], schema_docs, budget=args.budget,
+                                        vectors=vectors[cand] if vectors is not None else None)
+
+        need = analyze_sql(ref_sql).tables
+        ref_key = template_key(*sql_template(ref_sql))
+        row = {}
+        for name, ctx in [("old", old_docs), ("new", new_docs)]:
+            tables = {schema_table(t) for t in ctx}
+            keys = {template_key(*sql_template(t.split("\nSQL: ", 1)[1])) for t in ctx if t.startswith("Q: ")}
+            row[name] = {
+                "tokens": message_tokens(rag.build_sql_messages(question, ctx)),
+                "coverage": need <= tables,
+                "support": ref_key in keys,
+            }
+        rows.append(row)
+
+    print(f"{len(rows)} held-out questions, budget {args.budget}, {'hybrid' if args.openai else 'BM25'} retrieval\n")
+    print(f"{'context':<8} {'mean tok':>9} {'p50 tok':>8} {'max tok':>8} {'schema cov':>11} {'example sup':>12}")
+    for name in ("old", "new"):
+        tokens = [r[name]["tokens"] for r in rows]
+        print(f"{name:<8} {statistics.mean(tokens):>9.0f} {statistics.median(tokens):>8.0f} {max(tokens):>8} "
+              f"{sum(r[name]['coverage'] for r in rows) / len(rows):>11.1%} "
+              f"{sum(r[name]['support'] for r in rows) / len(rows):>12.1%}")
+    old = statistics.mean(r["old"]["tokens"] for r in rows)
+    new = statistics.mean(r["new"]["tokens"] for r in rows)
+    print(f"\nprompt tokens: {1 - new / old:.1%} fewer on average")
+
+
+if __name__ == "__main__":
+    main()
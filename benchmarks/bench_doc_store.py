@@ -0,0 +1,105 @@
+"""
+Docs pickle (the old faiss_docs.pkl) vs. the memory-mapped doc store
+(doc_store.py) as the corpus grows.
+
+For each --sizes corpus of example docs, both formats are written, then each
+is opened in a fresh process that reports: open time, growth of the process's
+private memory (RssAnon) after the open, time per lookup of --k random
+FAISS ids (the retrieve() access pattern, --lookups rounds), and growth of
+private and of file-backed memory (RssFile: page-cache pages of the mapped
+store, shared between processes and reclaimable) after the lookups. File
+sizes and write times are reported too. Linux only (/proc/self/status).
+
+Usage:
+    python -m benchmarks.bench_doc_store --sizes 100000 1000000 3000000 --k 10
+"""
+import argparse
+import json
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import doc_store
+
+WORDS = ["employees", "salary", "department", "project", "address", "manager", "hired", "country", "city",
+         "average", "count", "list", "each", "highest", "role", "title", "between", "after", "before"]
+
+CHILD = """
+import json, os, random, sys, time
+fmt, path, n, k, rounds = sys.argv[1], sys.argv[2], *map(int, sys.argv[3:6])
+import pickle, numpy
+from doc_store import DocStore
+def rss():
+    fields = dict(line.split(":") for line in open("/proc/self/status"))
+    return [int(fields[f].split()[0]) / 1024 for f in ("RssAnon", "RssFile")]
+before = rss()
+t = time.perf_counter()
+if fmt == "pickle":
+    with open(path, "rb") as f:
+        docs = pickle.load(f)
+else:
+    docs = DocStore.open(path)
+opened = time.perf_counter() - t
+after_open = rss()
+rng = random.Random(0)
+t = time.perf_counter()
+for _ in range(rounds):
+    texts = [docs.text(i) if fmt == "store" else docs[i]["text"] for i in (rng.randrange(n) for _ in range(k))]
+lookup = (time.perf_counter() - t) / rounds
+after = rss()
+print(json.dumps({"open": opened, "heap_open": after_open[0] - before[0], "lookup": lookup,
+                  "heap_lookups": after[0] - before[0], "mapped_lookups": after[1] - before[1]}))
+"""
+
+
+def make_docs(n, seed=0):
+    rng = random.Random(seed)
+    return {i: {"id": f"example-{i}", "type": "example", "tables": ["employees"],
+                "text": f"Q: {' '.join(rng.choice(WORDS) for _ in range(8))} {i}?\n"
+                        f"SQL: SELECT * FROM employees WHERE employee_id = {i};"}
+            for i in range(n)}
+
+
+def measure(fmt, path, n, args):
+    out = subprocess.run([sys.executable, "-c", CHILD, fmt, path, str(n), str(args.k), str(args.lookups)],
+                         capture_output=True, text=True, check=True,
+                         env={**os.environ, "PYTHONPATH": os.path.dirname(os.path.dirname(os.path.abspath(__file__)))})
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 3_000_000])
+    parser.add_argument("--k", type=int, default=10, help="docs looked up per retrieval")
+    parser.add_argument("--lookups", type=int, default=1000, help="retrievals timed per run")
+    args = parser.parse_args()
+
+    print(f"{'docs':>9} {'format':<7} {'file MiB':>9} {'write s':>8} {'open ms':>9} {'heap open MiB':>14} "
+          f"{'lookup us':>10} {'heap after MiB':>15} {'mapped after MiB':>17}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in args.sizes:
+            docs = make_docs(n)
+            paths = {"pickle": os.path.join(workdir, "docs.pkl"), "store": os.path.join(workdir, "docs.bin")}
+            writes = {}
+            t = time.perf_counter()
+            with open(paths["pickle"], "wb") as f:
+                pickle.dump(docs, f)
+            writes["pickle"] = time.perf_counter() - t
+            t = time.perf_counter()
+            doc_store.write(paths["store"], docs)
+            writes["store"] = time.perf_counter() - t
+            del docs
+
+            for fmt, path in paths.items():
+                r = measure(fmt, path, n, args)
+                print(f"{n:>9} {fmt:<7} {os.path.getsize(path) / 2**20:>9.1f} {writes[fmt]:>8.2f} "
+                      f"{r['open'] * 1000:>9.1f} {r['heap_open']:>14.1f} {r['lookup'] * 1e6:>10.1f} "
+                      f"{r['heap_lookups']:>15.1f} {r['mapped_lookups']:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
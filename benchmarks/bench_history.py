@@ -0,0 +1,172 @@
+"""
+Chat persistence: insert throughput and history fetch latency, old layout
+vs. new.
+
+Inserts: --exchanges question/answer pairs written the old way (conversation
+lookup, then user and assistant message in their own commits, meta as the
+full JSON result) vs. one transaction per exchange with capped, compressed
+meta (chat_history.exchange_rows + models.MessageMeta). Reports exchanges
+per second and bytes of meta stored.
+
+History: --messages messages over --conversations conversations, bulk
+loaded into a table without indexes (the old schema, read the way the lazy
+Conversation.messages relationship does: every message of a conversation)
+and into the indexed table read a keyset page at a time
+(chat_history.message_page). Runs on SQLite files in a temp dir.
+
+Usage:
+    python -m benchmarks.bench_history --exchanges 2000 --messages 1000000 --conversations 10000
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text, create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from chat_history import exchange_rows, message_page
+from models import db
+
+TABLES = ("user", "conversation", "message")
+
+
+def result_meta(rows):
+    result = [{"employee_id": i, "first_name": f"Name{i}", "last_name": f"Surname{i % 97}",
+               "department": ["HR", "Sales", "IT", "Finance"][i % 4], "salary": 40000 + 37 * i} for i in range(rows)]
+    return {"sql_meta": {"query": "SELECT employee_id, first_name, last_name, department, salary FROM employees",
+                         "result": result, "row_count": rows, "truncated": False,
+                         "summary": {"row_count": rows, "columns": {}}}, "cache": None}
+
+
+def old_tables():
+    metadata = MetaData()
+    conversation = Table("conversation", metadata, Column("id", Integer, primary_key=True),
+                         Column("user_id", Integer), Column("created_at", DateTime))
+    message = Table("message", metadata, Column("id", Integer, primary_key=True),
+                    Column("conversation_id", Integer), Column("sender", String(50)), Column("text", Text),
+                    Column("meta", Text), Column("created_at", DateTime))
+    return metadata, conversation, message
+
+
+def new_engine(path):
+    engine = create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine, tables=[db.metadata.tables[t] for t in TABLES])
+    return engine
+
+
+def bench_inserts(workdir, exchanges, meta):
+    metadata, old_conversation, old_message = old_tables()
+    old = create_engine(f"sqlite:///{os.path.join(workdir, 'old_insert.sqlite')}")
+    metadata.create_all(old)
+    with old.begin() as conn:
+        conn.execute(insert(old_conversation).values(id=1, user_id=1))
+    start = time.perf_counter()
+    for i in range(exchanges):
+        with old.begin() as conn:
+            conn.execute(select(old_conversation.c.id).where(old_conversation.c.id == 1)).scalar()
+        with old.begin() as conn:
+            conn.execute(insert(old_message).values(conversation_id=1, sender="user", text=f"question {i}"))
+        with old.begin() as conn:
+            conn.execute(insert(old_message).values(conversation_id=1, sender="assistant", text="answer",
+                                                    meta=json.dumps(meta)))
+    old_rate = exchanges / (time.perf_counter() - start)
+
+    new = new_engine(os.path.join(workdir, "new_insert.sqlite"))
+    with Session(new) as session:
+        session.execute(insert(db.metadata.tables["conversation"]).values(id=1, user_id=1))
+        session.commit()
+        start = time.perf_counter()
+        for i in range(exchanges):
+            session.execute(select(db.metadata.tables["conversation"].c.id)).first()
+            session.execute(insert(db.metadata.tables["message"]), exchange_rows(1, f"question {i}", "answer", meta))
+            session.commit()
+        new_rate = exchanges / (time.perf_counter() - start)
+
+    def meta_bytes(engine):
+        with engine.connect() as conn:
+            return conn.exec_driver_sql("SELECT SUM(LENGTH(meta)) FROM message").scalar() or 0
+
+    print(f"inserts ({exchanges} exchanges, {len(meta['sql_meta']['result'])}-row results):")
+    print(f"  old: 3 commits per exchange, full meta   {old_rate:8.0f} exchanges/s  "
+          f"meta {meta_bytes(old) / exchanges / 1024:7.1f} KiB per reply")
+    print(f"  new: 1 commit, capped compressed meta    {new_rate:8.0f} exchanges/s  "
+          f"meta {meta_bytes(new) / exchanges / 1024:7.1f} KiB per reply")
+
+
+def bulk_load(path, messages, conversations, indexed):
+    """Fill message via sqlite3 directly (fast); conversation ids round-robin, as interleaved chats are."""
+    if indexed:
+        new_engine(path).dispose()
+    else:
+        metadata, _, _ = old_tables()
+        engine = create_engine(f"sqlite:///{path}")
+        metadata.create_all(engine)
+        engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO conversation (id, user_id) VALUES (?, ?)",
+                     ((c, c % 1000) for c in range(1, conversations + 1)))
+    meta = json.dumps({"sql_meta": {"query": "SELECT COUNT(*) AS cnt FROM employees", "result": [{"cnt": 42}],
+                                    "row_count": 1}})
+    conn.executemany(
+        "INSERT INTO message (conversation_id, sender, text, meta, created_at) VALUES (?, ?, ?, ?, ?)",
+        ((i % conversations + 1, "assistant" if i % 2 else "user", f"message {i}", meta if i % 2 else None,
+          "2025-06-30 12:00:00") for i in range(messages)))
+    conn.commit()
+    conn.close()
+
+
+def bench_history(workdir, messages, conversations, samples):
+    old_path, new_path = os.path.join(workdir, "old_history.sqlite"), os.path.join(workdir, "new_history.sqlite")
+    start = time.perf_counter()
+    bulk_load(old_path, messages, conversations, indexed=False)
+    bulk_load(new_path, messages, conversations, indexed=True)
+    print(f"\nhistory ({messages} messages in {conversations} conversations, loaded in "
+          f"{time.perf_counter() - start:.1f} s):")
+
+    rng = random.Random(0)
+    picks = [rng.randint(1, conversations) for _ in range(samples)]
+    _, _, old_message = old_tables()
+    old = create_engine(f"sqlite:///{old_path}")
+    with old.connect() as conn:
+        timings = []
+        for cid in picks:
+            t = time.perf_counter()
+            conn.execute(select(old_message).where(old_message.c.conversation_id == cid)).all()
+            timings.append(time.perf_counter() - t)
+    print(f"  old: all messages, no index           p50 {statistics.median(timings) * 1000:8.2f} ms")
+
+    new = create_engine(f"sqlite:///{new_path}")
+    with Session(new) as session:
+        first, deep = [], []
+        for cid in picks:
+            t = time.perf_counter()
+            page = message_page(session, cid, limit=50)
+            first.append(time.perf_counter() - t)
+            t = time.perf_counter()
+            message_page(session, cid, before=page["next_before"], limit=50, with_meta=True)
+            deep.append(time.perf_counter() - t)
+    print(f"  new: newest page of 50, indexed       p50 {statistics.median(first) * 1000:8.2f} ms")
+    print(f"  new: next page of 50 with meta        p50 {statistics.median(deep) * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exchanges", type=int, default=2000)
+    parser.add_argument("--result-rows", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--conversations", type=int, default=10_000)
+    parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bench_inserts(workdir, args.exchanges, result_meta(args.result_rows))
+        bench_history(workdir, args.messages, args.conversations, args.samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Retrieval latency per mode (dense / lexical / hybrid) over the real schema +
+training docs, and how often each mode puts a question's own example in the
+top k.
+
+Dense vectors come from the stub embedding, so the dense and hybrid recall
+numbers only mean something with --openai (real embeddings, needs a key);
+latency excludes the embedding call either way.
+
+Usage:
+    python -m benchmarks.bench_hybrid --k 5 [--openai]
+"""
+import argparse
+import statistics
+import time
+
+import faiss
+import numpy as np
+
+import build_index
+from benchmarks.stub_llm import stub_embedding
+from lexical_index import BM25Index, reciprocal_rank_fusion
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=4, help="per-ranking candidates per requested doc")
+    parser.add_argument("--openai", action="store_true", help="embed with OpenAI instead of the stub")
+    args = parser.parse_args()
+
+    docs = build_index.load_docs()
+    by_id = {i: d for i, d in enumerate(docs)}
+    embed = build_index.embed if args.openai else stub_embedding
+    vectors = np.array([embed(d["text"]) for d in docs], dtype="float32")
+    index = faiss.IndexIDMap(faiss.IndexFlatL2(vectors.shape[1]))
+    index.add_with_ids(vectors, np.arange(len(docs), dtype="int64"))
+
+    start = time.perf_counter()
+    lexical = BM25Index.build(by_id)
+    print(f"{len(docs)} docs, BM25 built in {(time.perf_counter() - start) * 1000:.1f} ms, "
+          f"{len(lexical.terms)} terms, {len(lexical.postings)} postings")
+
+    questions = [(i, d["text"].split("\n", 1)[0][3:]) for i, d in by_id.items() if d["id"].startswith("example-")]
+    q_vecs = {i: np.array([embed(q)], dtype="float32") for i, q in questions}
+    n = args.k * args.candidates
+
+    def dense(i, q):
+        return [int(x) for x in index.search(q_vecs[i], n)[1][0]]
+
+    def lex(i, q):
+        return lexical.search(q, n)[0].tolist()
+
+    def hybrid(i, q):
+        return reciprocal_rank_fusion([dense(i, q), lex(i, q)])
+
+    print(f"\n{'mode':<8} {'p50 us':>8} {'p99 us':>8} {'recall@' + str(args.k):>10}")
+    for name, fn in [("dense", dense), ("lexical", lex), ("hybrid", hybrid)]:
+        samples, hits = [], 0
+        for i, q in questions:
+            ranking, t = timed(lambda: fn(i, q), 5)
+            samples.extend(t)
+            hits += i in ranking[:args.k]
+        samples.sort()
+        print(f"{name:<8} {statistics.median(samples) * 1e6:>8.1f} {samples[int(len(samples) * 0.99)] * 1e6:>8.1f} "
+              f"{hits / len(questions):>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+LLM client resilience: tail latency with hedging, and behaviour during an
+outage with the circuit breaker, raw OpenAI client vs. llm_client.LLMClient.
+
+Tail: --calls chat calls from --concurrency threads against the stub with
+--latency per request, of which --slow-rate take --slow-latency instead.
+The raw client waits out every slow request; LLMClient sends a duplicate
+once a call runs past the recent p95 (after a warm-up of 50 calls to fill
+the latency window). Reports p50 / p95 / p99 / max and requests sent.
+
+Outage: every request fails with a 500. The raw client (SDK defaults:
+2 retries with backoff) pays the retries on every call; LLMClient opens the
+circuit after LLM_BREAKER_FAILURES failed calls and fails the rest fast, so
+callers can fall back. Reports time per call and requests sent.
+
+Usage:
+    python -m benchmarks.bench_llm_client --calls 400 --concurrency 8 --slow-rate 0.03 --outage-calls 50
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import OpenAI
+
+from benchmarks.stub_llm import StubLLMServer
+from llm_client import LLMClient
+
+MESSAGES = [{"role": "system", "content": "You are an expert MySQL assistant."},
+            {"role": "user", "content": "How many employees are in each department?"}]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def timed_calls(fn, n, concurrency):
+    def one(_):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(one, range(n)))
+
+
+def bench_tail(args):
+    stub = StubLLMServer(latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency).start()
+    raw = OpenAI(base_url=stub.base_url, api_key="stub")
+    llm = LLMClient(OpenAI(base_url=stub.base_url, api_key="stub"))
+    for _ in range(50):
+        llm.chat(MESSAGES, "gpt-test", purpose="bench")
+
+    print(f"tail: {args.calls} calls, {args.concurrency} threads, {args.latency * 1000:.0f} ms per request, "
+          f"{args.slow_rate:.0%} take {args.slow_latency * 1000:.0f} ms")
+    for name, fn in (("raw client", lambda: raw.chat.completions.create(model="gpt-test", messages=MESSAGES)),
+                     ("LLMClient, hedged", lambda: llm.chat(MESSAGES, "gpt-test", purpose="bench"))):
+        before = stub.calls["chat"]
+        latencies = timed_calls(fn, args.calls, args.concurrency)
+        time.sleep(args.slow_latency)  # let abandoned requests land before counting
+        print(f"  {name:<20} p50 {percentile(latencies, 50) * 1000:6.0f} ms  p95 "
+              f"{percentile(latencies, 95) * 1000:6.0f} ms  p99 {percentile(latencies, 99) * 1000:6.0f} ms  "
+              f"max {max(latencies) * 1000:6.0f} ms  requests {stub.calls['chat'] - before:5d}")
+    stub.stop()
+
+
+def bench_outage(args):
+    stub = StubLLMServer(latency=args.latency, error_rate=1.0).start()
+    raw = OpenAI(base_url=stub.base_url, api_key="stub")
+    llm = LLMClient(OpenAI(base_url=stub.base_url, api_key="stub"))
+
+    print(f"\noutage: {args.outage_calls} calls, every request fails")
+    for name, fn in (("raw client", lambda: raw.chat.completions.create(model="gpt-test", messages=MESSAGES)),
+                     ("LLMClient, breaker", lambda: llm.chat(MESSAGES, "gpt-test", purpose="bench"))):
+        before = stub.calls["errors"]
+        latencies = []
+        for _ in range(args.outage_calls):
+            start = time.perf_counter()
+            try:
+                fn()
+            except Exception:  # LLMUnavailable, or the raw client's openai errors
+                pass
+            latencies.append(time.perf_counter() - start)
+        print(f"  {name:<20} mean {statistics.mean(latencies) * 1000:7.0f} ms per call  total "
+              f"{sum(latencies):6.1f} s  requests {stub.calls['errors'] - before:5d}")
+    stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub seconds per request")
+    parser.add_argument("--slow-rate", type=float, default=0.03, help="share of requests that are slow")
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--outage-calls", type=int, default=50)
+    args = parser.parse_args()
+    bench_tail(args)
+    bench_outage(args)
+
+
+if __name__ == "__main__":
+    main()
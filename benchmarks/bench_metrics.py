@@ -0,0 +1,87 @@
+"""
+Cost of the observability added to the pipeline, per request.
+
+Compares the old per-request prints of the full SQL prompt (written to
+/dev/null, so terminal speed does not count) with the logging that replaced
+them at INFO (the default) and DEBUG level, and times metrics.span() with
+metrics on, off, and inside a sampled trace.
+
+Usage:
+    python -m benchmarks.bench_metrics --rounds 20000
+"""
+import argparse
+import io
+import logging
+import os
+import time
+from contextlib import redirect_stdout
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+import metrics  # noqa: E402
+import rag  # noqa: E402
+
+STAGES = ("embed", "faiss_search", "lexical_search", "context", "sql_generation", "db_execute", "summarize")
+
+
+def per_call(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    docs = [f"Table Schema: t{i} (" + ", ".join(f"col_{j} INT" for j in range(12)) + ")" for i in range(8)]
+    messages = rag.build_sql_messages("average salary per department", docs)
+    stats = {"schema_tokens": 300, "schema_docs": 8, "example_tokens": 120, "examples": 4, "examples_dropped": 2}
+
+    def old_prints():
+        print(f"🧮 Prompt tokens: {rag.message_tokens(messages)} (schema {stats['schema_tokens']} ...)")
+        print("❗ Prompt to OpenAI:")
+        for m in messages:
+            print(f"[{m['role']}]: {m['content']}\n")
+
+    sink = open(os.devnull, "w")
+    with redirect_stdout(sink):
+        printed = per_call(old_prints, args.rounds)
+    rag.logger.addHandler(logging.StreamHandler(io.StringIO()))
+    rag.logger.setLevel(logging.INFO)
+    info = per_call(lambda: rag.log_prompt_tokens(messages, stats), args.rounds)
+    rag.logger.setLevel(logging.DEBUG)
+    debug = per_call(lambda: rag.log_prompt_tokens(messages, stats), args.rounds)
+
+    print("prompt logging, per SQL generation:")
+    print(f"  old prints:       {printed:8.2f} us")
+    print(f"  logging at INFO:  {info:8.2f} us")
+    print(f"  logging at DEBUG: {debug:8.2f} us")
+
+    def request_spans():
+        for stage in STAGES:
+            with metrics.span(stage):
+                pass
+
+    def traced_request():
+        with metrics.trace("bench"):
+            request_spans()
+
+    enabled = per_call(request_spans, args.rounds)
+    metrics.METRICS_ENABLED = False
+    disabled = per_call(request_spans, args.rounds)
+    metrics.METRICS_ENABLED = True
+    metrics.TRACE_SAMPLE_RATE = 1.0
+    metrics.logger.disabled = True
+    traced = per_call(traced_request, args.rounds)
+
+    print(f"\n{len(STAGES)} spans per request:")
+    print(f"  metrics off:      {disabled:8.2f} us")
+    print(f"  metrics on:       {enabled:8.2f} us")
+    print(f"  sampled trace:    {traced:8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
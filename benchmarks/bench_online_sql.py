@@ -0,0 +1,160 @@
+"""
+Online training of the local SQL model (train_model.OnlineSqlTrainer) vs.
+the full retrain it replaces, as the training set grows.
+
+Examples are synthesized from the --data files: the slot values a question
+names (department, country, ...) are swapped for others from the benchmark
+fixtures, in the question and the SQL, and the question gets filler words,
+a dropped word or lower case at random. They are fed one at a time:
+
+  online   OnlineSqlTrainer.add(): append to the log; every
+           --snapshot-every examples (and at each --checkpoints size) the
+           batch is learned with partial_fit() and a snapshot published,
+           which a LocalSqlGenerator loads the way the server picks it up
+  retrain  what train_sql_model(new_example) used to do per example: rewrite
+           the whole JSON array, then fit_sql_model() on all of it; timed
+           once per checkpoint
+
+At each checkpoint: update latency (online: p50 / p99 of add() since the
+previous checkpoint, and the mean time of an add() that learns and publishes
+a snapshot; retrain: one rewrite + fit), and on --test held-out questions
+the top-1 template accuracy, the share answered locally at --threshold and
+the accuracy of those answers (canonical SQL).
+
+Usage:
+    python -m benchmarks.bench_online_sql --checkpoints 1000 10000 100000 --snapshot-every 100 --test 2000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import warnings
+
+from benchmarks.fixtures import CITIES, COUNTRIES, DEPARTMENTS, PROJECTS, STATES
+from local_sql import LocalSqlGenerator, fill_template, sql_template, template_key
+from sql_validator import canonicalize_sql
+from train_model import OnlineSqlTrainer, fit_sql_model
+
+VALUES = {"department": DEPARTMENTS, "country": COUNTRIES, "state": STATES, "city": CITIES, "project_name": PROJECTS}
+FILLERS = ["please", "can you", "show me", "I need", "quickly", "tell me", "for the report", "now"]
+
+
+def bases(rows):
+    """(question, sql, template, slots, swappable) per row; swappable when the question names every slot value."""
+    out = []
+    for row in rows:
+        template, slots = sql_template(row["sql"])
+        swappable = bool(slots) and all(column in VALUES and value.lower() in row["question"].lower()
+                                        for _, _, column, value in slots)
+        out.append((row["question"], row["sql"], template, slots, swappable))
+    return out
+
+
+def synthesize(bases, n, seed):
+    rng = random.Random(seed)
+    examples = []
+    for _ in range(n):
+        question, sql, template, slots, swappable = rng.choice(bases)
+        named = []
+        if swappable:
+            values = {}
+            for _, _, column, value in slots:
+                new = rng.choice(VALUES[column])
+                question = re.sub(re.escape(value), new, question, count=1, flags=re.I)
+                values.setdefault(column, []).append(new)
+                named.append(new.lower())
+            sql = fill_template(template, slots, values)
+        words = question.split()
+        droppable = [i for i, w in enumerate(words) if not any(w.lower() in v for v in named)]
+        if len(droppable) > 3 and rng.random() < 0.2:
+            del words[rng.choice(droppable)]
+        if rng.random() < 0.3:
+            words.insert(0, rng.choice(FILLERS))
+        if rng.random() < 0.2:
+            words.append(rng.choice(FILLERS))
+        question = " ".join(words)
+        examples.append({"question": question.lower() if rng.random() < 0.3 else question, "sql": sql, "answer": ""})
+    return examples
+
+
+def evaluate(gen, test):
+    top1 = hits = correct = 0
+    for row in test:
+        (sql, slots), _ = gen.predict(row["question"])
+        top1 += template_key(sql, slots) == template_key(*sql_template(row["sql"]))
+        answer = gen.generate(row["question"])
+        if answer is not None:
+            hits += 1
+            correct += canonicalize_sql(answer) == canonicalize_sql(row["sql"])
+    return top1 / len(test), hits / len(test), correct / hits if hits else 0.0
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def row(n, mode, p50, p99, snapshot, scores):
+    print(f"{n:>8} {mode:<8} {p50:>9.2f} {p99:>9.2f} {snapshot:>11.1f} {scores[0]:>9.1%} {scores[1]:>9.1%} "
+          f"{scores[2]:>9.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", nargs="+", default=["data/training_data.json", "data/training_data_100.json"])
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--test", type=int, default=2000, help="held-out questions")
+    parser.add_argument("--snapshot-every", type=int, default=100)
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--no-retrain", action="store_true", help="skip the full-retrain baseline")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    rows = [r for path in args.data for r in json.load(open(path)) if r.get("sql")]
+    pool = bases(rows)
+    stream = synthesize(pool, max(args.checkpoints), seed=0)
+    test = synthesize(pool, args.test, seed=1)
+    print(f"{len(rows)} seed questions ({sum(b[4] for b in pool)} with swappable slots), "
+          f"{len({template_key(t, s) for _, _, t, s, _ in pool})} templates, {len(test)} held out, "
+          f"threshold {args.threshold}\n")
+    print(f"{'examples':>8} {'mode':<8} {'p50 ms':>9} {'p99 ms':>9} {'snapshot ms':>11} {'top-1':>9} "
+          f"{'local':>9} {'accuracy':>9}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        snapshots = os.path.join(workdir, "online")
+        trainer = OnlineSqlTrainer(os.path.join(workdir, "log.jsonl"), snapshots,
+                                   data_path=os.path.join(workdir, "none.json"), snapshot_every=args.snapshot_every)
+        done = 0
+        for n in sorted(args.checkpoints):
+            latencies, snapshots_ms = [], []
+            for example in stream[done:n]:
+                start = time.perf_counter()
+                published = trainer.add([example])
+                latencies.append(time.perf_counter() - start)
+                if published is not None:
+                    snapshots_ms.append(latencies[-1] * 1000)
+            done = n
+            start = time.perf_counter()
+            trainer.publish()
+            snapshots_ms.append((time.perf_counter() - start) * 1000)
+            gen = LocalSqlGenerator(vec_path="missing", clf_path="missing", threshold=args.threshold,
+                                    snapshot_dir=snapshots)
+            row(n, "online", percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000,
+                sum(snapshots_ms) / len(snapshots_ms), evaluate(gen, test))
+
+            if args.no_retrain:
+                continue
+            start = time.perf_counter()
+            with open(os.path.join(workdir, "training_data.json"), "w", encoding="utf-8") as f:
+                json.dump(stream[:n], f, indent=2, ensure_ascii=False)
+            model = fit_sql_model([e["question"] for e in stream[:n]], [e["sql"] for e in stream[:n]])
+            retrain = (time.perf_counter() - start) * 1000
+            row(n, "retrain", retrain, retrain, retrain,
+                evaluate(LocalSqlGenerator(threshold=args.threshold, model=model), test))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Generated-SQL latency under concurrent load for different pool setups, on a
+seeded SQLite file standing in for MySQL.
+
+`--threads` workers each run rag.run_sql_query() in a loop (result cache off)
+while one writer thread inserts chat messages, as the Flask app does between
+questions:
+
+  shared     one bare create_engine() for both, cold (the old setup)
+  undersized query pool of 2 per worker, warmed up
+  registry   query pool sized to --threads, pre-pinged, warmed up; the
+             writer uses the separate app pool
+
+Opening a SQLite file takes microseconds where a MySQL connection needs a
+TCP + auth handshake, so every new connection sleeps `--connect-ms` first.
+Pool wait times come from db_engines.pool_stats(). A last run shows a
+runaway query being cut by SQL_MAX_EXECUTION_TIME_MS.
+
+Usage:
+    python -m benchmarks.bench_pool --threads 8 --queries 400 --connect-ms 20
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("EMBED_CACHE_DB", "")
+os.environ.setdefault("LOCAL_SQL", "0")
+
+from sqlalchemy import create_engine, delete, event, exc, insert, text  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+
+import db_engines  # noqa: E402
+import rag  # noqa: E402
+from benchmarks.fixtures import seed_database  # noqa: E402
+from models import Conversation, Message, User  # noqa: E402
+
+QUERIES = [
+    "SELECT department, AVG(salary) AS avg_salary FROM employees GROUP BY department",
+    "SELECT ea.city, COUNT(*) AS n FROM employees e JOIN employee_addresses ea "
+    "ON e.employee_id = ea.employee_id GROUP BY ea.city ORDER BY n DESC",
+    "SELECT ep.project_name, AVG(e.salary) FROM employees e JOIN employee_projects ep "
+    "ON e.employee_id = ep.employee_id GROUP BY ep.project_name",
+    "SELECT first_name, last_name, salary FROM employees WHERE salary > 140000 ORDER BY salary DESC",
+]
+RUNAWAY = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_load(threads, queries, write_engine, stop):
+    latencies, lock = [], threading.Lock()
+
+    def reader(worker):
+        for i in range(queries // threads):
+            start = time.perf_counter()
+            rag.run_sql_query(QUERIES[(worker + i) % len(QUERIES)])
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    def writer():
+        with write_engine.begin() as conn:
+            conn.execute(insert(User.__table__).values(id=1, username="bench"))
+            conn.execute(insert(Conversation.__table__).values(id=1, user_id=1))
+        while not stop.is_set():
+            with write_engine.begin() as conn:
+                conn.execute(insert(Message.__table__).values(conversation_id=1, sender="user", text="q"))
+            time.sleep(0.002)
+
+    w = threading.Thread(target=writer)
+    w.start()
+    start = time.perf_counter()
+    workers = [threading.Thread(target=reader, args=(n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    w.join()
+    return latencies, elapsed
+
+
+def scenario(name, uri, threads, queries):
+    db_engines.dispose_all()
+    rag._ENGINE = None
+    if name == "shared":
+        engine = create_engine(uri)
+        db_engines.register_engine("query", engine)
+        write_engine = engine
+    else:
+        db_engines.SQL_POOL_SIZE = 2 if name == "undersized" else threads
+        db_engines.SQL_MAX_OVERFLOW = 0 if name == "undersized" else 2
+        db_engines.warm_up()
+        write_engine = db_engines.get_engine("app")
+
+    latencies, elapsed = run_load(threads, queries, write_engine, threading.Event())
+    stats = db_engines.pool_stats()["query"]
+    ms = [x * 1000 for x in latencies]
+    print(f"{name:<11} {len(ms) / elapsed:6.0f} q/s  p50 {statistics.median(ms):7.2f} ms  "
+          f"p95 {percentile(ms, 0.95):7.2f} ms  p99 {percentile(ms, 0.99):7.2f} ms  "
+          f"wait avg {stats['wait_avg_ms']:6.2f} / max {stats['wait_max_ms']:6.2f} ms  "
+          f"connects {stats['connects']}")
+    with write_engine.begin() as conn:
+        for model in (Message, Conversation, User):
+            conn.execute(delete(model.__table__))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--employees", type=int, default=5000)
+    parser.add_argument("--connect-ms", type=float, default=20)
+    parser.add_argument("--time-limit-ms", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        uri = f"sqlite:///{os.path.join(workdir, 'bench.sqlite')}"
+        seed_database(uri, args.employees)
+        os.environ["SQLALCHEMY_DATABASE_URI"] = uri
+        rag.SQL_CACHE_ENABLED = False
+        event.listen(Engine, "connect", lambda dbapi_conn, record: time.sleep(args.connect_ms / 1000))
+
+        print(f"{args.threads} threads, {args.queries} queries, {args.employees} employees")
+        for name in ("shared", "undersized", "registry"):
+            scenario(name, uri, args.threads, args.queries)
+
+        db_engines.dispose_all()
+        db_engines.SQL_MAX_EXECUTION_TIME_MS = args.time_limit_ms
+        start = time.perf_counter()
+        try:
+            with db_engines.get_engine("query").connect() as conn:
+                conn.execute(text(RUNAWAY))
+            outcome = "finished"
+        except exc.OperationalError as e:
+            outcome = f"stopped ({e.orig})"
+        print(f"\nrunaway query, {args.time_limit_ms} ms limit: {outcome} "
+              f"after {(time.perf_counter() - start) * 1000:.0f} ms")
+        db_engines.dispose_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Per-query retrieval latency: reload-per-call (old retrieve()) vs. the
+process-wide Retriever.
+
+Embeddings are random vectors so the numbers only cover index/docs handling
+and the FAISS search, not the OpenAI round trip.
+
+Usage:
+    python -m benchmarks.bench_retriever --sizes 1000 100000 1000000 --dim 128
+"""
+import argparse
+import os
+import pickle
+import statistics
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+import doc_store
+from retriever import Retriever
+
+
+def make_corpus(workdir, n, dim):
+    rng = np.random.default_rng(0)
+    xb = rng.random((n, dim), dtype="float32")
+    index = faiss.IndexFlatL2(dim)
+    index.add(xb)
+    index_file = os.path.join(workdir, f"index_{n}.bin")
+    docs_file = os.path.join(workdir, f"docs_{n}.pkl")
+    faiss.write_index(index, index_file)
+    docs = [{"id": f"example-{i}", "text": f"Q: question {i}\nSQL: SELECT {i};"} for i in range(n)]
+    with open(docs_file, "wb") as f:  # the old retrieve() read a pickle
+        pickle.dump(docs, f)
+    store_file = os.path.join(workdir, f"docs_{n}.bin")
+    doc_store.write(store_file, docs)
+    return index_file, docs_file, store_file
+
+
+def reload_per_call(index_file, docs_file, q, k):
+    index = faiss.read_index(index_file)
+    with open(docs_file, "rb") as f:
+        docs = pickle.load(f)
+    D, I = index.search(q, k)
+    return [docs[i]["text"] for i in I[0]]
+
+
+def shared(retriever, q, k):
+    D, I, docs = retriever.search(q, k)
+    return [docs[i]["text"] for i in I[0]]
+
+
+def time_queries(fn, queries, k):
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q[None, :], k)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), statistics.quantiles(samples, n=100, method="inclusive")[98]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--mmap", action="store_true")
+    args = parser.parse_args()
+
+    queries = np.random.default_rng(1).random((args.queries, args.dim), dtype="float32")
+    print(f"{'vectors':>10} {'reload p50 ms':>14} {'reload p99 ms':>14} {'shared p50 ms':>14} {'shared p99 ms':>14}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in args.sizes:
+            index_file, docs_file, store_file = make_corpus(workdir, n, args.dim)
+            before = time_queries(lambda q, k: reload_per_call(index_file, docs_file, q, k), queries, args.k)
+
+            retriever = Retriever(index_file, store_file, os.path.join(workdir, "none.version"), mmap=args.mmap)
+            retriever.snapshot()  # load once, outside the timed loop
+            after = time_queries(lambda q, k: shared(retriever, q, k), queries, args.k)
+
+            print(f"{n:>10} {before[0]:>14.2f} {before[1]:>14.2f} {after[0]:>14.2f} {after[1]:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
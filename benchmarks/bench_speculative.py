@@ -0,0 +1,134 @@
+"""
+Speculative SQL generation vs. the serial generate -> validate -> repair loop.
+
+Every question of the training file goes through
+rag.generate_sql_with_openai() against a stub model that answers with the
+reference SQL, except that --invalid-rate of its answers name a table that
+does not exist (caught by validate_sql) and a repair prompt fixes the query
+only --repair-success of the time. Requests take --latency, --slow-rate of
+them --slow-latency. Modes:
+
+  serial       one candidate at temperature 0, one repair round trip if invalid
+  speculative  SQL_SPECULATIVE=1 with --fanout candidates, first valid wins
+  +explain     the same with SQL_EXPLAIN_CHECK=1 (EXPLAIN QUERY PLAN on the
+               seeded SQLite database before a candidate is accepted)
+
+Reports p50 / p95 / p99 latency per question, the validity rate (final SQL
+passes validate_sql and runs on the seeded database) and chat requests per
+question (the cost of the fan-out).
+
+Usage:
+    python -m benchmarks.bench_speculative --data data/training_data.json --fanout 3 --concurrency 4 --rounds 5
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import OpenAI
+from sqlalchemy import create_engine, text
+
+from benchmarks.fixtures import add_mysql_functions, use_local_backends
+from benchmarks.stub_llm import StubLLMServer
+
+# Broken answers misspell the table name.
+TABLE, TYPO = "employees", "employes"
+
+
+class FlakySqlStub(StubLLMServer):
+    """Answers with the reference SQL, some of it broken; repairs succeed some of the time."""
+
+    def __init__(self, references, invalid_rate, repair_success, **kwargs):
+        super().__init__(**kwargs)
+        self.references, self.invalid_rate, self.repair_success = references, invalid_rate, repair_success
+        self._reply_rng, self._reply_lock = random.Random(1), threading.Lock()
+
+    def _roll(self, p):
+        with self._reply_lock:
+            return self._reply_rng.random() < p
+
+    def chat_reply(self, messages, model=None):
+        if messages[0]["content"].startswith("You are an expert MySQL assistant"):
+            sql = self.references[messages[-1]["content"]]
+            return sql.replace(TABLE, TYPO, 1) if self._roll(self.invalid_rate) else sql
+        if messages[0]["content"].startswith("Fix this SQL query"):
+            sql = messages[-1]["content"]
+            return sql.replace(TYPO, TABLE) if self._roll(self.repair_success) else sql
+        return self.answer
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def runs_on(engine, sql):
+    from sql_validator import validate_sql
+    if not validate_sql(sql)[0]:
+        return False
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(sql)).fetchall()
+    except Exception:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default="data/training_data.json")
+    parser.add_argument("--fanout", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=5, help="passes over the questions per mode")
+    parser.add_argument("--invalid-rate", type=float, default=0.2, help="share of generations that fail validation")
+    parser.add_argument("--repair-success", type=float, default=0.8, help="share of repairs that fix the query")
+    parser.add_argument("--latency", type=float, default=0.1, help="stub seconds per request")
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    rows = [r for r in json.load(open(args.data)) if r.get("sql")]
+    references = {r["question"]: r["sql"] for r in rows}
+    stub = FlakySqlStub(references, args.invalid_rate, args.repair_success, latency=args.latency,
+                        slow_rate=args.slow_rate, slow_latency=args.slow_latency).start()
+    workdir = tempfile.mkdtemp()
+    use_local_backends(workdir, stub, ANSWER_CACHE="0", LOG_LEVEL="WARNING")
+
+    import rag
+    from llm_client import LLMClient
+
+    engine = add_mysql_functions(create_engine(os.environ["SQLALCHEMY_DATABASE_URI"]))
+    rag._ENGINE = engine
+    context = ([], None, [])
+    print(f"{len(references)} questions x {args.rounds}, {args.concurrency} threads, {args.invalid_rate:.0%} invalid generations, "
+          f"{args.repair_success:.0%} repairs succeed, {args.latency * 1000:.0f} ms per request "
+          f"({args.slow_rate:.0%} take {args.slow_latency * 1000:.0f} ms)")
+
+    for label, speculative, explain in (("serial", False, False), ("speculative", True, False),
+                                        ("+explain", True, True)):
+        rag.llm = LLMClient(OpenAI(base_url=stub.base_url, api_key="stub"))
+        rag.SQL_SPECULATIVE, rag.SQL_SPECULATIVE_FANOUT, rag.SQL_EXPLAIN_CHECK = speculative, args.fanout, explain
+
+        def one(question):
+            start = time.perf_counter()
+            sql = rag.generate_sql_with_openai(question, context)
+            return time.perf_counter() - start, runs_on(engine, sql)
+
+        before = stub.calls["chat"]
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            results = list(pool.map(one, list(references) * args.rounds))
+        time.sleep(args.slow_latency)  # let abandoned candidates land before counting
+        latencies = [r[0] for r in results]
+        print(f"  {label:<12} p50 {percentile(latencies, 50) * 1000:6.0f} ms  p95 "
+              f"{percentile(latencies, 95) * 1000:6.0f} ms  p99 {percentile(latencies, 99) * 1000:6.0f} ms  "
+              f"valid {sum(r[1] for r in results) / len(results):6.1%}  "
+              f"requests/question {(stub.calls['chat'] - before) / len(results):4.2f}")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Startup under gunicorn: time until the workers serve warm requests,
+first-question latency and per-worker memory, lazy loading vs. pre-fork
+warm-up.
+
+Both runs serve app:app with --workers gthread workers against the stub
+OpenAI server, a seeded SQLite database, a --docs example index (random
+embeddings, BM25 index published next to it) and the trained local SQL
+model:
+
+  lazy     no config file: each worker imports the app itself and loads the
+           index, docs and model on its first question.
+  warm-up  gunicorn.conf.py: the app is imported and warmed up once in the
+           master, then the workers are forked from it.
+
+Reports the `import app` time, seconds until the port accepts and until
+every worker reports ready on /ready, question latencies (first, median,
+slowest; new connection each, so every worker gets some), and memory per
+worker after the questions: RSS, and PSS (shared pages split between the
+processes mapping them) from /proc/<pid>/smaps_rollup. Linux only.
+
+Usage:
+    python -m benchmarks.bench_startup --workers 4 --docs 200000 --questions 16
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import faiss
+import numpy as np
+
+import doc_store
+from benchmarks.fixtures import use_local_backends
+from benchmarks.stub_llm import EMBED_DIM, StubLLMServer
+from lexical_index import BM25Index
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORDS = ["employees", "salary", "department", "project", "address", "manager", "hired", "country", "city",
+         "average", "count", "list", "each", "highest", "role", "title", "between", "after", "before"]
+
+
+def build_corpus(workdir, n_docs, seed=0):
+    """Index, doc store and BM25 index in workdir/data, where retriever.py looks for them."""
+    rng = random.Random(seed)
+    data = os.path.join(workdir, "data")
+    os.makedirs(data, exist_ok=True)
+    docs = {}
+    for i in range(n_docs):
+        words = " ".join(rng.choice(WORDS) for _ in range(8))
+        docs[i] = {"id": f"example-{i}", "text": f"Q: {words} {i}?\nSQL: SELECT * FROM employees WHERE employee_id = {i};"}
+    embeddings = np.random.default_rng(seed).random((n_docs, EMBED_DIM), dtype="float32")
+    index = faiss.IndexIDMap(faiss.IndexFlatL2(EMBED_DIM))
+    index.add_with_ids(embeddings, np.arange(n_docs, dtype="int64"))
+    faiss.write_index(index, os.path.join(data, "faiss_index.bin"))
+    doc_store.write(os.path.join(data, "faiss_docs.bin"), docs)
+    BM25Index.build(docs).save(os.path.join(data, "bm25_index.npz"))
+    # local_sql.py reads the classifier from models/ relative to the working directory.
+    os.symlink(os.path.join(REPO, "models"), os.path.join(workdir, "models"))
+
+
+def import_time(workdir, env):
+    code = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env, capture_output=True, text=True,
+                         check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def memory(pid):
+    """(RSS, PSS) in MiB."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0]] = int(parts[1]) / 1024
+    return values["Rss:"], values["Pss:"]
+
+
+def workers_of(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def get_json(opener, url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data, {"Content-Type": "application/json"})
+    try:
+        with opener.open(request, timeout=120) as resp:
+            return resp.status, json.load(resp)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def run(label, config, args, workdir, env):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    log = open(os.path.join(workdir, f"gunicorn-{label}.log"), "w")
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", config, "--workers", str(args.workers), "--worker-class", "gthread",
+         "--threads", "4", "--bind", f"127.0.0.1:{port}", "--pythonpath", REPO, "app:app"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError(f"gunicorn exited, see {log.name}")
+                time.sleep(0.02)
+        listening = time.perf_counter() - start
+
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        ready, ready_at = set(), None
+        if label == "warm-up":
+            while len(ready) < args.workers:
+                status, body = get_json(opener, f"{base}/ready")
+                if status == 200:
+                    ready.add(body["pid"])
+                else:
+                    time.sleep(0.02)
+            ready_at = time.perf_counter() - start
+
+        get_json(opener, f"{base}/api/register", {"username": f"bench-{label}"})
+        latencies = []
+        for i in range(args.questions):
+            t = time.perf_counter()
+            status, _ = get_json(opener, f"{base}/api/chat", {"text": f"How many employees are in department {i}?"})
+            latencies.append(time.perf_counter() - t)
+            assert status == 200, status
+        serving = time.perf_counter() - start
+
+        pids = workers_of(server.pid)
+        usage = [memory(pid) for pid in pids]
+        master = memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+        log.close()
+
+    ready_text = f"{ready_at:6.2f} s" if ready_at is not None else "     -  "
+    print(f"{label:<8} listening {listening:6.2f} s  all ready {ready_text}  questions done {serving:6.2f} s")
+    print(f"{'':<8} question latency first {latencies[0] * 1000:7.0f} ms  p50 "
+          f"{statistics.median(latencies) * 1000:6.0f} ms  max {max(latencies) * 1000:7.0f} ms")
+    print(f"{'':<8} per worker RSS {statistics.mean(u[0] for u in usage):6.0f} MiB  PSS "
+          f"{statistics.mean(u[1] for u in usage):6.0f} MiB   total PSS incl. master "
+          f"{sum(u[1] for u in usage) + master[1]:6.0f} MiB ({len(pids)} workers)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--docs", type=int, default=200_000)
+    parser.add_argument("--questions", type=int, default=16, help="questions sent after startup")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub seconds per OpenAI request")
+    args = parser.parse_args()
+
+    stub = StubLLMServer(latency=args.latency).start()
+    workdir = tempfile.mkdtemp()
+    use_local_backends(workdir, stub, LOCAL_SQL="1", ANSWER_CACHE="0", LOG_LEVEL="WARNING")
+    t = time.perf_counter()
+    build_corpus(workdir, args.docs)
+    print(f"{args.docs} docs written in {time.perf_counter() - t:.1f} s; {args.workers} workers")
+
+    env = {**os.environ, "PYTHONPATH": REPO}
+    print(f"import app: {import_time(workdir, env):.2f} s")
+    lazy_config = os.path.join(workdir, "lazy.conf.py")
+    open(lazy_config, "w").close()
+    run("lazy", lazy_config, args, workdir, env)
+    run("warm-up", os.path.join(REPO, "gunicorn.conf.py"), args, workdir, env)
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Time to first byte / first answer token for /api/chat vs /api/chat/stream.
+
+Both endpoints run in-process through the Flask test client against a stub
+OpenAI server that streams the answer a few characters at a time.
+
+Usage:
+    python -m benchmarks.bench_streaming --questions 20 --latency 0.2 --token-latency 0.02
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+from benchmarks.fixtures import install_retriever, use_local_backends
+from benchmarks.stub_llm import StubLLMServer
+
+LONG_ANSWER = "<table>" + "".join(f"<tr><td>Employee {i}</td><td>Marketing</td></tr>" for i in range(20)) + "</table>"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub latency before the first byte, seconds")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="delay between streamed chunks, seconds")
+    args = parser.parse_args()
+
+    stub = StubLLMServer(latency=args.latency, token_latency=args.token_latency, answer=LONG_ANSWER).start()
+    workdir = tempfile.mkdtemp()
+    use_local_backends(workdir, stub, ANSWER_CACHE="0", SQL_CACHE="0")
+
+    from app import app
+    install_retriever(workdir, [{"id": "schema-0", "text": "Table Schema:\nemployees (...)"}])
+
+    client = app.test_client()
+    client.post("/api/register", json={"username": "bench"})
+
+    plain_total, stream_first_byte, stream_first_token, stream_total = [], [], [], []
+    for i in range(args.questions):
+        start = time.perf_counter()
+        client.post("/api/chat", json={"text": f"plain question {i}"})
+        plain_total.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        resp = client.post("/api/chat/stream", json={"text": f"stream question {i}"}, buffered=False)
+        first_byte = first_token = None
+        for chunk in resp.response:
+            now = time.perf_counter() - start
+            first_byte = first_byte if first_byte is not None else now
+            if first_token is None and b"event: token" in (chunk if isinstance(chunk, bytes) else chunk.encode()):
+                first_token = now
+        stream_total.append(time.perf_counter() - start)
+        stream_first_byte.append(first_byte)
+        stream_first_token.append(first_token)
+
+    def ms(samples):
+        return f"{statistics.median(samples) * 1000:8.1f} ms"
+
+    print(f"/api/chat          first byte {ms(plain_total)}  (response is sent whole)  total {ms(plain_total)}")
+    print(f"/api/chat/stream   first byte {ms(stream_first_byte)}  first token {ms(stream_first_token)}"
+          f"  total {ms(stream_total)}")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Throughput and error coverage of sql_validator.analyze_sql() over the
+training queries.
+
+Each training query is validated as written (these should pass) and in a few
+broken variants of the kind the model produces: a hallucinated column, a
+misspelled table, an unknown alias and a stacked second statement. The old
+substring check (`" ea.id "`) is shown alongside for comparison.
+
+Usage:
+    python -m benchmarks.bench_validator --data data/training_data_100.json --rounds 20
+"""
+import argparse
+import json
+import re
+import time
+
+import sql_validator
+from sql_validator import analyze_sql
+
+MUTATIONS = {
+    "hallucinated column": lambda sql: re.sub(r"\bfirst_name\b", "name", sql, count=1),
+    "misspelled table": lambda sql: re.sub(r"\bemployees\b", "employee", sql, count=1),
+    "unknown alias": lambda sql: re.sub(r"\b(\w+)\.(\w+)\b", r"zz.\2", sql, count=1),
+    "stacked statement": lambda sql: sql.rstrip().rstrip(";") + "\n; DROP TABLE employees",
+}
+
+
+def old_validate(sql):
+    return " ea.id " not in sql.lower()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default="data/training_data_100.json")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    queries = [row["sql"] for row in json.load(open(args.data))]
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        analyze_sql.cache_clear()
+        for sql in queries:
+            analyze_sql(sql)
+    cold = (time.perf_counter() - start) / (args.rounds * len(queries))
+
+    start = time.perf_counter()
+    for _ in range(args.rounds * 10):
+        for sql in queries:
+            analyze_sql(sql)
+    warm = (time.perf_counter() - start) / (args.rounds * 10 * len(queries))
+
+    print(f"{len(queries)} queries, parse cache size {sql_validator.SQL_PARSE_CACHE_SIZE}")
+    print(f"uncached: {cold * 1e6:8.1f} us/query  ({1 / cold:,.0f} queries/s)")
+    print(f"cached:   {warm * 1e6:8.1f} us/query  ({1 / warm:,.0f} queries/s)")
+
+    flagged = [sql for sql in queries if not analyze_sql(sql).valid]
+    print(f"\noriginal queries flagged: {len(flagged)}/{len(queries)}")
+    for sql in flagged:
+        print(f"  {' '.join(sql.split())[:100]}\n    -> {'; '.join(analyze_sql(sql).errors)}")
+
+    print(f"\n{'mutation':<20} {'applicable':>10} {'caught':>8} {'old check':>10}")
+    for name, mutate in MUTATIONS.items():
+        broken = [m for m in (mutate(sql) for sql in queries if analyze_sql(sql).valid) if m not in queries]
+        caught = sum(1 for sql in broken if not analyze_sql(sql).valid or not analyze_sql(sql).read_only)
+        old = sum(1 for sql in broken if not old_validate(sql))
+        print(f"{name:<20} {len(broken):>10} {caught:>8} {old:>10}")
+
+
+if __name__ == "__main__":
+    main()
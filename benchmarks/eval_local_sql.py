@@ -0,0 +1,64 @@
+"""
+Offline evaluation of the local (TF-IDF classifier) SQL fast path.
+
+k-fold cross-validation over a training file: the classifier is fit on the
+other folds with train_model.fit_sql_model() and each held-out question is
+sent through LocalSqlGenerator at several gate thresholds. Reports the hit
+rate (questions answered without the LLM), accuracy of those hits against
+the reference SQL (canonical form), and the latency saved assuming each hit
+avoids one LLM round trip of --llm-latency seconds.
+
+Usage:
+    python -m benchmarks.eval_local_sql --data data/training_data_100.json --thresholds 0.5 0.6 0.7 0.8
+"""
+import argparse
+import json
+import random
+import time
+import warnings
+
+from local_sql import LocalSqlGenerator
+from sql_validator import canonicalize_sql
+from train_model import fit_sql_model
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default="data/training_data_100.json")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9])
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="seconds per SQL-generation LLM call")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    data = json.load(open(args.data))
+    random.Random(0).shuffle(data)
+    folds = [data[i::args.folds] for i in range(args.folds)]
+
+    totals = {t: {"hits": 0, "correct": 0, "time": 0.0} for t in args.thresholds}
+    for i, test in enumerate(folds):
+        train = [row for j, fold in enumerate(folds) if j != i for row in fold]
+        model = fit_sql_model([r["question"] for r in train], [r["sql"] for r in train])
+        for t in args.thresholds:
+            gen = LocalSqlGenerator(threshold=t, model=model)
+            gen.generate("warm up")
+            for row in test:
+                start = time.perf_counter()
+                sql = gen.generate(row["question"])
+                totals[t]["time"] += time.perf_counter() - start
+                if sql is not None:
+                    totals[t]["hits"] += 1
+                    totals[t]["correct"] += canonicalize_sql(sql) == canonicalize_sql(row["sql"])
+
+    n = len(data)
+    print(f"{n} questions, {args.folds}-fold, LLM call assumed {args.llm_latency:.2f}s\n")
+    print(f"{'threshold':>9} {'hit rate':>9} {'accuracy':>9} {'local ms':>9} {'saved s/q':>10}")
+    for t, r in totals.items():
+        local = r["time"] / n
+        saved = r["hits"] / n * args.llm_latency - local
+        accuracy = r["correct"] / r["hits"] if r["hits"] else 0.0
+        print(f"{t:>9.2f} {r['hits'] / n:>9.1%} {accuracy:>9.1%} {local * 1000:>9.2f} {saved:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
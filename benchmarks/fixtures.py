@@ -0,0 +1,133 @@
+"""
+Shared fixtures for benchmarks: a seeded SQLite stand-in for the MySQL
+database and a FAISS index built with the stub embeddings.
+
+`use_local_backends()` must run before rag / app are imported, since they
+read the environment at import time.
+"""
+import datetime
+import os
+import random
+
+import faiss
+import numpy as np
+from sqlalchemy import create_engine, event, insert
+
+import doc_store
+from benchmarks.stub_llm import stub_embedding
+from models import db, Employee, EmployeeAddress, EmployeeProject
+
+DEPARTMENTS = ["Marketing", "HR", "Engineering", "Sales", "Finance", "IT"]
+COUNTRIES = ["India", "Australia", "United States", "Germany", "Canada"]
+STATES = ["Delaware", "California", "Texas", "New South Wales", "Maharashtra", "Ontario", "Bavaria"]
+CITIES = ["Velezfurt", "Pune", "Sydney", "Austin", "Berlin", "Toronto"]
+PROJECTS = ["Apollo", "Hermes", "Zeus", "Athena", "Hercules"]
+ROLES = ["Member", "Developer", "Lead", "Manager", "Analyst"]
+JOB_TITLES = ["Engineer", "Analyst", "Manager", "Designer", "Accountant", "Recruiter"]
+FIRST_NAMES = ["James", "Michael", "Mary", "Linda", "Robert", "Susan", "Thomas", "Lisa", "Andrew", "Charles"]
+LAST_NAMES = ["Tate", "Johnson", "Smith", "Williams", "Brown", "Jones", "Davis", "Harris", "Lewis", "Roberts"]
+# CURDATE() on the SQLite stand-in, fixed so date arithmetic is reproducible.
+FIXTURE_TODAY = datetime.date(2025, 6, 30)
+
+
+def _date(rng, start, days):
+    return start + datetime.timedelta(days=rng.randrange(days))
+
+
+def seed_database(uri, n_employees=1000, seed=0):
+    """
+    Create every table in models.py and fill every column of the employee
+    tables (database/schema.txt) with random rows drawn from the values the
+    training queries filter on. Employee 1 is James Tate, manager of many.
+    """
+    rng = random.Random(seed)
+    engine = create_engine(uri)
+    db.metadata.create_all(engine)
+    employees, addresses, projects = [], [], []
+    for i in range(1, n_employees + 1):
+        hired = _date(rng, datetime.date(2015, 1, 1), 3000)
+        first, last = ("James", "Tate") if i == 1 else (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+        employees.append({
+            "employee_id": i, "first_name": first, "last_name": last, "email": f"e{i}@example.com",
+            "phone": f"555-{i:04d}", "hire_date": hired, "job_title": rng.choice(JOB_TITLES),
+            "department": rng.choice(DEPARTMENTS), "salary": rng.randrange(30_000, 150_000),
+            "manager_id": rng.randrange(1, min(i, 20)) if i > 1 else None,
+            "created_at": datetime.datetime.combine(hired, datetime.time(9)),
+            "updated_at": datetime.datetime.combine(hired, datetime.time(9)),
+        })
+        for address_type in ["Home"] + (["Office"] if rng.random() < 0.4 else []):
+            addresses.append({"employee_id": i, "address_type": address_type,
+                              "street": f"{rng.randrange(1, 999)} Main St", "city": rng.choice(CITIES),
+                              "state": rng.choice(STATES), "postal_code": f"{rng.randrange(10000, 99999)}",
+                              "country": rng.choice(COUNTRIES)})
+        for _ in range(rng.choice([0, 0, 1, 1, 2, 3])):
+            start = _date(rng, hired, 1500)
+            end = _date(rng, start, 700) if rng.random() < 0.7 else None
+            projects.append({"employee_id": i, "project_name": rng.choice(PROJECTS), "role": rng.choice(ROLES),
+                             "start_date": start, "end_date": end})
+    with engine.begin() as conn:
+        conn.execute(insert(Employee.__table__), employees)
+        conn.execute(insert(EmployeeAddress.__table__), addresses)
+        if projects:
+            conn.execute(insert(EmployeeProject.__table__), projects)
+    engine.dispose()
+
+
+def _day(value):
+    return None if value is None else datetime.date.fromisoformat(str(value)[:10])
+
+
+# MySQL functions used by the training queries, for SQLite connections.
+MYSQL_FUNCTIONS = {
+    "YEAR": (1, lambda d: None if d is None else _day(d).year),
+    "MONTH": (1, lambda d: None if d is None else _day(d).month),
+    "CURDATE": (0, lambda: FIXTURE_TODAY.isoformat()),
+    "DATEDIFF": (2, lambda a, b: None if a is None or b is None else (_day(a) - _day(b)).days),
+    "CONCAT": (-1, lambda *parts: None if None in parts else "".join(str(p) for p in parts)),
+}
+
+
+def add_mysql_functions(engine):
+    """Register MYSQL_FUNCTIONS on every new connection of a SQLite engine (no-op for other databases)."""
+    if engine.dialect.name != "sqlite":
+        return engine
+
+    @event.listens_for(engine, "connect")
+    def register(dbapi_conn, record):
+        for name, (n_args, fn) in MYSQL_FUNCTIONS.items():
+            dbapi_conn.create_function(name, n_args, fn, deterministic=True)
+    return engine
+
+
+def build_stub_index(workdir, docs):
+    """Write an index + doc store for `docs` (list of {"id", "text"}) using stub embeddings."""
+    embeddings = np.array([stub_embedding(d["text"]) for d in docs], dtype="float32")
+    index = faiss.IndexIDMap(faiss.IndexFlatL2(embeddings.shape[1]))
+    ids = np.arange(len(docs), dtype="int64")
+    index.add_with_ids(embeddings, ids)
+    index_file = os.path.join(workdir, "faiss_index.bin")
+    docs_file = os.path.join(workdir, "faiss_docs.bin")
+    faiss.write_index(index, index_file)
+    doc_store.write(docs_file, {int(i): d for i, d in zip(ids, docs)})
+    return index_file, docs_file
+
+
+def use_local_backends(workdir, stub, n_employees=1000, **env):
+    """Point OpenAI at the stub and the app at a fresh seeded SQLite file; extra env vars override."""
+    os.environ.update({
+        "OPENAI_BASE_URL": stub.base_url,
+        "OPENAI_API_KEY": "stub",
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.sqlite')}",
+        "EMBED_CACHE_DB": "",
+        "LOCAL_SQL": "0",
+        **env,
+    })
+    seed_database(os.environ["SQLALCHEMY_DATABASE_URI"], n_employees)
+
+
+def install_retriever(workdir, docs):
+    """Build a stub index for `docs` and make it the process-wide retriever."""
+    import retriever
+    index_file, docs_file = build_stub_index(workdir, docs)
+    retriever._RETRIEVER = retriever.Retriever(index_file, docs_file, os.path.join(workdir, "none.version"))
+    return retriever._RETRIEVER
@@ -0,0 +1,78 @@
+"""
+Load test: sync answer_question() on a thread pool (one thread per sync
+worker) vs. answer_question_async() on a single event loop.
+
+Runs entirely locally: a stub OpenAI server with fixed latency, a seeded
+SQLite database and a stub-embedded FAISS index. Caches are disabled so
+every request runs the full pipeline.
+
+Usage:
+    python -m benchmarks.load_test --requests 400 --sync-workers 8 --async-concurrency 64 --latency 0.05
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fixtures import install_retriever, use_local_backends
+from benchmarks.stub_llm import StubLLMServer
+
+
+def report(name, latencies, wall):
+    p99 = statistics.quantiles(latencies, n=100, method="inclusive")[98] if len(latencies) > 1 else latencies[0]
+    print(f"{name:>6}  {len(latencies) / wall:8.1f} req/s  p50 {statistics.median(latencies) * 1000:8.1f} ms"
+          f"  p99 {p99 * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--sync-workers", type=int, default=8)
+    parser.add_argument("--async-concurrency", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub LLM latency per call, seconds")
+    args = parser.parse_args()
+
+    stub = StubLLMServer(latency=args.latency).start()
+    workdir = tempfile.mkdtemp()
+    use_local_backends(workdir, stub, ANSWER_CACHE="0", SQL_CACHE="0")
+
+    # Imported after the environment is set: clients and caches read it at import time.
+    import rag
+    import rag_async
+
+    install_retriever(workdir, [{"id": f"example-{i}", "text": f"Q: question {i}\nSQL: SELECT {i};"}
+                                for i in range(200)])
+
+    def timed_sync(i):
+        start = time.perf_counter()
+        rag.answer_question(f"sync question {i}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sync_workers) as pool:
+        sync_latencies = list(pool.map(timed_sync, range(args.requests)))
+    report("sync", sync_latencies, time.perf_counter() - start)
+
+    async def run_async():
+        sem = asyncio.Semaphore(args.async_concurrency)
+
+        async def timed(i):
+            async with sem:
+                start = time.perf_counter()
+                await rag_async.answer_question_async(f"async question {i}")
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(timed(i) for i in range(args.requests)))
+        report("async", latencies, time.perf_counter() - start)
+        await rag_async.get_async_engine().dispose()
+
+    asyncio.run(run_async())
+    print(f"stub calls: {stub.calls}")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
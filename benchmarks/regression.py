@@ -0,0 +1,237 @@
+"""
+Offline regression suite for the full question -> SQL -> answer pipeline.
+
+Every question of the given training files goes through rag.answer_question()
+against a replayed OpenAI backend (replay_llm.py) and a seeded SQLite
+stand-in for MySQL (fixtures.seed_database, with the MySQL functions the
+training queries use). Reported per data file, and written as JSON:
+
+  execution accuracy  the pipeline's final SQL returns the same rows (as a
+                      multiset) as the reference SQL on the fixture
+  latency             p50 / p95 end to end and per stage (metrics.span)
+  calls               embedding and chat requests per question
+  memory              peak RSS of the process (and traced Python heap with --trace-memory)
+
+Without a cassette (or on cassette misses) the stub answers SQL-generation
+prompts with the reference SQL, so accuracy then measures everything around
+the model: local SQL, validation, repair, LIMIT handling and execution.
+With --baseline, the run fails (exit 1) when accuracy drops, calls per
+question grow, or (with --max-latency-increase) p95 latency grows beyond
+the given thresholds. benchmarks/baselines/regression.json is the report of
+the stub run (the usage line below without --baseline or --cassette); after an
+intended change in accuracy or calls, regenerate it with --report pointing at it.
+
+Usage:
+    python -m benchmarks.regression --data data/training_data_100.json data/training_data.json \\
+        --report regression_report.json [--baseline benchmarks/baselines/regression.json] \\
+        [--cassette run.jsonl --mode replay|record --on-miss stub|fail]
+"""
+import argparse
+import datetime
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from decimal import Decimal
+
+from sqlalchemy import create_engine, text
+
+from benchmarks.fixtures import add_mysql_functions, install_retriever, use_local_backends
+from benchmarks.replay_llm import ReplayLLMServer
+from doc_store import DocStore
+
+DOCS_FILE = "data/faiss_docs.bin"
+
+
+def _normalize(value):
+    if isinstance(value, (float, Decimal)):
+        return round(float(value), 4)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def result_rows(engine, sql):
+    """Rows of a query as a multiset of normalized tuples."""
+    with engine.connect() as conn:
+        return Counter(tuple(_normalize(v) for v in row) for row in conn.execute(text(sql)))
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None}
+    ordered = sorted(samples)
+    return {"p50": round(statistics.median(ordered), 3),
+            "p95": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3)}
+
+
+def evaluate(rows, reference_engine, stub):
+    """
+    Run every {"question", "sql"} row through rag.answer_question(); returns
+    one result dict per row. rag must already point at the stub and fixture.
+    """
+    import metrics
+
+    saved = metrics.TRACE_SAMPLE_RATE, metrics.logger.disabled
+    metrics.TRACE_SAMPLE_RATE, metrics.logger.disabled = 1.0, True
+    try:
+        return [_evaluate_one(row, reference_engine, stub) for row in rows]
+    finally:
+        metrics.TRACE_SAMPLE_RATE, metrics.logger.disabled = saved
+
+
+def _evaluate_one(row, reference_engine, stub):
+    import metrics
+    import rag
+
+    calls = dict(stub.calls)
+    start = time.perf_counter()
+    with metrics.trace("regression") as trace:
+        _, meta = rag.answer_question(row["question"])
+    latency = time.perf_counter() - start
+    sql_meta = meta["sql_meta"]
+
+    result = {"question": row["question"], "latency_ms": latency * 1000,
+              "source": "cache" if meta.get("cache") else trace.attrs.get("sql_source"),
+              "calls": {k: stub.calls[k] - calls[k] for k in calls},
+              "stages": {}, "error": sql_meta.get("error"), "match": False, "reference_error": None}
+    for span in trace.spans:
+        result["stages"][span["stage"]] = result["stages"].get(span["stage"], 0.0) + span["duration_ms"]
+    try:
+        expected = result_rows(reference_engine, row["sql"])
+    except Exception as e:
+        result["reference_error"] = str(e).splitlines()[0]
+    else:
+        if result["error"] is None:
+            try:
+                result["match"] = result_rows(reference_engine, sql_meta["query"]) == expected
+            except Exception as e:
+                result["error"] = str(e).splitlines()[0]
+    return result
+
+
+def summarize(results):
+    evaluated = [r for r in results if r["reference_error"] is None]
+    stages = {}
+    for r in results:
+        for stage, ms in r["stages"].items():
+            stages.setdefault(stage, []).append(ms)
+    n = len(results) or 1
+    return {
+        "questions": len(results),
+        "evaluated": len(evaluated),
+        "execution_accuracy": round(sum(r["match"] for r in evaluated) / len(evaluated), 4) if evaluated else None,
+        "pipeline_errors": sum(r["error"] is not None for r in evaluated),
+        "reference_errors": len(results) - len(evaluated),
+        "sql_sources": dict(Counter(r["source"] for r in results)),
+        "calls_per_question": {k: round(sum(r["calls"][k] for r in results) / n, 3)
+                               for k in (results[0]["calls"] if results else {})},
+        "latency_ms": percentiles([r["latency_ms"] for r in results]),
+        "stage_latency_ms": {stage: percentiles(v) for stage, v in sorted(stages.items())},
+        "failures": [{"question": r["question"], "error": r["error"]}
+                     for r in evaluated if not r["match"]],
+    }
+
+
+def compare(report, baseline, max_accuracy_drop, max_calls_increase, max_latency_increase):
+    """Regressions of report against baseline, as messages (empty if none)."""
+    problems = []
+    for name, now in report["datasets"].items():
+        before = baseline.get("datasets", {}).get(name)
+        if before is None:
+            continue
+        if before["execution_accuracy"] is not None and now["execution_accuracy"] is not None \
+                and before["execution_accuracy"] - now["execution_accuracy"] > max_accuracy_drop:
+            problems.append(f"{name}: execution accuracy {before['execution_accuracy']:.1%} -> "
+                            f"{now['execution_accuracy']:.1%}")
+        for kind, value in now["calls_per_question"].items():
+            old = before["calls_per_question"].get(kind)
+            if old is not None and value - old > max_calls_increase:
+                problems.append(f"{name}: {kind} calls per question {old} -> {value}")
+        old_p95, new_p95 = before["latency_ms"]["p95"], now["latency_ms"]["p95"]
+        if max_latency_increase and old_p95 and new_p95 and new_p95 > old_p95 * (1 + max_latency_increase):
+            problems.append(f"{name}: p95 latency {old_p95:.1f} ms -> {new_p95:.1f} ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", nargs="+", default=["data/training_data_100.json", "data/training_data.json"])
+    parser.add_argument("--report", default="regression_report.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--cassette")
+    parser.add_argument("--mode", choices=["replay", "record"], default="replay")
+    parser.add_argument("--on-miss", choices=["stub", "fail"], default="stub")
+    parser.add_argument("--employees", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub seconds per OpenAI request")
+    parser.add_argument("--local-sql", choices=["0", "1"], default="1")
+    parser.add_argument("--trace-memory", action="store_true", help="also trace Python heap peak (slower)")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.02)
+    parser.add_argument("--max-calls-increase", type=float, default=0.1)
+    parser.add_argument("--max-latency-increase", type=float, default=0.0, help="relative, e.g. 0.25; 0 = off")
+    args = parser.parse_args()
+
+    datasets = {path: json.load(open(path)) for path in args.data}
+    references = {row["question"]: row["sql"] for rows in datasets.values() for row in rows}
+
+    def oracle(question):
+        return references.get(question, "SELECT * FROM employees WHERE 1=0")
+
+    stub = ReplayLLMServer(args.cassette, mode=args.mode, on_miss=args.on_miss, latency=args.latency,
+                           sql_for=oracle).start()
+    with tempfile.TemporaryDirectory() as workdir:
+        use_local_backends(workdir, stub, args.employees, ANSWER_CACHE="0", SQL_CACHE="0",
+                           LOCAL_SQL=args.local_sql, TABLE_PROBE_INTERVAL="0")
+        import db_engines
+        import retriever
+
+        add_mysql_functions(db_engines.get_engine("query"))
+        reference_engine = add_mysql_functions(create_engine(os.environ["SQLALCHEMY_DATABASE_URI"]))
+        install_retriever(workdir, list(DocStore.open(DOCS_FILE).values()))
+
+        if args.trace_memory:
+            tracemalloc.start()
+        report = {"config": {k: v for k, v in vars(args).items() if k != "data"}, "datasets": {}}
+        for path, rows in datasets.items():
+            retriever.embedding_cache.clear()  # data files share questions; measure each cold
+            report["datasets"][os.path.basename(path)] = summarize(evaluate(rows, reference_engine, stub))
+        report["memory"] = {"peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+        if args.trace_memory:
+            report["memory"]["python_heap_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        report["cassette"] = {"hits": stub.hits, "misses": stub.misses}
+        reference_engine.dispose()
+        db_engines.dispose_all()
+    stub.stop()
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    for name, s in report["datasets"].items():
+        stages = "  ".join(f"{k} {v['p50']}/{v['p95']}" for k, v in s["stage_latency_ms"].items())
+        print(f"{name}: {s['questions']} questions, execution accuracy {s['execution_accuracy']:.1%} "
+              f"({s['evaluated']} evaluated, {s['pipeline_errors']} pipeline errors), sources {s['sql_sources']}")
+        print(f"  latency p50/p95 {s['latency_ms']['p50']}/{s['latency_ms']['p95']} ms; calls/question "
+              f"{s['calls_per_question']}")
+        print(f"  stage p50/p95 ms: {stages}")
+        for failure in s["failures"]:
+            print(f"  x {failure['question']}: {failure['error'] or 'different rows'}")
+    print(f"memory {report['memory']}, cassette {report['cassette']}; report written to {args.report}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.max_accuracy_drop, args.max_calls_increase,
+                               args.max_latency_increase)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Record / replay OpenAI backend for offline regression runs.
+
+ReplayLLMServer is the stub server (stub_llm.py) with a cassette: a JSON
+lines file of chat replies and embeddings keyed by a hash of the request
+(model + messages, or model + input text).
+
+  mode="replay"  answer from the cassette; on a miss either fall back to the
+                 stub (on_miss="stub") or fail the request (on_miss="fail").
+  mode="record"  answer from the cassette, forward misses to the real API
+                 (OPENAI_API_KEY, `upstream` base URL) and append them.
+
+A cassette only matches while prompts stay the same: a change to retrieval,
+context building or prompt wording shows up as misses, which are counted.
+
+    server = ReplayLLMServer("benchmarks/cassettes/run.jsonl", sql_for=oracle).start()
+"""
+import hashlib
+import json
+import os
+import threading
+
+from benchmarks.stub_llm import StubLLMServer
+
+UPSTREAM_URL = "https://api.openai.com/v1"
+
+
+def request_key(kind, model, payload):
+    blob = json.dumps([kind, model, payload], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+class ReplayLLMServer(StubLLMServer):
+    def __init__(self, cassette, mode="replay", on_miss="stub", upstream=UPSTREAM_URL, **kwargs):
+        super().__init__(**kwargs)
+        if mode not in ("replay", "record"):
+            raise ValueError(f"unknown mode {mode!r}")
+        self.cassette = cassette
+        self.mode = mode
+        self.on_miss = on_miss
+        self.upstream = upstream
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._write_lock = threading.Lock()
+        self._client = None
+        if cassette and os.path.exists(cassette):
+            with open(cassette, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry["response"]
+
+    def _upstream(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=os.environ["OPENAI_API_KEY"], base_url=self.upstream)
+        return self._client
+
+    def _lookup(self, kind, model, payload, stub_reply, fetch):
+        key = request_key(kind, model, payload)
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self.hits += 1
+                return response
+            self.misses += 1
+        if self.mode == "record":
+            response = fetch()
+            with self._write_lock:
+                self._entries[key] = response
+                with open(self.cassette, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "kind": kind, "response": response}) + "\n")
+            return response
+        if self.on_miss == "fail":
+            raise CassetteMiss(f"{kind} request not in cassette {self.cassette}")
+        return stub_reply()
+
+    def chat_reply(self, messages, model=None):
+        def fetch():
+            resp = self._upstream().chat.completions.create(model=model, messages=messages, temperature=0)
+            return resp.choices[0].message.content
+        return self._lookup("chat", model, messages, lambda: StubLLMServer.chat_reply(self, messages, model), fetch)
+
+    def embedding(self, text, model=None):
+        def fetch():
+            return self._upstream().embeddings.create(model=model, input=text).data[0].embedding
+        return self._lookup("embedding", model, text, lambda: StubLLMServer.embedding(self, text, model), fetch)
@@ -0,0 +1,171 @@
+"""
+Local OpenAI-compatible stub for benchmarks and load tests.
+
+Serves /v1/embeddings and /v1/chat/completions with a fixed artificial
+latency. Chat requests with "stream": true get the reply as SSE chunks of a
+few characters each, `token_latency` seconds apart; non-streamed replies
+wait for the same total generation time before responding. Embeddings are deterministic pseudo-random vectors derived from the
+input text; SQL-generation prompts get `sql_for(question)` back and every
+other chat prompt gets a short canned answer.
+
+Faults can be injected: `slow_rate` of requests (and the next `slow_next`)
+take `slow_latency` instead of `latency`, and `error_rate` of them fail with
+a 500 after the delay (1.0 simulates an outage). With `stream_cut_after`
+set, a streamed reply breaks off after that many chunks (the connection is
+closed mid-body, as when the upstream drops it).
+
+    server = StubLLMServer(latency=0.05).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBED_DIM = 64
+DEFAULT_SQL = "SELECT first_name, last_name, department FROM employees LIMIT 5"
+CHUNK_CHARS = 4
+DEFAULT_ANSWER = "<table><tr><td>stub answer</td></tr></table>"
+
+
+def stub_embedding(text: str, dim: int = EMBED_DIM):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).random(dim, dtype="float32").tolist()
+
+
+class StubLLMServer:
+    def __init__(self, latency=0.05, sql_for=None, answer=DEFAULT_ANSWER, token_latency=0.0,
+                 host="127.0.0.1", port=0, slow_rate=0.0, slow_latency=1.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.sql_for = sql_for or (lambda question: DEFAULT_SQL)
+        self.answer = answer
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.slow_next = 0
+        self.error_rate = error_rate
+        self.stream_cut_after = None
+        self.calls = {"embeddings": 0, "chat": 0, "errors": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def count(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+
+    def faults(self):
+        """(delay, fail) for the next request."""
+        with self._lock:
+            slow = self.slow_next > 0 or self._rng.random() < self.slow_rate
+            self.slow_next = max(0, self.slow_next - 1)
+            fail = self._rng.random() < self.error_rate
+        return (self.slow_latency if slow else self.latency), fail
+
+    def chat_reply(self, messages, model=None):
+        if messages and messages[0]["content"].startswith("You are an expert MySQL assistant"):
+            return self.sql_for(messages[-1]["content"])
+        if messages and messages[0]["content"].startswith("Fix this SQL query"):
+            return messages[-1]["content"]
+        return self.answer
+
+    def embedding(self, text, model=None):
+        return stub_embedding(text)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, model, content, chunk_chars=CHUNK_CHARS):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                if stub.stream_cut_after is not None:
+                    self.send_header("Content-Length", "1000000")  # never completed
+                self.end_headers()
+                self.close_connection = True
+                for n, i in enumerate(range(0, len(content), chunk_chars)):
+                    if n == stub.stream_cut_after:
+                        return
+                    chunk = {
+                        "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": content[i:i + chunk_chars]},
+                                     "finish_reason": None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(stub.token_latency)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                delay, fail = stub.faults()
+                time.sleep(delay)
+                if fail:
+                    stub.count("errors")
+                    self.send_error(500, "injected failure")
+                    return
+                try:
+                    self._respond(req)
+                except LookupError as e:  # e.g. a request missing from a replay cassette
+                    self.send_error(404, str(e))
+
+            def _respond(self, req):
+                if self.path.endswith("/embeddings"):
+                    stub.count("embeddings")
+                    inputs = req["input"] if isinstance(req["input"], list) else [req["input"]]
+                    self._send({
+                        "object": "list", "model": req.get("model"),
+                        "data": [{"object": "embedding", "index": i, "embedding": stub.embedding(t, req.get("model"))}
+                                 for i, t in enumerate(inputs)],
+                        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                    })
+                elif self.path.endswith("/chat/completions"):
+                    stub.count("chat")
+                    content = stub.chat_reply(req["messages"], req.get("model"))
+                    if req.get("stream"):
+                        return self._stream(req.get("model"), content)
+                    time.sleep(stub.token_latency * -(-len(content) // CHUNK_CHARS))
+                    self._send({
+                        "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                        "model": req.get("model"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                    })
+                else:
+                    self.send_error(404)
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
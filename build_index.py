@@ -2,56 +2,233 @@ import os
 import json
 import faiss
 import numpy as np
+import openai
 from openai import OpenAI
 from dotenv import load_dotenv
-import pickle
+from embedding_cache import EmbeddingCache, EMBED_MODEL
+import ann_index
+import doc_store
+from doc_store import DocStore
+from lexical_index import BM25Index
+from sql_validator import referenced_tables
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import hashlib
+import random
 import re
+import time
 
 load_dotenv()
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 SCHEMA_FILE = "database/schema.txt"
 TRAINING_JSON = "data/training_data_100.json"
+TRAINING_FILES = os.getenv("TRAINING_FILES", TRAINING_JSON).split(",")
 INDEX_FILE = "data/faiss_index.bin"
-DOCS_FILE = "data/faiss_docs.pkl"
+DOCS_FILE = "data/faiss_docs.bin"
+VERSION_FILE = "data/faiss_index.version"
+MANIFEST_FILE = "data/faiss_manifest.json"
+LEXICAL_FILE = "data/bm25_index.npz"
+
+# Inputs per embeddings request, concurrent requests, and retries per request.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def _embed_openai(text: str):
+    return client.embeddings.create(model=EMBED_MODEL, input=text).data[0].embedding
+
+
+def _embed_openai_batch(texts):
+    resp = client.embeddings.create(model=EMBED_MODEL, input=texts)
+    return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+
+def with_retry(fn, *args, max_retries=EMBED_MAX_RETRIES, base_delay=1.0):
+    """Call fn, retrying transient OpenAI errors with exponential backoff and jitter."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = base_delay * (2 ** attempt) * (0.5 + random.random())
+            print(f"⚠️ Embedding request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+embedding_cache = EmbeddingCache(_embed_openai, embed_batch_fn=lambda texts: with_retry(_embed_openai_batch, texts))
 
 
 def embed(text: str):
-    """Generate embeddings from OpenAI."""
-    return client.embeddings.create(model="text-embedding-3-small", input=text).data[0].embedding
+    """Generate embeddings from OpenAI, served from the embedding cache when possible."""
+    return embedding_cache.embed(text)
+
+
+def embed_all(texts, batch_size=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY):
+    """Embed texts in batches of `batch_size`, with at most `concurrency` requests in flight."""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = pool.map(embedding_cache.embed_many, batches)
+        vectors = [vec for batch in results for vec in batch]
+    return np.array(vectors, dtype="float32").reshape(len(texts), -1)
 
 
-def build():
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_docs():
+    """Build the doc list from the schema and training files, with ids that survive reordering."""
     if not os.path.exists(SCHEMA_FILE):
         raise RuntimeError("Schema file not found!")
-    if not os.path.exists(TRAINING_JSON):
-        raise RuntimeError("Training data not found!")
+    for path in TRAINING_FILES:
+        if not os.path.exists(path):
+            raise RuntimeError(f"Training data not found: {path}")
 
     schema = open(SCHEMA_FILE).read()
     schema_chunks = re.split(r'\n\s*\n', schema.strip())
-    data = json.load(open(TRAINING_JSON))
 
     docs = []
     for i, c in enumerate(schema_chunks):
-        docs.append({"id": f"schema-{i}", "text": f"Table Schema:\n{c}"})
-    for i, ex in enumerate(data):
-        docs.append({"id": f"example-{i}", "text": f"Q: {ex['question']}\nSQL: {ex['sql']}"})
+        docs.append({"id": f"schema-{i}", "text": f"Table Schema:\n{c}", "type": "schema",
+                     "tables": referenced_tables(c.split("(", 1)[0])})
+
+    # Example ids come from the question, so inserting an example does not
+    # shift the ids (and invalidate the embeddings) of every later one.
+    seen = {}
+    for path in TRAINING_FILES:
+        for ex in json.load(open(path)):
+            base = content_hash(ex["question"].strip().lower())[:16]
+            n = seen.get(base, 0)
+            seen[base] = n + 1
+            doc_id = f"example-{base}" if n == 0 else f"example-{base}-{n}"
+            docs.append({"id": doc_id, "text": f"Q: {ex['question']}\nSQL: {ex['sql']}", "type": "example",
+                         "tables": referenced_tables(ex["sql"])})
+    return docs
+
 
-    # Convert embeddings to numpy
-    embeddings = np.array([embed(d["text"]) for d in docs], dtype="float32")
+def load_manifest():
+    if not (os.path.exists(MANIFEST_FILE) and os.path.exists(INDEX_FILE) and os.path.exists(DOCS_FILE)):
+        return None
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def publish(index, docs, manifest=None):
+    """
+    Atomically replace the index, BM25 index, docs and manifest, then bump the version file.
+
+    Running processes (see retriever.Retriever) reload when the version changes,
+    so the version is written last, after the other files are in place. The
+    BM25 index is rebuilt from all docs every time: it needs no embeddings.
+    """
+    tmp_index = INDEX_FILE + ".tmp"
+    tmp_docs = DOCS_FILE + ".tmp"
+    tmp_lexical = LEXICAL_FILE + ".tmp"
+    faiss.write_index(index, tmp_index)
+    doc_store.write(tmp_docs, docs)
+    BM25Index.build(docs).save(tmp_lexical)
+    os.replace(tmp_index, INDEX_FILE)
+    os.replace(tmp_docs, DOCS_FILE)
+    os.replace(tmp_lexical, LEXICAL_FILE)
+
+    if manifest is not None:
+        tmp_manifest = MANIFEST_FILE + ".tmp"
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_manifest, MANIFEST_FILE)
+
+    tmp_version = VERSION_FILE + ".tmp"
+    with open(tmp_version, "w", encoding="utf-8") as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp_version, VERSION_FILE)
+
+
+def build_full(docs, index_type=None):
+    """Embed every doc and write a fresh index. Docs are keyed by FAISS id."""
+    # Small corpora fall back to flat; the manifest records what was actually built.
+    index_type = ann_index.resolve_kind(index_type or ann_index.INDEX_TYPE, len(docs))
+    embeddings = embed_all([d["text"] for d in docs])
+    ids = np.arange(len(docs), dtype="int64")
 
     # Build FAISS index
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings)
+    index = ann_index.create_index(index_type, embeddings, ids)
+
+    manifest = {
+        "index_type": index_type,
+        "next_id": len(docs),
+        "docs": {d["id"]: {"hash": content_hash(d["text"]), "faiss_id": int(i)} for d, i in zip(docs, ids)},
+    }
+    publish(index, {int(i): d for i, d in zip(ids, docs)}, manifest)
+    print(f"✅ FAISS index ({index_type}) built with {len(docs)} docs")
+
+
+def build_incremental(docs, manifest, index_type=None):
+    """Embed only new or changed docs and patch the existing index in place."""
+    index_type = ann_index.resolve_kind(index_type or ann_index.INDEX_TYPE, len(docs))
+    index = faiss.read_index(INDEX_FILE)
+    if not isinstance(index, faiss.IndexIDMap) or manifest.get("index_type", "flat") != index_type:
+        print("⚠️ Existing index has a different layout, falling back to a full rebuild")
+        return build_full(docs, index_type)
+    stored = dict(DocStore.open(DOCS_FILE).items())
+
+    entries = manifest["docs"]
+    current = {d["id"]: d for d in docs}
+    changed = [d for d in docs if entries.get(d["id"], {}).get("hash") != content_hash(d["text"])]
+    stale = [doc_id for doc_id in entries if doc_id not in current] + [d["id"] for d in changed if d["id"] in entries]
+
+    if not changed and not stale:
+        print("✅ FAISS index is up to date")
+        return
+
+    if stale and not ann_index.supports_remove(index):
+        print("⚠️ Index type cannot remove vectors, falling back to a full rebuild")
+        return build_full(docs, index_type)
+
+    if stale:
+        stale_ids = np.array([entries[doc_id]["faiss_id"] for doc_id in stale], dtype="int64")
+        index.remove_ids(stale_ids)
+        for doc_id, faiss_id in zip(stale, stale_ids):
+            stored.pop(int(faiss_id), None)
+            del entries[doc_id]
+
+    if changed:
+        embeddings = embed_all([d["text"] for d in changed])
+        next_id = manifest["next_id"]
+        ids = np.arange(next_id, next_id + len(changed), dtype="int64")
+        index.add_with_ids(embeddings, ids)
+        for d, i in zip(changed, ids):
+            stored[int(i)] = d
+            entries[d["id"]] = {"hash": content_hash(d["text"]), "faiss_id": int(i)}
+        manifest["next_id"] = next_id + len(changed)
+
+    publish(index, stored, manifest)
+    print(f"✅ FAISS index updated: {len(changed)} embedded, {len(stale)} removed, {index.ntotal} total")
 
-    # Save index + docs
-    faiss.write_index(index, INDEX_FILE)
-    with open(DOCS_FILE, "wb") as f:
-        pickle.dump(docs, f)
 
-    print(f"✅ FAISS index built with {len(docs)} docs")
+def build(incremental=False, index_type=None):
+    docs = load_docs()
+    manifest = load_manifest() if incremental else None
+    if manifest is None:
+        build_full(docs, index_type)
+    else:
+        build_incremental(docs, manifest, index_type)
 
 
 if __name__ == "__main__":
-    build()
+    parser = argparse.ArgumentParser(description="Build the FAISS index from schema and training examples.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only embed docs that are new or changed since the last build")
+    parser.add_argument("--index-type", choices=ann_index.INDEX_TYPES, default=ann_index.INDEX_TYPE,
+                        help="FAISS index layout (default: FAISS_INDEX_TYPE or flat)")
+    args = parser.parse_args()
+    build(incremental=args.incremental, index_type=args.index_type)
@@ -0,0 +1,64 @@
+# chat_history.py
+#
+# Chat persistence helpers shared by the Flask and ASGI apps: one
+# transaction writes both messages of an exchange, and history is read in
+# keyset-paginated pages (id < cursor, newest first) off the
+# (user_id, id) / (conversation_id, id) indexes, so a page costs the same
+# at message one million as at message one.
+
+import os
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+from models import Conversation, Message
+
+load_dotenv()
+
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+
+
+def exchange_rows(conversation_id, question, answer, meta, asked_at=None):
+    """Rows for a user question and the assistant's reply, to insert together (same keys, for executemany)."""
+    asked_at = asked_at or datetime.utcnow()
+    return [
+        {"conversation_id": conversation_id, "sender": "user", "text": question, "meta": None,
+         "created_at": asked_at},
+        {"conversation_id": conversation_id, "sender": "assistant", "text": answer, "meta": meta,
+         "created_at": datetime.utcnow()},
+    ]
+
+
+def page_size(value) -> int:
+    try:
+        return max(1, min(int(value), HISTORY_MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return HISTORY_PAGE_SIZE
+
+
+def _page(rows, limit, to_dict):
+    items = [to_dict(r) for r in rows[:limit]]
+    return {"items": items, "next_before": items[-1]["id"] if len(rows) > limit else None}
+
+
+def conversation_page(session, user_id, before=None, limit=HISTORY_PAGE_SIZE):
+    """A page of the user's conversations, newest first; pass next_before back for the next page."""
+    query = select(Conversation.id, Conversation.created_at).where(Conversation.user_id == user_id)
+    if before:
+        query = query.where(Conversation.id < before)
+    rows = session.execute(query.order_by(Conversation.id.desc()).limit(limit + 1)).all()
+    return _page(rows, limit, lambda r: {"id": r.id, "created_at": r.created_at})
+
+
+def message_page(session, conversation_id, before=None, limit=HISTORY_PAGE_SIZE, with_meta=False):
+    """A page of a conversation's messages, newest first; meta (decompressed) only if asked for."""
+    columns = [Message.id, Message.sender, Message.text, Message.created_at]
+    if with_meta:
+        columns.append(Message.meta)
+    query = select(*columns).where(Message.conversation_id == conversation_id)
+    if before:
+        query = query.where(Message.id < before)
+    rows = session.execute(query.order_by(Message.id.desc()).limit(limit + 1)).all()
+    return _page(rows, limit, lambda r: dict(r._mapping))
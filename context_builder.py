@@ -0,0 +1,215 @@
+# context_builder.py
+#
+# Assembles the schema + example context for SQL generation under a token
+# budget, instead of joining every retrieved doc into the prompt.
+
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+from dotenv import load_dotenv
+
+from lexical_index import tokenize
+from sql_validator import SCHEMA, canonicalize_sql, compact_sql, referenced_tables as sql_tables
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a ~4 characters per token estimate
+    tiktoken = None
+
+load_dotenv()
+
+# Tokens allowed for retrieved context (schema + examples), candidates
+# retrieved before selection, MMR relevance/diversity tradeoff, and the
+# similarity above which an example counts as a duplicate of one already kept.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "450"))
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "20"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95"))
+# Top examples whose SQL also decides which schema chunks are included.
+CONTEXT_SCHEMA_EXAMPLES = 3
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+
+SCHEMA_PREFIX = "Table Schema:"
+_TABLE_RE = re.compile(r"^\s*`?([A-Za-z_][A-Za-z0-9_]*)`?\s*\(")
+# Column-name parts too generic to tie a question to a table.
+_GENERIC_WORDS = {"id", "name", "type", "date", "first", "last", "start", "end", "created", "updated", "at", "code"}
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    return tiktoken.get_encoding(TOKENIZER_ENCODING) if tiktoken is not None else None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Prompt tokens for text (tiktoken when installed)."""
+    enc = _encoding()
+    if enc is None:
+        return max(1, (len(text) + 3) // 4)
+    return len(enc.encode(text))
+
+
+def message_tokens(messages) -> int:
+    """Tokens of a chat prompt, including the few per-message framing tokens."""
+    return sum(count_tokens(m["content"]) + 4 for m in messages) + 2
+
+
+def _singular(word):
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("ses", "xes")):
+        return word[:-2]
+    return word[:-1] if word.endswith("s") and not word.endswith("ss") else word
+
+
+@lru_cache(maxsize=1)
+def _table_keywords():
+    """Word -> tables it points at: table name parts and distinctive column names/parts."""
+    keywords = {}
+    for table, columns in SCHEMA.items():
+        words = {table, _singular(table)} | set(table.split("_"))
+        for column in columns:
+            words.add(column)
+            words.update(p for p in column.split("_") if p not in _GENERIC_WORDS)
+        for word in words:
+            keywords.setdefault(_singular(word), set()).add(table)
+    # "employee" appears in every table name; only employees itself should claim it.
+    keywords[_singular("employees")] = {"employees"}
+    return keywords
+
+
+def referenced_tables(question: str):
+    """Schema tables a question mentions by name or by one of their columns."""
+    keywords = _table_keywords()
+    tables = set()
+    for token in tokenize(question):
+        tables |= keywords.get(_singular(token), set())
+    return tables
+
+
+def schema_table(text: str):
+    """Table a schema chunk defines, or None for general chunks (e.g. relationships)."""
+    m = _TABLE_RE.match(text[len(SCHEMA_PREFIX):]) if text.startswith(SCHEMA_PREFIX) else None
+    return m.group(1).lower() if m else None
+
+
+def _cosine_matrix(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1, norms)
+    return unit @ unit.T
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def mmr_order(texts, vectors=None, lam=CONTEXT_MMR_LAMBDA, dedup=CONTEXT_DEDUP_THRESHOLD):
+    """
+    Maximal-marginal-relevance order of ranked candidates.
+
+    Relevance is the candidate's position in the incoming ranking; redundancy
+    is its highest similarity to an already chosen candidate: cosine over the
+    stored embeddings, with candidates at or above `dedup` dropped as near
+    duplicates, or token Jaccard (ordering only) when there are no embeddings.
+    """
+    n = len(texts)
+    if n == 0:
+        return []
+    relevance = [1.0 - i / n for i in range(n)]
+    if vectors is not None:
+        sim = _cosine_matrix(np.asarray(vectors, dtype="float32"))
+    else:
+        token_sets = [set(tokenize(t)) for t in texts]
+        sim = np.array([[_jaccard(a, b) for b in token_sets] for a in token_sets])
+
+    chosen, remaining = [], list(range(n))
+    redundancy = np.zeros(n)
+    while remaining:
+        best = max(remaining, key=lambda i: lam * relevance[i] - (1 - lam) * redundancy[i])
+        remaining.remove(best)
+        if chosen and vectors is not None and redundancy[best] >= dedup:
+            continue
+        chosen.append(best)
+        redundancy = np.maximum(redundancy, sim[best])
+    return chosen
+
+
+def _compact_example(text):
+    """Example doc with its SQL on one line, without comments: same content, fewer tokens."""
+    question, sep, sql = text.partition("\nSQL: ")
+    if not sep:
+        return text
+    try:
+        return f"{question}{sep}{compact_sql(sql)}"
+    except ValueError:
+        return text
+
+
+def _example_sql_key(text):
+    sql = text.split("\nSQL: ", 1)[-1]
+    try:
+        return canonicalize_sql(sql)
+    except ValueError:
+        return sql
+
+
+def build_context(question, candidates, schema_docs, budget=CONTEXT_TOKEN_BUDGET, vectors=None):
+    """
+    Pick the context docs for a question.
+
+    candidates: retrieved doc texts, best first (schema chunks among them are ignored).
+    schema_docs: every schema chunk, in build order.
+    vectors: optional stored embeddings aligned with candidates, for MMR.
+
+    Schema chunks for the tables the question or its top examples reference
+    (all tables if none are recognized) and general chunks come first, in
+    build order, so the prompt prefix stays the same across questions touching
+    the same tables; then examples in MMR order until the budget is spent.
+    Returns (docs, stats).
+    """
+    # Examples whose SQL is the same query (up to formatting and aliases) are
+    # duplicates whatever the question wording; keep the best ranked one.
+    examples, example_vectors, seen = [], [], set()
+    for i, text in enumerate(candidates):
+        if text.startswith(SCHEMA_PREFIX):
+            continue
+        key = _example_sql_key(text)
+        if key in seen:
+            continue
+        seen.add(key)
+        examples.append(_compact_example(text))
+        if vectors is not None:
+            example_vectors.append(vectors[i])
+    order = mmr_order(examples, np.array(example_vectors) if vectors is not None and examples else None)
+
+    tables = referenced_tables(question)
+    for i in order[:CONTEXT_SCHEMA_EXAMPLES]:
+        tables.update(sql_tables(examples[i]))
+    tables = tables or set(SCHEMA)
+    if tables - {"employees"}:
+        tables.add("employees")  # joins go through employees.employee_id
+    schema = [d for d in schema_docs if schema_table(d) in tables or schema_table(d) is None]
+    schema_tokens = sum(count_tokens(d) for d in schema)
+
+    chosen, example_tokens = [], 0
+    remaining = budget - schema_tokens
+    for i in order:
+        cost = count_tokens(examples[i])
+        if cost > remaining:
+            continue
+        chosen.append(examples[i])
+        example_tokens += cost
+        remaining -= cost
+
+    stats = {
+        "tables": sorted(tables),
+        "schema_docs": len(schema),
+        "schema_tokens": schema_tokens,
+        "examples": len(chosen),
+        "examples_dropped": len(examples) - len(chosen),
+        "example_tokens": example_tokens,
+        "context_tokens": schema_tokens + example_tokens,
+    }
+    return schema + chosen, stats
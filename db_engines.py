@@ -0,0 +1,395 @@
+# db_engines.py
+#
+# Engine registry. Two pools per process:
+#
+#   app    chat history (users, conversations, messages); read-write. When
+#          app.py runs, this is Flask-SQLAlchemy's own engine, registered here
+#          so there is one app pool per worker, not two.
+#   query  generated SQL; read-only sessions with a per-statement time limit,
+#          optionally pointed at a replica (SQL_DATABASE_URI).
+#
+# Both pools are pre-pinged, recycled, instrumented (checkouts, wait time,
+# timeouts) and can be warmed up at startup.
+
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, exc, text as sql_text
+from sqlalchemy.engine import make_url
+
+from metrics import register_collector
+
+load_dotenv()
+
+# Threads serving requests in one worker process (gunicorn --threads). A sync
+# worker thread holds at most one query connection at a time, so the query
+# pool defaults to one connection per thread.
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "4"))
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+SQL_POOL_SIZE = int(os.getenv("SQL_POOL_SIZE", str(WORKER_THREADS)))
+SQL_MAX_OVERFLOW = int(os.getenv("SQL_MAX_OVERFLOW", "2"))
+# Seconds to wait for a pooled connection, seconds before a connection is
+# replaced (below MySQL's wait_timeout), and whether to ping on checkout.
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# Per-statement limit for generated SQL in milliseconds (0 disables).
+SQL_MAX_EXECUTION_TIME_MS = int(os.getenv("SQL_MAX_EXECUTION_TIME_MS", "30000"))
+# Open every pooled connection at startup so first requests skip the connect.
+DB_WARMUP = os.getenv("DB_WARMUP", "1") == "1"
+
+ROLES = ("app", "query")
+
+# Sync URI driver -> async driver used when ASYNC_DATABASE_URI is not set.
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql+mysqldb": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+_ENGINES = {}  # (role, is_async) -> (uri, engine); uri None for registered engines
+_METRICS = {}  # registry name -> PoolMetrics
+_lock = threading.Lock()
+
+
+# ------------------------
+# Configuration
+# ------------------------
+def async_database_uri(uri: str) -> str:
+    scheme, sep, rest = uri.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+def database_uri(role: str = "query", is_async: bool = False) -> str:
+    """URI for a role: the query role uses SQL_DATABASE_URI (a replica) when set."""
+    if role not in ROLES:
+        raise ValueError(f"unknown engine role {role!r}")
+    if is_async:
+        uri = os.getenv("SQL_ASYNC_DATABASE_URI") if role == "query" else None
+        uri = uri or os.getenv("ASYNC_DATABASE_URI")
+        if uri:
+            return uri
+    uri = (os.getenv("SQL_DATABASE_URI") if role == "query" else None) or os.getenv("SQLALCHEMY_DATABASE_URI")
+    if not uri:
+        raise RuntimeError("SQLALCHEMY_DATABASE_URI not set")
+    return async_database_uri(uri) if is_async else uri
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(role: str = "query", uri: str = None) -> dict:
+    """create_engine() keyword arguments for a role (also used as SQLALCHEMY_ENGINE_OPTIONS)."""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    # In-memory SQLite uses a single-connection pool without size settings.
+    if uri is None or not _is_memory_sqlite(make_url(uri)):
+        query = role == "query"
+        options.update(
+            pool_size=SQL_POOL_SIZE if query else DB_POOL_SIZE,
+            max_overflow=SQL_MAX_OVERFLOW if query else DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return options
+
+
+# ------------------------
+# Session setup
+# ------------------------
+def _sqlite_time_limit(dbapi_conn, record):
+    """SQLite has no statement timeout; interrupt from the progress handler instead."""
+    def expired():
+        deadline = record.info.get("deadline")
+        return 1 if deadline is not None and time.monotonic() > deadline else 0
+    dbapi_conn.set_progress_handler(expired, 100_000)
+
+
+def _install_read_only(engine, limit_ms):
+    """Every new connection of a query engine is read-only with a per-statement time limit."""
+    dialect = engine.dialect.name
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_conn, record):
+        if dialect == "mysql":
+            statements = ["SET SESSION TRANSACTION READ ONLY"]
+            if limit_ms:
+                # Applies to each SELECT on this session, not the session as a whole.
+                statements.append(f"SET SESSION MAX_EXECUTION_TIME = {limit_ms}")
+        elif dialect == "postgresql":
+            statements = ["SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY"]
+            if limit_ms:
+                statements.append(f"SET statement_timeout = {limit_ms}")
+        elif dialect == "sqlite":
+            statements = ["PRAGMA query_only = ON"]
+            if limit_ms and hasattr(dbapi_conn, "set_progress_handler"):
+                _sqlite_time_limit(dbapi_conn, record)
+        else:
+            statements = []
+        cursor = dbapi_conn.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+    if dialect == "sqlite" and limit_ms:
+        @event.listens_for(engine, "before_cursor_execute")
+        def start_clock(conn, cursor, statement, parameters, context, executemany):
+            conn.info["deadline"] = time.monotonic() + limit_ms / 1000
+
+        @event.listens_for(engine, "checkin")
+        def stop_clock(dbapi_conn, record):
+            record.info.pop("deadline", None)
+
+
+# ------------------------
+# Metrics
+# ------------------------
+class PoolMetrics:
+    """Checkout counters and wait times for one pool."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidated = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.max_checked_out = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_conn, record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_conn, record, proxy):
+        with self._lock:
+            self.checkouts += 1
+            checked_out = getattr(self.engine.pool, "checkedout", lambda: 0)()
+            self.max_checked_out = max(self.max_checked_out, checked_out)
+
+    def _on_invalidate(self, dbapi_conn, record, exception):
+        with self._lock:
+            self.invalidated += 1
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        pool = self.engine.pool
+        with self._lock:
+            return {
+                "pool_size": pool.size() if hasattr(pool, "size") else 1,
+                "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else 0,
+                "overflow": pool.overflow() if hasattr(pool, "overflow") else 0,
+                "max_checked_out": self.max_checked_out,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "invalidated": self.invalidated,
+                "timeouts": self.timeouts,
+                "waits": self.waits,
+                "wait_seconds": self.wait_total,
+                "wait_avg_ms": round(1000 * self.wait_total / self.waits, 3) if self.waits else 0.0,
+                "wait_max_ms": round(1000 * self.wait_max, 3),
+            }
+
+
+def _registry_name(role, is_async):
+    return f"{role}_async" if is_async else role
+
+
+def _metrics_for(engine):
+    for metrics in list(_METRICS.values()):
+        if metrics.engine is engine:
+            return metrics
+    return None
+
+
+def pool_stats() -> dict:
+    """Checkout / wait metrics per registered pool."""
+    return {name: metrics.snapshot() for name, metrics in list(_METRICS.items())}
+
+
+@register_collector
+def pool_metrics():
+    stats = pool_stats()
+    for name, kind, key, help in (
+        ("db_pool_size", "gauge", "pool_size", "Configured pool size."),
+        ("db_pool_checked_out", "gauge", "checked_out", "Connections currently checked out."),
+        ("db_pool_connects_total", "counter", "connects", "New DB connections opened."),
+        ("db_pool_checkouts_total", "counter", "checkouts", "Connections checked out of the pool."),
+        ("db_pool_timeouts_total", "counter", "timeouts", "Checkouts that timed out waiting for a connection."),
+        ("db_pool_waits_total", "counter", "waits", "Timed checkouts (generated SQL)."),
+        ("db_pool_wait_seconds_total", "counter", "wait_seconds", "Time spent waiting for pooled connections."),
+        ("db_pool_wait_max_ms", "gauge", "wait_max_ms", "Longest wait for a pooled connection."),
+    ):
+        yield name, kind, help, [({"pool": pool}, s[key]) for pool, s in stats.items()]
+
+
+# ------------------------
+# Engines
+# ------------------------
+def register_engine(role: str, engine):
+    """Use an engine created elsewhere (Flask-SQLAlchemy's) for a role, with metrics."""
+    with _lock:
+        _ENGINES[(role, False)] = (None, engine)
+        _METRICS[_registry_name(role, False)] = PoolMetrics(engine)
+    return engine
+
+
+def get_engine(role: str = "query"):
+    """Process-wide sync engine for a role, created on first use."""
+    uri = database_uri(role)
+    with _lock:
+        entry = _ENGINES.get((role, False))
+        # A registered engine (Flask's) wins; otherwise rebuild if the URI changed.
+        if entry is not None and entry[0] in (None, uri):
+            return entry[1]
+        engine = create_engine(uri, **engine_options(role, uri))
+        if role == "query":
+            _install_read_only(engine, SQL_MAX_EXECUTION_TIME_MS)
+        _ENGINES[(role, False)] = (uri, engine)
+        _METRICS[_registry_name(role, False)] = PoolMetrics(engine)
+        return engine
+
+
+def get_async_engine(role: str = "query"):
+    """Process-wide AsyncEngine for a role, created on first use."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    uri = database_uri(role, is_async=True)
+    with _lock:
+        entry = _ENGINES.get((role, True))
+        if entry is not None and entry[0] == uri:
+            return entry[1]
+        engine = create_async_engine(uri, **engine_options(role, uri))
+        if role == "query":
+            _install_read_only(engine.sync_engine, SQL_MAX_EXECUTION_TIME_MS)
+        _ENGINES[(role, True)] = (uri, engine)
+        _METRICS[_registry_name(role, True)] = PoolMetrics(engine.sync_engine)
+        return engine
+
+
+@contextmanager
+def timed_connect(engine):
+    """engine.connect() that records how long the pool checkout took."""
+    metrics = _metrics_for(engine)
+    start = time.perf_counter()
+    try:
+        conn = engine.connect()
+    except exc.TimeoutError:
+        if metrics is not None:
+            metrics.record_timeout()
+        raise
+    if metrics is not None:
+        metrics.record_wait(time.perf_counter() - start)
+    with conn:
+        yield conn
+
+
+@asynccontextmanager
+async def timed_connect_async(engine):
+    metrics = _metrics_for(engine.sync_engine)
+    start = time.perf_counter()
+    try:
+        conn = await engine.connect().start()
+    except exc.TimeoutError:
+        if metrics is not None:
+            metrics.record_timeout()
+        raise
+    if metrics is not None:
+        metrics.record_wait(time.perf_counter() - start)
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+# ------------------------
+# Warm-up / shutdown
+# ------------------------
+def warm_up(roles=ROLES):
+    """Open pool_size connections per role and return them to the pool."""
+    opened = 0
+    for role in roles:
+        engine = get_engine(role)
+        conns = []
+        try:
+            for _ in range(getattr(engine.pool, "size", lambda: 1)()):
+                conn = engine.connect()
+                conns.append(conn)
+                conn.execute(sql_text("SELECT 1"))
+        finally:
+            for conn in conns:
+                conn.close()
+        opened += len(conns)
+    return opened
+
+
+async def warm_up_async(roles=ROLES):
+    opened = 0
+    for role in roles:
+        engine = get_async_engine(role)
+        conns = []
+        try:
+            for _ in range(getattr(engine.sync_engine.pool, "size", lambda: 1)()):
+                conn = await engine.connect().start()
+                conns.append(conn)
+                await conn.execute(sql_text("SELECT 1"))
+        finally:
+            for conn in conns:
+                await conn.close()
+        opened += len(conns)
+    return opened
+
+
+def reset_pools(close: bool = True):
+    """
+    Empty the pool of every sync engine but keep the engines registered.
+    Before a fork, close=True closes the connections so none are inherited;
+    in a forked child, close=False drops inherited ones without closing the
+    sockets the parent still uses.
+    """
+    with _lock:
+        engines = [engine for (_, is_async), (_, engine) in _ENGINES.items() if not is_async]
+    for engine in engines:
+        engine.dispose(close=close)
+
+
+def dispose_all():
+    """Dispose and forget every sync engine in the registry (e.g. after fork)."""
+    with _lock:
+        for (role, is_async), (_, engine) in list(_ENGINES.items()):
+            if not is_async:
+                engine.dispose()
+                del _ENGINES[(role, is_async)]
+                _METRICS.pop(_registry_name(role, is_async), None)
+
+
+async def dispose_all_async():
+    with _lock:
+        engines = [(key, engine) for key, (_, engine) in _ENGINES.items() if key[1]]
+        for key, _ in engines:
+            del _ENGINES[key]
+            _METRICS.pop(_registry_name(*key), None)
+    for _, engine in engines:
+        await engine.dispose()
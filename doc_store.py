@@ -0,0 +1,194 @@
+# doc_store.py
+#
+# The retrieval docs on disk, written by build_index.py next to the FAISS
+# index: one file holding a sorted array of FAISS ids, and per column an
+# offsets array plus a UTF-8 blob. Opening it maps the file instead of
+# unpickling every doc, so open time and heap stay flat as the corpus grows,
+# worker processes share the pages through the page cache, and a lookup by
+# FAISS id decodes just that doc.
+#
+# Layout: MAGIC, the header length (uint64), a JSON header describing the
+# arrays (offsets relative to the 8-byte aligned data section), the arrays.
+# Columns: "id" and "text" always, "type" as uint8 codes into the header's
+# type names ("schema", "example"), "tables" (comma-joined) when the docs
+# carry it.
+
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+from collections.abc import Mapping
+
+import numpy as np
+
+MAGIC = b"RAGDOCS1"
+_ALIGN = 8
+_DTYPES = {"<i8", "<u8", "|u1"}
+STRING_COLUMNS = ("id", "text", "tables")
+
+
+def _align(n):
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def _doc_type(doc):
+    return doc.get("type") or str(doc.get("id", "")).split("-", 1)[0]
+
+
+class DocStore(Mapping):
+    """Read-only {faiss_id: {"id", "text", "type"[, "tables"]}} over a mapped file."""
+
+    def __init__(self, path, mm, header, data_start):
+        self.path = path
+        self._mm = mm
+        self._data_start = data_start
+        self.types = header["types"]
+        arrays = {name: self._array(spec) for name, spec in header["arrays"].items()}
+        self.ids = arrays["ids"]
+        self._type_codes = arrays["type"]
+        # Per-doc reads index memoryviews, which return plain ints (cheaper than numpy scalars).
+        self._codes = memoryview(self._type_codes)
+        self._columns = {c: (memoryview(arrays[f"{c}.offsets"]).cast("B").cast("Q"),
+                             data_start + header["arrays"][f"{c}.data"]["offset"])
+                         for c in STRING_COLUMNS if f"{c}.offsets" in arrays}
+        n = len(self.ids)
+        self._dense = n == 0 or int(self.ids[-1]) == n - 1  # ids are 0..n-1: position == id
+
+    @classmethod
+    def open(cls, path):
+        """Map a store written by write(); raises ValueError if the file is not a valid one."""
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < len(MAGIC) + 8:
+                raise ValueError(f"{path}: not a doc store (too short)")
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mm, "madvise"):
+            mm.madvise(mmap.MADV_RANDOM)  # lookups are scattered; skip readahead
+        if mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: not a doc store (bad magic)")
+        (header_len,) = struct.unpack_from("<Q", mm, len(MAGIC))
+        header_end = len(MAGIC) + 8 + header_len
+        if header_end > size:
+            raise ValueError(f"{path}: truncated header")
+        try:
+            header = json.loads(mm[len(MAGIC) + 8:header_end].decode("utf-8"))
+        except ValueError as e:
+            raise ValueError(f"{path}: unreadable header ({e})")
+        data_start = _align(header_end)
+        try:
+            _check(path, header, size - data_start)
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"{path}: malformed header ({e!r})")
+        return cls(path, mm, header, data_start)
+
+    def _array(self, spec):
+        return np.frombuffer(self._mm, dtype=spec["dtype"], count=spec["length"],
+                             offset=self._data_start + spec["offset"])
+
+    def _position(self, faiss_id):
+        faiss_id = int(faiss_id)
+        if self._dense:
+            if 0 <= faiss_id < len(self.ids):
+                return faiss_id
+        else:
+            pos = int(np.searchsorted(self.ids, faiss_id))
+            if pos < len(self.ids) and self.ids[pos] == faiss_id:
+                return pos
+        raise KeyError(faiss_id)
+
+    def _string(self, column, pos):
+        offsets, base = self._columns[column]
+        return self._mm[base + offsets[pos]:base + offsets[pos + 1]].decode("utf-8")
+
+    def text(self, faiss_id) -> str:
+        return self._string("text", self._position(faiss_id))
+
+    def __getitem__(self, faiss_id):
+        pos = self._position(faiss_id)
+        doc = {"id": self._string("id", pos), "text": self._string("text", pos),
+               "type": self.types[self._codes[pos]]}
+        if "tables" in self._columns:
+            tables = self._string("tables", pos)
+            doc["tables"] = tables.split(",") if tables else []
+        return doc
+
+    def __iter__(self):
+        return (int(i) for i in self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, faiss_id):
+        try:
+            self._position(faiss_id)
+        except (KeyError, TypeError, ValueError):
+            return False
+        return True
+
+    def ids_of_type(self, doc_type):
+        """FAISS ids of the docs of one type, in id order."""
+        if doc_type not in self.types:
+            return np.empty(0, dtype="int64")
+        return self.ids[self._type_codes == self.types.index(doc_type)]
+
+
+def _check(path, header, data_size):
+    """Reject a header whose arrays fall outside the file or disagree in length."""
+    arrays = header.get("arrays", {})
+    n = header.get("count")
+    if not isinstance(n, int) or n < 0:
+        raise ValueError(f"{path}: bad doc count")
+    for name in ("ids", "type", "id.offsets", "id.data", "text.offsets", "text.data"):
+        if name not in arrays:
+            raise ValueError(f"{path}: missing array {name}")
+    for name, spec in arrays.items():
+        if spec.get("dtype") not in _DTYPES or spec["offset"] % _ALIGN or spec["length"] < 0:
+            raise ValueError(f"{path}: bad array {name}")
+        if spec["offset"] + spec["length"] * np.dtype(spec["dtype"]).itemsize > data_size:
+            raise ValueError(f"{path}: array {name} runs past the end of the file")
+        expected = n + 1 if name.endswith(".offsets") else n if name in ("ids", "type") else None
+        if expected is not None and spec["length"] != expected:
+            raise ValueError(f"{path}: array {name} has {spec['length']} entries, expected {expected}")
+    if len(header.get("types", [])) > 256:
+        raise ValueError(f"{path}: too many doc types")
+
+
+def write(path, docs):
+    """Write docs ({faiss_id: doc} or a list, ids being positions) as a store at path."""
+    items = sorted(((int(i), d) for i, d in (docs.items() if isinstance(docs, Mapping) else enumerate(docs))),
+                   key=lambda item: item[0])
+    types = sorted({_doc_type(d) for _, d in items})
+    arrays = {"ids": np.array([i for i, _ in items], dtype="<i8"),
+              "type": np.array([types.index(_doc_type(d)) for _, d in items], dtype="|u1")}
+    columns = ["id", "text"] + (["tables"] if any("tables" in d for _, d in items) else [])
+    for column in columns:
+        values = [(",".join(d.get("tables", [])) if column == "tables" else str(d.get(column, ""))).encode("utf-8")
+                  for _, d in items]
+        offsets = np.zeros(len(values) + 1, dtype="<u8")
+        np.cumsum([len(v) for v in values], out=offsets[1:])
+        arrays[f"{column}.offsets"] = offsets
+        arrays[f"{column}.data"] = np.frombuffer(b"".join(values), dtype="|u1")
+
+    specs, position = {}, 0
+    for name, array in arrays.items():
+        specs[name] = {"offset": position, "dtype": array.dtype.str, "length": len(array)}
+        position = _align(position + array.nbytes)
+    header = json.dumps({"count": len(items), "types": types, "arrays": specs}).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for name, array in arrays.items():
+            f.write(b"\0" * (data_start + specs[name]["offset"] - f.tell()))
+            f.write(array.tobytes())
+
+
+if __name__ == "__main__":
+    # One-off conversion of a docs pickle written by older builds:
+    #   python doc_store.py data/faiss_docs.pkl data/faiss_docs.bin
+    source, target = sys.argv[1:3]
+    with open(source, "rb") as f:
+        write(target, pickle.load(f))
+    print(f"✅ {len(DocStore.open(target))} docs written to {target}")
@@ -0,0 +1,227 @@
+# embedding_cache.py
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBED_MODEL = "text-embedding-3-small"
+CACHE_DB = os.getenv("EMBED_CACHE_DB", "data/embedding_cache.sqlite")
+CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "86400"))
+# Bounds of the SQLite tier: entries kept (oldest dropped first) and their
+# age in seconds (0 disables either), enforced every DB_PRUNE_EVERY writes.
+DB_MAX_ITEMS = int(os.getenv("EMBED_CACHE_DB_MAX_ITEMS", "200000"))
+DB_TTL = float(os.getenv("EMBED_CACHE_DB_TTL", str(30 * 86400)))
+DB_PRUNE_EVERY = 1000
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and case so trivially different inputs share an entry."""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by model + normalized text.
+
+    The in-memory tier is an LRU bounded by `max_items` whose entries expire
+    after `ttl` seconds. Misses fall through to an SQLite store and only then
+    to `embed_fn`. The store keeps at most `db_max_items` entries, none older
+    than `db_ttl` seconds; it has its own lock, so disk I/O never holds up
+    lookups in the memory tier.
+
+    When `embed_batch_fn` is given, all misses of an `embed_many()` call are
+    sent to it in a single request instead of one `embed_fn` call each.
+
+    Vectors are returned as read-only float32 arrays.
+    """
+
+    def __init__(self, embed_fn, model=EMBED_MODEL, max_items=CACHE_SIZE, ttl=CACHE_TTL, db_path=CACHE_DB,
+                 embed_batch_fn=None, db_max_items=DB_MAX_ITEMS, db_ttl=DB_TTL):
+        self.embed_fn = embed_fn
+        self.embed_batch_fn = embed_batch_fn
+        self.model = model
+        self.max_items = max_items
+        self.ttl = ttl
+        self.db_path = db_path
+        self.db_max_items = db_max_items
+        self.db_ttl = db_ttl
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._db_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # ------------------------
+    # Persistent tier
+    # ------------------------
+    # Called with _db_lock held.
+    def _conn(self):
+        if self._db is None and self.db_path:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, vec BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+            self._prune()
+        return self._db
+
+    def _disk_get(self, keys):
+        """{key: vector} for the keys found on disk."""
+        if not self.db_path or not keys:
+            return {}
+        with self._db_lock:
+            conn = self._conn()
+            found = {}
+            for key in keys:
+                row = conn.execute("SELECT vec FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row:
+                    found[key] = np.frombuffer(row[0], dtype="float32")
+            return found
+
+    def _disk_put(self, items):
+        if not self.db_path or not items:
+            return
+        now = time.time()
+        with self._db_lock:
+            conn = self._conn()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vec, created_at) VALUES (?, ?, ?, ?)",
+                [(key, self.model, vec.tobytes(), now) for key, vec in items],
+            )
+            conn.commit()
+            self._db_writes += len(items)
+            if self._db_writes >= DB_PRUNE_EVERY:
+                self._prune()
+
+    def _prune(self):
+        """Drop entries past db_ttl, then the oldest beyond db_max_items."""
+        conn, self._db_writes = self._db, 0
+        if self.db_ttl:
+            conn.execute("DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.db_ttl,))
+        if self.db_max_items:
+            (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.db_max_items:
+                conn.execute("DELETE FROM embeddings WHERE key IN "
+                             "(SELECT key FROM embeddings ORDER BY created_at LIMIT ?)", (count - self.db_max_items,))
+        conn.commit()
+
+    # ------------------------
+    # Memory tier
+    # ------------------------
+    def _mem_get(self, key):
+        entry = self._lru.get(key)
+        if entry is None:
+            return None
+        expires_at, vec = entry
+        if expires_at < time.monotonic():
+            del self._lru[key]
+            return None
+        self._lru.move_to_end(key)
+        return vec
+
+    def _mem_put(self, key, vec):
+        self._lru[key] = (time.monotonic() + self.ttl, vec)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    # ------------------------
+    # Public API
+    # ------------------------
+    def embed(self, text: str):
+        return self.embed_many([text])[0]
+
+    def get(self, text: str):
+        """Cached vector for text, or None. For callers that fetch misses themselves (e.g. async)."""
+        return self._lookup([cache_key(self.model, text)])[0]
+
+    def put(self, text: str, vec):
+        """Store a vector fetched by the caller after a get() miss; returns the cached array."""
+        key = cache_key(self.model, text)
+        vec = np.asarray(vec, dtype="float32")
+        vec.flags.writeable = False
+        with self._lock:
+            self._mem_put(key, vec)
+        self._disk_put([(key, vec)])
+        return vec
+
+    def _lookup(self, keys):
+        """Cached vector (or None) per key: memory tier, then disk outside the memory lock."""
+        with self._lock:
+            results = [self._mem_get(key) for key in keys]
+        on_disk = self._disk_get({key for key, vec in zip(keys, results) if vec is None})
+        with self._lock:
+            for i, key in enumerate(keys):
+                if results[i] is None and key in on_disk:
+                    results[i] = on_disk[key]
+                    self.disk_hits += 1
+                    self._mem_put(key, on_disk[key])
+                if results[i] is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+        return results
+
+    def embed_many(self, texts):
+        """Embed a list of texts, calling the upstream only for texts not cached."""
+        keys = [cache_key(self.model, t) for t in texts]
+        results = self._lookup(keys)
+        missing = {}
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            pending = [texts[positions[0]] for positions in missing.values()]
+            if self.embed_batch_fn is not None:
+                vectors = self.embed_batch_fn(pending)
+            else:
+                vectors = [self.embed_fn(t) for t in pending]
+
+            fresh = []
+            for (key, positions), vec in zip(missing.items(), vectors):
+                vec = np.asarray(vec, dtype="float32")
+                vec.flags.writeable = False
+                fresh.append((key, vec))
+                for i in positions:
+                    results[i] = vec
+            with self._lock:
+                for key, vec in fresh:
+                    self._mem_put(key, vec)
+            self._disk_put(fresh)
+
+        return results
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._lru),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
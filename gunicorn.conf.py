@@ -0,0 +1,31 @@
+# gunicorn.conf.py
+#
+#   gunicorn app:app
+#
+# Picked up from the working directory. The app is imported and warmed up
+# (warmup.py) once in the master, then the workers are forked: they share
+# the index, docs and models copy-on-write, open only their own DB pools,
+# and report ready on GET /ready.
+
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "gthread"
+# Also sizes each worker's query pool (db_engines.WORKER_THREADS).
+threads = int(os.getenv("WORKER_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = True
+
+
+def on_starting(server):
+    import warmup
+
+    warmup.warm_up()
+    warmup.prepare_fork()
+
+
+def post_fork(server, worker):
+    import warmup
+
+    warmup.warm_up_worker()
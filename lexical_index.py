@@ -0,0 +1,179 @@
+# lexical_index.py
+#
+# BM25 inverted index over the retrieval docs, built next to the FAISS index
+# by build_index.py. Exact identifiers (table and column names, cities,
+# project names) rank well here even when the embedding does not, and a
+# lexical search needs no embedding call at all.
+
+import os
+import re
+from collections.abc import Mapping
+
+import numpy as np
+from dotenv import load_dotenv
+
+from sql_validator import SCHEMA
+
+load_dotenv()
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text: str):
+    """Lowercased words; snake_case identifiers also contribute their parts."""
+    tokens = []
+    for word in _WORD_RE.findall(text.lower()):
+        tokens.append(word)
+        if "_" in word:
+            tokens.extend(p for p in word.split("_") if p)
+    return tokens
+
+
+def _csr(groups, n_rows):
+    """Flatten {row: [(col, value), ...]} into CSR offsets / columns / values arrays."""
+    offsets = np.zeros(n_rows + 1, dtype="int64")
+    for row, items in groups.items():
+        offsets[row + 1] = len(items)
+    np.cumsum(offsets, out=offsets)
+    cols = np.empty(offsets[-1], dtype="int32")
+    vals = np.empty(offsets[-1], dtype="float32")
+    for row, items in groups.items():
+        s = offsets[row]
+        for j, (col, val) in enumerate(items):
+            cols[s + j] = col
+            vals[s + j] = val
+    return offsets, cols, vals
+
+
+class BM25Index:
+    """
+    Inverted index with precomputed BM25 impacts.
+
+    Postings are stored CSR-style (one offsets array, one doc-position array,
+    one float32 weight array), so the whole index is a handful of numpy arrays
+    in a single .npz file and a query is a few vector adds. A second inverted
+    list maps each schema table to the docs that mention it, which is what the
+    required_tables filter in retriever.py looks up.
+    """
+
+    def __init__(self, ids, terms, offsets, postings, weights, tables, table_offsets, table_postings):
+        self.ids = ids  # doc position -> FAISS id
+        self.terms = terms
+        self.vocab = {t: i for i, t in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.weights = weights
+        self.tables = tables
+        self.table_offsets = table_offsets
+        self.table_postings = table_postings
+
+    @classmethod
+    def build(cls, docs, k1=BM25_K1, b=BM25_B):
+        """Index docs given as {faiss_id: {"text": ...}} or a DocStore (or a list, ids being positions)."""
+        items = docs.items() if isinstance(docs, Mapping) else enumerate(docs)
+        ids, texts = [], []
+        for faiss_id, doc in items:
+            ids.append(int(faiss_id))
+            texts.append(doc["text"])
+
+        counts, lengths = [], []
+        for text in texts:
+            tokens = tokenize(text)
+            tf = {}
+            for t in tokens:
+                tf[t] = tf.get(t, 0) + 1
+            counts.append(tf)
+            lengths.append(len(tokens))
+        n = len(texts)
+        avgdl = (sum(lengths) / n) if n else 1.0
+
+        df = {}
+        for tf in counts:
+            for t in tf:
+                df[t] = df.get(t, 0) + 1
+        terms = sorted(df)
+        term_row = {t: i for i, t in enumerate(terms)}
+
+        groups = {}
+        for pos, tf in enumerate(counts):
+            norm = k1 * (1 - b + b * lengths[pos] / avgdl)
+            for t, f in tf.items():
+                idf = np.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+                groups.setdefault(term_row[t], []).append((pos, idf * f * (k1 + 1) / (f + norm)))
+        offsets, postings, weights = _csr(groups, len(terms))
+
+        tables = sorted(SCHEMA)
+        table_groups = {}
+        for pos, tf in enumerate(counts):
+            for i, table in enumerate(tables):
+                if table in tf:
+                    table_groups.setdefault(i, []).append((pos, 1.0))
+        table_offsets, table_postings, _ = _csr(table_groups, len(tables))
+
+        return cls(np.array(ids, dtype="int64"), terms, offsets, postings, weights,
+                   tables, table_offsets, table_postings)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(
+                f, ids=self.ids, offsets=self.offsets, postings=self.postings, weights=self.weights,
+                terms=np.frombuffer("\n".join(self.terms).encode("utf-8"), dtype="uint8"),
+                tables=np.frombuffer("\n".join(self.tables).encode("utf-8"), dtype="uint8"),
+                table_offsets=self.table_offsets, table_postings=self.table_postings,
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            terms = z["terms"].tobytes().decode("utf-8")
+            tables = z["tables"].tobytes().decode("utf-8")
+            return cls(z["ids"], terms.split("\n") if terms else [], z["offsets"], z["postings"], z["weights"],
+                       tables.split("\n") if tables else [], z["table_offsets"], z["table_postings"])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query: str, k: int):
+        """Top-k FAISS ids by BM25 score (docs sharing no term with the query are left out)."""
+        scores = np.zeros(len(self.ids), dtype="float32")
+        for term in set(tokenize(query)):
+            row = self.vocab.get(term)
+            if row is not None:
+                s, e = self.offsets[row], self.offsets[row + 1]
+                scores[self.postings[s:e]] += self.weights[s:e]
+        hits = np.flatnonzero(scores)
+        if 0 < k < len(hits):
+            # Partition around the k-th best score and sort only the top k; ties at
+            # that score go to the earliest docs, as a full stable sort would.
+            kth = np.partition(scores[hits], len(hits) - k)[len(hits) - k]
+            above = hits[scores[hits] > kth]
+            hits = np.concatenate([above, hits[scores[hits] == kth][:k - len(above)]])
+        top = hits[np.argsort(-scores[hits], kind="stable")[:k]]
+        return self.ids[top], scores[top]
+
+    def ids_with_tables(self, tables, mode="any"):
+        """FAISS ids of docs mentioning any / all of the given tables."""
+        sets = []
+        for table in tables:
+            table = table.lower()
+            if table in self.tables:
+                i = self.tables.index(table)
+                rows = self.table_postings[self.table_offsets[i]:self.table_offsets[i + 1]]
+            else:
+                rows = np.empty(0, dtype="int32")
+            sets.append(set(self.ids[rows].tolist()))
+        if not sets:
+            return set(self.ids.tolist())
+        return set.intersection(*sets) if mode == "all" else set.union(*sets)
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60):
+    """Fuse ranked id lists: score(id) = sum over lists of 1 / (k + rank)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda d: -scores[d])
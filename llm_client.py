@@ -0,0 +1,489 @@
+# llm_client.py
+#
+# The pipeline's way to OpenAI. Clients are built on first use, so
+# importing rag / retriever needs neither an API key nor the client setup,
+# and under a pre-forking server each worker builds its own client (and
+# keep-alive connection pool) after the fork.
+#
+# LLMClient wraps a client for the sync pipeline:
+#   - a per-call timeout and a bounded retry count (the SDK defaults are
+#     10 minutes and 2 retries)
+#   - token buckets on requests and tokens per minute, so a burst queues
+#     here instead of drawing 429s
+#   - hedging: a non-streamed chat call still running past the recent
+#     LLM_HEDGE_PERCENTILE latency for its purpose gets a duplicate request,
+#     and the first good response wins; the duplicate is charged to the
+#     buckets too and is skipped when they have no room for it right away
+#   - a circuit breaker: after LLM_BREAKER_FAILURES upstream failures in a
+#     row (timeouts, connection errors, 5xx) calls fail fast with
+#     LLMUnavailable for LLM_BREAKER_RESET seconds, then one trial call
+#     decides whether to close it. Callers fall back on LLMUnavailable.
+#
+# AsyncLLMClient does the same for the asyncio pipeline (rag_async.py) and
+# shares the sync client's breaker, buckets and latency windows, so one
+# process has one view of OpenAI's health and one set of limits.
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+from dotenv import load_dotenv
+
+from metrics import Counter, Histogram, register_collector
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Seconds per OpenAI call (read / connect), and SDK retries on 429 / 5xx / connection errors.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Keep-alive pool per process.
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "16"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+# Requests and chat tokens per minute, per process (0 disables), and the
+# longest a call queues for them before failing with LLMUnavailable.
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "10"))
+# Completion tokens counted against LLM_TPM until the response reports usage.
+COMPLETION_TOKENS_ESTIMATE = 256
+# Latency percentile past which a chat call is hedged (0 disables), and the
+# recent calls per purpose it is taken from (no hedging until MIN_SAMPLES).
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_WINDOW = 200
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+LLM_CALLS = Counter("rag_llm_calls_total", "OpenAI calls by purpose and outcome.", ("purpose", "outcome"))
+LLM_HEDGES = Counter("rag_llm_hedges_total", "Hedged chat calls, by which request answered first "
+                     "(not_admitted: the limits had no room for the duplicate).",
+                     ("purpose", "winner"))
+LLM_QUEUE_SECONDS = Histogram("rag_llm_queue_seconds", "Time calls waited for the request / token limits.")
+
+
+class LLMUnavailable(RuntimeError):
+    """The upstream is failing or the circuit is open; use a fallback."""
+
+
+# ------------------------
+# Clients
+# ------------------------
+class LazyClient:
+    """Stands in for a client object: the factory runs on the first attribute access."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def client_options(is_async=False) -> dict:
+    """Timeout, retry and connection-pool settings for OpenAI() / AsyncOpenAI()."""
+    import openai
+
+    # openai's HTTP library Limits class (httpx.Limits), however it is packaged.
+    limits = type(openai.DEFAULT_CONNECTION_LIMITS)(max_connections=LLM_MAX_CONNECTIONS,
+                                                    max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+                                                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY)
+    http_client = openai.DefaultAsyncHttpxClient if is_async else openai.DefaultHttpxClient
+    return {"timeout": openai.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT), "max_retries": LLM_MAX_RETRIES,
+            "http_client": http_client(limits=limits)}
+
+
+def _openai():
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), **client_options())
+
+
+def _async_openai():
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), **client_options(is_async=True))
+
+
+def preload():
+    """
+    Import what building and calling a client imports lazily (most of the
+    openai package), without keeping a client: one built before a fork would
+    share its connection pool with the children.
+    """
+    from openai import AsyncOpenAI, OpenAI
+
+    for cls in (OpenAI, AsyncOpenAI):
+        client = cls(api_key="preload")
+        client.chat.completions, client.embeddings
+
+
+def openai_client() -> LazyClient:
+    return LazyClient(_openai)
+
+
+def async_openai_client() -> LazyClient:
+    return LazyClient(_async_openai)
+
+
+# ------------------------
+# Limits, latency, breaker
+# ------------------------
+class TokenBucket:
+    """per_minute units refilled evenly, holding at most a minute's worth."""
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, n, max_wait=None) -> float:
+        """
+        Take n units, borrowing against the refill if needed; returns the
+        seconds to wait before using them, or None (nothing taken) if that is
+        longer than max_wait.
+        """
+        with self._lock:
+            now = self.clock()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            wait_s = max(0.0, (n - self.level) / self.rate)
+            if max_wait is not None and wait_s > max_wait:
+                return None
+            self.level -= n
+            return wait_s
+
+    def refund(self, n):
+        """Give back units taken on an estimate (a negative n takes more)."""
+        with self._lock:
+            self.level = min(self.capacity, self.level + n)
+
+
+class LatencyWindow:
+    """Recent call latencies, for the hedging threshold."""
+
+    def __init__(self, size=LLM_HEDGE_WINDOW):
+        self._values = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._values.append(seconds)
+
+    def percentile(self, p, min_samples=LLM_HEDGE_MIN_SAMPLES):
+        with self._lock:
+            values = sorted(self._values)
+        if len(values) < min_samples:
+            return None
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class CircuitBreaker:
+    """closed -> open after `failures` failures in a row -> half-open (one trial call) after `reset` seconds."""
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, reset=LLM_BREAKER_RESET, clock=time.monotonic):
+        self.failures = failures
+        self.reset = reset
+        self.clock = clock
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self.clock() - self._opened_at >= self.reset:
+                self.state = "half_open"
+                return True
+            return False
+
+    def release(self):
+        """Hand back a half-open trial slot whose call was never sent."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._consecutive = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self.state == "half_open" or self._consecutive >= self.failures:
+                if self.state != "open":
+                    logger.warning("OpenAI circuit open after %d failures", self._consecutive)
+                self.state = "open"
+                self._opened_at = self.clock()
+
+
+# ------------------------
+# Wrapper
+# ------------------------
+def _upstream_errors():
+    import openai
+    # APITimeoutError is an APIConnectionError; 4xx other than 429 mean the upstream is up.
+    return openai.APIConnectionError, openai.InternalServerError
+
+
+class LLMClient:
+    """Rate-limited, hedged, circuit-broken calls through `client` (an OpenAI client or LazyClient)."""
+
+    def __init__(self, client, rpm=LLM_RPM, tpm=LLM_TPM, hedge_percentile=LLM_HEDGE_PERCENTILE,
+                 breaker=None, timeout=LLM_TIMEOUT, max_queue_wait=LLM_MAX_QUEUE_WAIT):
+        self.client = client
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker()
+        self.timeout = timeout
+        self.max_queue_wait = max_queue_wait
+        self.latencies = {}  # purpose -> LatencyWindow
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def chat(self, messages, model, purpose="chat", stream=False, hedge=True, **kwargs):
+        """chat.completions.create(); non-streamed calls may be hedged."""
+        estimate = 0
+        if self.tokens is not None:
+            from context_builder import message_tokens
+            estimate = message_tokens(messages) + kwargs.get("max_tokens", COMPLETION_TOKENS_ESTIMATE)
+
+        def create():
+            return self.client.chat.completions.create(model=model, messages=messages, stream=stream,
+                                                       timeout=self.timeout, **kwargs)
+
+        resp = self._call(purpose, create, estimate, hedge=hedge and not stream)
+        if estimate and not stream and getattr(resp, "usage", None) is not None:
+            self.tokens.refund(estimate - resp.usage.total_tokens)
+        return resp
+
+    def embeddings(self, input, model, purpose="embed"):
+        """embeddings.create(); counted against the request limit only."""
+        return self._call(purpose, lambda: self.client.embeddings.create(model=model, input=input,
+                                                                         timeout=self.timeout), 0, hedge=False)
+
+    def _call(self, purpose, fn, tokens, hedge):
+        self._admit(purpose, tokens)
+        try:
+            result = self._hedged(purpose, fn, tokens) if hedge else self._timed(purpose, fn)
+        except Exception as e:
+            raise self.failed(purpose, e)
+        self.breaker.record_success()
+        LLM_CALLS.inc(purpose=purpose, outcome="ok")
+        return result
+
+    def failed(self, purpose, error) -> Exception:
+        """
+        Record a call that raised `error` (also one that failed while a stream
+        was read); returns the exception to raise: LLMUnavailable for upstream
+        failures, which count against the breaker, otherwise the error itself.
+        """
+        if isinstance(error, LLMUnavailable):
+            return error
+        if isinstance(error, _upstream_errors()):
+            self.breaker.record_failure()
+            LLM_CALLS.inc(purpose=purpose, outcome="failed")
+            unavailable = LLMUnavailable(f"OpenAI {purpose} call failed: {error.__class__.__name__}")
+            unavailable.__cause__ = error
+            return unavailable
+        # Rate limited or rejected: the upstream answered, so this is not a health failure.
+        self.breaker.record_success()
+        LLM_CALLS.inc(purpose=purpose, outcome="error")
+        return error
+
+    def _admit(self, purpose, tokens):
+        waited = self._reserve(purpose, tokens)
+        if waited:
+            time.sleep(waited)
+
+    def _reserve(self, purpose, tokens) -> float:
+        """Take a request and `tokens` from the buckets; returns the seconds to wait before sending."""
+        if not self.breaker.allow():
+            LLM_CALLS.inc(purpose=purpose, outcome="rejected")
+            raise LLMUnavailable("OpenAI circuit open")
+        waited, taken = 0.0, []
+        for bucket, n in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is None or not n:
+                continue
+            wait_s = bucket.reserve(n, self.max_queue_wait - waited)
+            if wait_s is None:
+                # Not sent: give back what was taken, and the half-open trial, or the breaker never closes.
+                for b, m in taken:
+                    b.refund(m)
+                self.breaker.release()
+                LLM_CALLS.inc(purpose=purpose, outcome="throttled")
+                raise LLMUnavailable(f"OpenAI {purpose} call would queue over {self.max_queue_wait:.0f} s")
+            taken.append((bucket, n))
+            waited += wait_s
+        if waited:
+            LLM_QUEUE_SECONDS.observe(waited)
+        return waited
+
+    def _admit_now(self, tokens) -> bool:
+        """Take one request and `tokens` only if both are available without waiting (for hedges)."""
+        if self.requests is not None and self.requests.reserve(1, 0) is None:
+            return False
+        if self.tokens is not None and tokens and self.tokens.reserve(tokens, 0) is None:
+            if self.requests is not None:
+                self.requests.refund(1)
+            return False
+        return True
+
+    def _window(self, purpose):
+        window = self.latencies.get(purpose)
+        if window is None:
+            window = self.latencies.setdefault(purpose, LatencyWindow())
+        return window
+
+    def _timed(self, purpose, fn):
+        start = time.perf_counter()
+        result = fn()
+        self._window(purpose).add(time.perf_counter() - start)
+        return result
+
+    def _pool(self):
+        # Created on first hedge, so after any fork.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(LLM_MAX_CONNECTIONS, thread_name_prefix="llm-hedge")
+            return self._executor
+
+    def _hedged(self, purpose, fn, tokens=0):
+        delay = self._window(purpose).percentile(self.hedge_percentile) if self.hedge_percentile else None
+        if delay is None:
+            return self._timed(purpose, fn)
+        pool = self._pool()
+        first = pool.submit(contextvars.copy_context().run, self._timed, purpose, fn)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        if not self._admit_now(tokens):
+            # No room under LLM_RPM / LLM_TPM: a duplicate now would only draw a 429.
+            LLM_HEDGES.inc(purpose=purpose, winner="not_admitted")
+            return first.result()
+        # The slower request is left to finish on its own; its result is dropped.
+        second = pool.submit(contextvars.copy_context().run, self._timed, purpose, fn)
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    LLM_HEDGES.inc(purpose=purpose, winner="hedge" if future is second else "first")
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+
+class AsyncLLMClient:
+    """
+    LLMClient's counterpart for an AsyncOpenAI client: the same limits,
+    hedging and breaker, taken from `limits` (an LLMClient) so both pipelines
+    of a process share them. A losing hedge is cancelled.
+    """
+
+    def __init__(self, client, limits):
+        self.client = client
+        self.limits = limits
+
+    async def chat(self, messages, model, purpose="chat", hedge=True, **kwargs):
+        """chat.completions.create() (not streamed); may be hedged."""
+        limits, estimate = self.limits, 0
+        if limits.tokens is not None:
+            from context_builder import message_tokens
+            estimate = message_tokens(messages) + kwargs.get("max_tokens", COMPLETION_TOKENS_ESTIMATE)
+
+        def create():
+            return self.client.chat.completions.create(model=model, messages=messages, timeout=limits.timeout,
+                                                       **kwargs)
+
+        resp = await self._call(purpose, create, estimate, hedge)
+        if estimate and getattr(resp, "usage", None) is not None:
+            limits.tokens.refund(estimate - resp.usage.total_tokens)
+        return resp
+
+    async def embeddings(self, input, model, purpose="embed"):
+        """embeddings.create(); counted against the request limit only."""
+        return await self._call(purpose, lambda: self.client.embeddings.create(model=model, input=input,
+                                                                               timeout=self.limits.timeout),
+                                0, hedge=False)
+
+    async def _call(self, purpose, fn, tokens, hedge):
+        limits = self.limits
+        waited = limits._reserve(purpose, tokens)
+        if waited:
+            await asyncio.sleep(waited)
+        try:
+            result = await (self._hedged(purpose, fn, tokens) if hedge else self._timed(purpose, fn))
+        except Exception as e:
+            raise limits.failed(purpose, e)
+        limits.breaker.record_success()
+        LLM_CALLS.inc(purpose=purpose, outcome="ok")
+        return result
+
+    async def _timed(self, purpose, fn):
+        start = time.perf_counter()
+        result = await fn()
+        self.limits._window(purpose).add(time.perf_counter() - start)
+        return result
+
+    async def _hedged(self, purpose, fn, tokens):
+        limits = self.limits
+        delay = limits._window(purpose).percentile(limits.hedge_percentile) if limits.hedge_percentile else None
+        if delay is None:
+            return await self._timed(purpose, fn)
+        first = asyncio.ensure_future(self._timed(purpose, fn))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        if not limits._admit_now(tokens):
+            LLM_HEDGES.inc(purpose=purpose, winner="not_admitted")
+            return await first
+        second = asyncio.ensure_future(self._timed(purpose, fn))
+        pending, error = {first, second}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        LLM_HEDGES.inc(purpose=purpose, winner="hedge" if task is second else "first")
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+@register_collector
+def breaker_metrics():
+    yield ("rag_llm_circuit_open", "gauge", "1 while OpenAI calls fail fast (half-open counts as open).",
+           [({}, 0 if llm.breaker.state == "closed" else 1)])
+
+
+# Shared by rag.py and retriever.py (and, through allm, rag_async.py), so one
+# breaker and one set of limits per process.
+llm = LLMClient(openai_client())
+allm = AsyncLLMClient(async_openai_client(), llm)
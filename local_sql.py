@@ -0,0 +1,277 @@
+# local_sql.py
+#
+# Confidence-gated SQL generation from the classifier trained by
+# train_model.py. The classifier picks a known query; literals compared with
+# slot columns (department, country, ...) are swapped for the values named in
+# the question. Anything uncertain falls through to the LLM. The model is the
+# current snapshot in LOCAL_SQL_SNAPSHOTS when one was published (and is
+# swapped for a newer one while serving), otherwise the files in models/.
+
+import logging
+import os
+import re
+import threading
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import text as sql_text
+
+from sql_validator import analyze_sql, canonicalize_sql, scan_sql
+from train_model import CLF_PATH, SNAPSHOT_DIR, VEC_PATH, current_snapshot, load_snapshot
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+LOCAL_SQL_ENABLED = os.getenv("LOCAL_SQL", "1") == "1"
+# Minimum classifier probability (summed over classes sharing a template) to skip the LLM.
+LOCAL_SQL_THRESHOLD = float(os.getenv("LOCAL_SQL_THRESHOLD", "0.7"))
+# Gate used instead when the LLM is unavailable (circuit open): a less certain
+# local query beats no answer.
+LOCAL_SQL_FALLBACK_THRESHOLD = float(os.getenv("LOCAL_SQL_FALLBACK_THRESHOLD", "0.3"))
+# Seconds between checks for a newer model snapshot.
+LOCAL_SQL_RELOAD_INTERVAL = float(os.getenv("LOCAL_SQL_RELOAD_INTERVAL", "5"))
+
+# Columns whose compared literals are filled from the question; other literals
+# (dates, LIKE patterns, numbers) are part of the template.
+SLOT_COLUMNS = ("department", "country", "state", "city", "project_name", "first_name", "last_name")
+SLOT_QUERIES = {
+    "department": "SELECT DISTINCT department FROM employees",
+    "country": "SELECT DISTINCT country FROM employee_addresses",
+    "state": "SELECT DISTINCT state FROM employee_addresses",
+    "city": "SELECT DISTINCT city FROM employee_addresses",
+    "project_name": "SELECT DISTINCT project_name FROM employee_projects",
+}
+SLOT_VALUES_LIMIT = 5000
+
+
+# ------------------------
+# Templates
+# ------------------------
+def sql_template(sql: str):
+    """
+    Locate slot literals in a query.
+
+    Returns (sql, slots) where slots is a list of (start, end, column, value)
+    for every `column = '...'` / `column <> '...'` with column in SLOT_COLUMNS.
+    """
+    tokens = [t for t in scan_sql(sql) if t[0] != "comment"]
+    slots = []
+    for i, (kind, value, start, end) in enumerate(tokens):
+        if kind != "string" or i < 2:
+            continue
+        op, column = tokens[i - 1], tokens[i - 2]
+        if op[0] == "op" and op[1] in ("=", "<>", "!=") and column[0] == "name" and column[1] in SLOT_COLUMNS:
+            slots.append((start, end, column[1], value[1:-1].replace("''", "'")))
+    return sql, slots
+
+
+def template_key(sql: str, slots) -> str:
+    """Canonical text of a template, so queries differing only in slot values share a key."""
+    out, pos = [], 0
+    for start, end, column, _ in slots:
+        out.append(sql[pos:start])
+        out.append(f"'{{{column}}}'")
+        pos = end
+    out.append(sql[pos:])
+    return canonicalize_sql("".join(out))
+
+
+def fill_template(sql: str, slots, values) -> str:
+    """Substitute values[column] (a list, consumed in order) into the template's slots."""
+    queues = {column: list(vals) for column, vals in values.items()}
+    out, pos = [], 0
+    for start, end, column, _ in slots:
+        value = queues[column].pop(0)
+        out.append(sql[pos:start])
+        out.append("'" + value.replace("\\", "\\\\").replace("'", "''") + "'")
+        pos = end
+    out.append(sql[pos:])
+    return "".join(out)
+
+
+def find_slot_values(question: str, patterns) -> dict:
+    """Known slot values named in the question, per column, in order of appearance."""
+    found = {}
+    for column, (pattern, canonical) in patterns.items():
+        hits = [canonical[m.group(0).lower()] for m in pattern.finditer(question)]
+        if hits:
+            found[column] = hits
+    return found
+
+
+def _compile_vocab(vocab):
+    patterns = {}
+    for column, values in vocab.items():
+        values = sorted({v for v in values if v and v.strip()}, key=len, reverse=True)
+        if values:
+            pattern = re.compile(r"\b(?:" + "|".join(re.escape(v) for v in values) + r")\b", re.IGNORECASE)
+            patterns[column] = (pattern, {v.lower(): v for v in values})
+    return patterns
+
+
+# ------------------------
+# Generator
+# ------------------------
+class LocalSqlGenerator:
+    """
+    Loads the vectorizer/classifier once and answers questions locally when
+    the predicted template is confident and its slots can be filled.
+
+    slot_source: optional zero-argument callable returning a SQLAlchemy engine;
+    when given, slot vocabularies are extended with the distinct values in the
+    database on first use. Without it only the literals seen in training are known.
+
+    When snapshot_dir has a published snapshot it is used instead of the
+    files, and checked every reload_interval seconds for a newer version,
+    which replaces the model in place.
+    """
+
+    def __init__(self, vec_path=VEC_PATH, clf_path=CLF_PATH, threshold=LOCAL_SQL_THRESHOLD,
+                 slot_source=None, model=None, snapshot_dir=SNAPSHOT_DIR,
+                 reload_interval=LOCAL_SQL_RELOAD_INTERVAL):
+        self.vec_path = vec_path
+        self.clf_path = clf_path
+        self.threshold = threshold
+        self.slot_source = slot_source
+        self.snapshot_dir = snapshot_dir
+        self.reload_interval = reload_interval
+        self._model = model
+        self.clf = None
+        self.version = None
+        self._state = None  # (vec, clf, templates, class_keys, patterns), swapped as one
+        self._db_vocab = None
+        self._last_check = 0.0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._stats = {"local": 0, "low_confidence": 0, "slot_mismatch": 0, "invalid": 0, "time": 0.0}
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            self._last_check = time.monotonic()
+            snapshot = current_snapshot(self.snapshot_dir) if self._model is None and self.snapshot_dir else None
+            if snapshot is not None:
+                payload = load_snapshot(snapshot[1])
+                self._install(payload["vec"], payload["clf"], payload.get("vocab"))
+                self.version = snapshot[0]
+                return
+            if self._model is None and not (os.path.exists(self.vec_path) and os.path.exists(self.clf_path)):
+                logger.warning("Local SQL disabled: no model at %s (run train_model.py)", self.clf_path)
+                self.clf = None
+                return
+            if self._model is None:
+                import joblib
+            self._install(*(self._model or (joblib.load(self.vec_path), joblib.load(self.clf_path))))
+
+    def _install(self, vec, clf, slot_values=None):
+        # Classes that differ only in slot values share one template; their
+        # probabilities are summed at prediction time. Online snapshots carry
+        # one class per template, and the slot values seen in slot_values.
+        templates, keys = {}, []
+        vocab = {c: set((slot_values or {}).get(c, ())) for c in SLOT_COLUMNS}
+        for sql in clf.classes_:
+            sql, slots = sql_template(sql)
+            key = template_key(sql, slots)
+            templates.setdefault(key, (sql, slots))
+            keys.append(key)
+            for _, _, column, value in slots:
+                vocab[column].add(value)
+        if self.slot_source is not None:
+            if self._db_vocab is None:
+                self._db_vocab = {c: set() for c in SLOT_COLUMNS}
+                self._load_db_vocab(self._db_vocab)
+            for column, values in self._db_vocab.items():
+                vocab[column] |= values
+
+        self._state = (vec, clf, templates, keys, _compile_vocab(vocab))
+        self.clf = clf
+
+    def _maybe_reload(self):
+        """Swap in a newer snapshot if one was published; one thread checks, the others keep serving."""
+        if self._model is not None or not self.snapshot_dir:
+            return
+        if time.monotonic() - self._last_check < self.reload_interval or not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = time.monotonic()
+            snapshot = current_snapshot(self.snapshot_dir)
+            if snapshot is not None and snapshot[0] != self.version:
+                payload = load_snapshot(snapshot[1])
+                self._install(payload["vec"], payload["clf"], payload.get("vocab"))
+                self.version = snapshot[0]
+                logger.info("Local SQL: loaded model snapshot %s", snapshot[0])
+        except Exception as e:
+            logger.warning("Local SQL: snapshot not reloaded (%s)", e)
+        finally:
+            self._reload_lock.release()
+
+    def preload(self) -> bool:
+        """Load the model and slot values now (server warm-up) rather than on the first question."""
+        self._load()
+        return self.clf is not None
+
+    def _load_db_vocab(self, vocab):
+        try:
+            with self.slot_source().connect() as conn:
+                for column, query in SLOT_QUERIES.items():
+                    rows = conn.execute(sql_text(f"{query} LIMIT {SLOT_VALUES_LIMIT}"))
+                    vocab[column].update(str(r[0]) for r in rows if r[0] is not None)
+        except Exception as e:
+            logger.warning("Local SQL: slot values not loaded from DB (%s)", e)
+
+    def predict(self, question: str):
+        """Most likely template for a question: ((sql, slots), probability)."""
+        self._load()
+        self._maybe_reload()
+        vec, clf, templates, class_keys, _ = self._state
+        probs = clf.predict_proba(vec.transform([question]))[0]
+        by_key = {}
+        for key, p in zip(class_keys, probs):
+            by_key[key] = by_key.get(key, 0.0) + p
+        key = max(by_key, key=by_key.get)
+        return templates[key], by_key[key]
+
+    def generate(self, question: str, threshold: float = None):
+        """SQL for the question, or None when the LLM should handle it. threshold overrides the gate."""
+        start = time.perf_counter()
+        try:
+            return self._generate(question, self.threshold if threshold is None else threshold)
+        finally:
+            self._stats["time"] += time.perf_counter() - start
+
+    def _generate(self, question, threshold):
+        self._load()
+        self._maybe_reload()
+        if self.clf is None:
+            return None
+        (sql, slots), prob = self.predict(question)
+        if prob < threshold:
+            self._stats["low_confidence"] += 1
+            return None
+
+        # Every slot of the template must get exactly one value from the question,
+        # and the question must not name values the template has no slot for.
+        needed = {}
+        for _, _, column, _ in slots:
+            needed[column] = needed.get(column, 0) + 1
+        found = find_slot_values(question, self._state[4])
+        if {c: len(v) for c, v in found.items()} != needed:
+            self._stats["slot_mismatch"] += 1
+            return None
+
+        sql = fill_template(sql, slots, found)
+        if not analyze_sql(sql).valid:
+            self._stats["invalid"] += 1
+            return None
+        self._stats["local"] += 1
+        return sql
+
+    def stats(self) -> dict:
+        total = self._stats["local"] + self._stats["low_confidence"] + self._stats["slot_mismatch"] + self._stats["invalid"]
+        out = {k: v for k, v in self._stats.items() if k != "time"}
+        out["hit_rate"] = self._stats["local"] / total if total else 0.0
+        out["avg_ms"] = 1000 * self._stats["time"] / total if total else 0.0
+        return out
@@ -0,0 +1,233 @@
+# metrics.py
+#
+# Per-stage timing for the RAG pipeline: spans around embedding, search, SQL
+# generation / repair, DB execution, summarization and persistence feed
+# Prometheus histograms served by /metrics, and a sampled fraction of
+# requests is logged as a full trace. Each worker process exports its own
+# registry (scrape every worker, or aggregate by instance).
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS", "1") == "1"
+# Fraction of requests whose spans are logged as one JSON trace (0 disables),
+# and how many sampled traces are kept for /metrics/traces.
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "100"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+logger = logging.getLogger(__name__)
+_registry = []
+_collectors = []
+_trace = ContextVar("rag_trace", default=None)
+recent_traces = deque(maxlen=TRACE_KEEP)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter with fixed label names."""
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda kv: tuple(map(str, kv[0])))
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+class Histogram:
+    """Bucketed histogram with fixed label names, rendered with cumulative buckets."""
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [per-bucket counts..., +Inf count, sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        series = self._values.get(tuple(labels[n] for n in self.labels))
+        return series[-1] if series else 0
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted(((k, list(v)) for k, v in self._values.items()), key=lambda kv: tuple(map(str, kv[0])))
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), series):
+                cumulative += n
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}"
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in each pipeline stage.", ("stage",))
+REQUEST_SECONDS = Histogram("rag_request_seconds", "End-to-end request time.", ("endpoint",))
+LLM_TOKENS = Counter("rag_llm_tokens_total", "Tokens reported by the OpenAI API.", ("stage", "kind"))
+PROMPT_TOKENS = Histogram("rag_prompt_tokens", "Prompt tokens per LLM call.", ("stage",), TOKEN_BUCKETS)
+
+
+def register_collector(fn):
+    """
+    Add metrics computed at scrape time. fn() yields (name, type, help,
+    [(labels_dict, value), ...]); used for pool and cache statistics that
+    their owners already keep.
+    """
+    _collectors.append(fn)
+    return fn
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        try:
+            families = list(fn())
+        except Exception as e:
+            logger.warning("Metrics collector %s failed: %s", getattr(fn, "__name__", fn), e)
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------
+# Spans and traces
+# ------------------------
+class Trace:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def to_dict(self, duration):
+        return {"trace": self.name, "duration_ms": round(duration * 1000, 3), **self.attrs, "spans": self.spans}
+
+
+class _Span:
+    __slots__ = ("stage", "attrs", "start")
+
+    def __init__(self, stage, attrs):
+        self.stage = stage
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.attrs
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        current = _trace.get()
+        if current is not None:
+            current.spans.append({"stage": self.stage, "start_ms": round((self.start - current.start) * 1000, 3),
+                                  "duration_ms": round(elapsed * 1000, 3), **self.attrs})
+        return False
+
+
+def span(stage, **attrs):
+    """
+    Time a pipeline stage into rag_stage_seconds{stage=...}. The with-block
+    gets a dict it can add attributes to (token counts, cache flags); they
+    are only kept when the request is being traced.
+    """
+    return _Span(stage, attrs) if METRICS_ENABLED else nullcontext(attrs)
+
+
+@contextmanager
+def trace(endpoint, **attrs):
+    """
+    Time a whole request into rag_request_seconds; with probability
+    TRACE_SAMPLE_RATE also collect its spans and log them as one JSON line.
+    """
+    if not METRICS_ENABLED:
+        yield None
+        return
+    sampled = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+    current = Trace(endpoint, attrs) if sampled else None
+    token = _trace.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        elapsed = time.perf_counter() - start
+        try:
+            _trace.reset(token)
+        except ValueError:  # a streaming generator finished in another context
+            _trace.set(None)
+        REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+        if current is not None:
+            record = current.to_dict(elapsed)
+            recent_traces.append(record)
+            logger.info("trace %s", json.dumps(record, default=str))
+
+
+def annotate(**attrs):
+    """Attach attributes to the request's trace, if it is sampled."""
+    current = _trace.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+def record_usage(stage, usage):
+    """Count the prompt / completion tokens of an OpenAI response's usage block."""
+    if not METRICS_ENABLED or usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    LLM_TOKENS.inc(prompt, stage=stage, kind="prompt")
+    LLM_TOKENS.inc(completion, stage=stage, kind="completion")
+    PROMPT_TOKENS.observe(prompt, stage=stage)
+
@@ -1,8 +1,59 @@
+import base64
+import json
+import os
+import zlib
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy.types import Text, TypeDecorator
 
+load_dotenv()
 db = SQLAlchemy()
 
+# Result rows kept in a stored message's meta (the SQL is kept too, so the
+# full result can be re-run), and the JSON size from which meta is stored
+# compressed.
+MESSAGE_META_ROWS = int(os.getenv("MESSAGE_META_ROWS", "20"))
+MESSAGE_META_COMPRESS_MIN = int(os.getenv("MESSAGE_META_COMPRESS_MIN", "512"))
+_COMPRESSED = "z:"
+
+
+def compact_meta(meta, rows=MESSAGE_META_ROWS):
+    """meta with sql_meta.result cut to `rows` rows (row_count and summary still cover all of them)."""
+    sql_meta = meta.get("sql_meta") if isinstance(meta, dict) else None
+    result = sql_meta.get("result") if isinstance(sql_meta, dict) else None
+    if not isinstance(result, list) or len(result) <= rows:
+        return meta
+    return dict(meta, sql_meta=dict(sql_meta, result=result[:rows], result_stored=rows))
+
+
+class MessageMeta(TypeDecorator):
+    """
+    Message meta as JSON text, compacted with compact_meta() and stored as
+    base64 zlib (prefixed "z:") once it is MESSAGE_META_COMPRESS_MIN
+    characters or more. Loads as a dict; plain JSON written before still loads.
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = json.loads(value)
+        text = json.dumps(compact_meta(value), default=str, separators=(",", ":"))
+        if len(text) >= MESSAGE_META_COMPRESS_MIN:
+            text = _COMPRESSED + base64.b64encode(zlib.compress(text.encode("utf-8"))).decode("ascii")
+        return text
+
+    def process_result_value(self, value, dialect):
+        if not value:
+            return None
+        if value.startswith(_COMPRESSED):
+            value = zlib.decompress(base64.b64decode(value[len(_COMPRESSED):])).decode("utf-8")
+        return json.loads(value)
+
 # --------------------
 # User table
 # --------------------
@@ -24,6 +75,8 @@ class User(db.Model):
 # --------------------
 class Conversation(db.Model):
     __tablename__ = "conversation"
+    # A user's conversations, newest first (keyset pagination on id).
+    __table_args__ = (db.Index("ix_conversation_user_id_id", "user_id", "id"),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
@@ -37,12 +90,14 @@ class Conversation(db.Model):
 # --------------------
 class Message(db.Model):
     __tablename__ = "message"
+    # A conversation's messages in order (keyset pagination on id, which follows created_at).
+    __table_args__ = (db.Index("ix_message_conversation_id_id", "conversation_id", "id"),)
 
     id = db.Column(db.Integer, primary_key=True)
     conversation_id = db.Column(db.Integer, db.ForeignKey("conversation.id"))
     sender = db.Column(db.String(50))
     text = db.Column(db.Text)
-    meta = db.Column(db.Text, nullable=True)
+    meta = db.Column(MessageMeta, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
@@ -1,121 +1,426 @@
 import os
 import json
+import logging
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text as sql_text
-from openai import OpenAI
-from retriever import retrieve
-from sql_validator import validate_sql
-from decimal import Decimal
+from sqlalchemy import text as sql_text
+from openai import RateLimitError
+from retriever import embed, embedding_cache, query_inputs, search_context
+from embedding_cache import normalize_text
+from context_builder import CONTEXT_CANDIDATES, build_context, message_tokens
+from sql_validator import analyze_sql, validate_sql, with_limit, referenced_tables
+from answer_cache import AnswerCache, ANSWER_CACHE_ENABLED
+from sql_cache import SqlResultCache, SQL_CACHE_ENABLED
+from table_versions import table_versions
+from sql_results import StreamingSummary, encode_rows, serialize_row, to_friendly_label
+from renderer import render_answer
+from local_sql import LocalSqlGenerator, LOCAL_SQL_ENABLED, LOCAL_SQL_FALLBACK_THRESHOLD
+import db_engines
+from metrics import Counter, annotate, record_usage, register_collector, span
+from single_flight import COALESCE_ENABLED, flights
+from llm_client import LLM_MAX_CONNECTIONS, LLMUnavailable, llm
 
 # ------------------------
 # Load ENV + init
 # ------------------------
 load_dotenv()
+logger = logging.getLogger(__name__)
+# Set to run generated SQL on a specific engine instead of the registry's.
 _ENGINE = None
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# (connection, lock) that shared_connection() makes every query in this context run on.
+_SHARED_CONNECTION = ContextVar("rag_shared_connection", default=None)
 
 # Model IDs
 BASE_MODEL = "gpt-4.1-nano-2025-04-14"
 FINE_TUNED_MODEL = os.getenv("OPENAI_FINE_TUNED_MODEL")
 
+# Rows kept from a query result, rows fetched per round trip while streaming,
+# and rows included in the summarization prompt.
+SQL_ROW_CAP = int(os.getenv("SQL_ROW_CAP", "500"))
+SQL_FETCH_SIZE = int(os.getenv("SQL_FETCH_SIZE", "1000"))
+PROMPT_ROW_CAP = int(os.getenv("PROMPT_ROW_CAP", "50"))
+# LIMIT added to generated queries that have none (0 disables), and whether
+# schema errors found by the validator stop a query before it reaches the DB
+# ("strict") or only unsafe statements do ("safe").
+SQL_DEFAULT_LIMIT = int(os.getenv("SQL_DEFAULT_LIMIT", "10000"))
+SQL_VALIDATION = os.getenv("SQL_VALIDATION", "strict").lower()
+# Speculative SQL generation: instead of generate -> validate -> repair one
+# after another, start up to SQL_SPECULATIVE_FANOUT candidates at once (the
+# model at temperature 0, the base model too when a fine-tuned one is set,
+# then SQL_SPECULATIVE_TEMPERATURES) and keep the first that validates.
+# Candidates are cut so their prompts stay within SQL_SPECULATIVE_TOKEN_BUDGET
+# tokens per question; SQL_EXPLAIN_CHECK also dry-runs each one with EXPLAIN.
+SQL_SPECULATIVE = os.getenv("SQL_SPECULATIVE", "0") == "1"
+SQL_SPECULATIVE_FANOUT = int(os.getenv("SQL_SPECULATIVE_FANOUT", "3"))
+SQL_SPECULATIVE_TEMPERATURES = [float(t) for t in os.getenv("SQL_SPECULATIVE_TEMPERATURES", "0.3,0.7").split(",")
+                                if t.strip()]
+SQL_SPECULATIVE_TOKEN_BUDGET = int(os.getenv("SQL_SPECULATIVE_TOKEN_BUDGET", "20000"))
+SQL_EXPLAIN_CHECK = os.getenv("SQL_EXPLAIN_CHECK", "0") == "1"
+
+SQL_SPECULATION = Counter("rag_sql_speculation_total",
+                          "Speculative SQL generations by result (first / later candidate won, repaired).",
+                          ("result",))
+
+answer_cache = AnswerCache(embed)
+sql_cache = SqlResultCache()
+local_sql = LocalSqlGenerator(slot_source=lambda: get_engine())
+
+
+@register_collector
+def cache_metrics():
+    """Hit / miss totals the caches already keep, exported at scrape time."""
+    answer, sql, embedding = answer_cache.stats(), sql_cache.stats(), embedding_cache.stats()
+    yield "rag_cache_lookups_total", "counter", "Cache lookups by outcome.", [
+        ({"cache": "answer", "result": "exact_hit"}, answer["exact_hits"]),
+        ({"cache": "answer", "result": "semantic_hit"}, answer["semantic_hits"]),
+        ({"cache": "answer", "result": "miss"}, answer["misses"]),
+        ({"cache": "sql", "result": "hit"}, sql["hits"]),
+        ({"cache": "sql", "result": "miss"}, sql["misses"]),
+        # "hits" counts both tiers; export them as disjoint outcomes so the series sum to the lookups.
+        ({"cache": "embedding", "result": "hit"}, embedding["hits"] - embedding["disk_hits"]),
+        ({"cache": "embedding", "result": "disk_hit"}, embedding["disk_hits"]),
+        ({"cache": "embedding", "result": "miss"}, embedding["misses"]),
+    ]
+    yield "rag_cache_entries", "gauge", "Entries held per cache.", [
+        ({"cache": "answer"}, answer["size"]),
+        ({"cache": "sql"}, sql["size"]),
+    ]
+
 
 # ------------------------
 # DB connection
 # ------------------------
 def get_engine():
-    global _ENGINE
-    if _ENGINE is None:
-        dburi = os.getenv("SQLALCHEMY_DATABASE_URI")
-        if not dburi:
-            raise RuntimeError("SQLALCHEMY_DATABASE_URI not set")
-        _ENGINE = create_engine(dburi)
-    return _ENGINE
+    """Read-only query engine generated SQL runs on (see db_engines.py), unless _ENGINE overrides it."""
+    return _ENGINE if _ENGINE is not None else db_engines.get_engine("query")
+
+
+@contextmanager
+def shared_connection(engine=None):
+    """
+    Run the generated SQL of the current context on one connection instead of
+    a checkout per query. Threads that run with a copy of the context
+    (contextvars.copy_context()) share it too, one query at a time.
+    """
+    with db_engines.timed_connect(engine or get_engine()) as conn:
+        token = _SHARED_CONNECTION.set((conn, threading.Lock()))
+        try:
+            yield conn
+        finally:
+            _SHARED_CONNECTION.reset(token)
+
+
+@contextmanager
+def query_connection(engine):
+    """The shared connection if one is set (held exclusively), otherwise a fresh checkout."""
+    shared = _SHARED_CONNECTION.get()
+    if shared is None:
+        with db_engines.timed_connect(engine) as conn:
+            yield conn
+    else:
+        conn, lock = shared
+        with lock:
+            yield conn
 
 
 # ------------------------
 # Generate SQL with RAG
 # ------------------------
-def generate_sql_with_openai(question: str) -> str:
-    """Generate SQL using fine-tuned model + retrieved schema context."""
-    context_docs = retrieve(question, k=10)
-
-    messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are an expert MySQL assistant. "
-                "Generate ONLY valid SQL based on schema and examples below. "
-                "Rules:\n"
-                "- If the question asks for names, include first_name and last_name.\n"
-                "- If the question asks for departments, include the department column.\n"
-                "- Never return just COUNT(*) unless explicitly asked for a count.\n"
-                "- Always alias aggregates clearly, e.g. COUNT(*) AS cnt.\n"
-                "- If the query is unanswerable with schema, return SELECT * FROM employees WHERE 1=0.\n"
-                "- Use correct table and column names from schema.\n"
-            )
-        },
+SQL_SYSTEM_PROMPT = (
+    "You are an expert MySQL assistant. "
+    "Generate ONLY valid SQL based on schema and examples below. "
+    "Rules:\n"
+    "- If the question asks for names, include first_name and last_name.\n"
+    "- If the question asks for departments, include the department column.\n"
+    "- Never return just COUNT(*) unless explicitly asked for a count.\n"
+    "- Always alias aggregates clearly, e.g. COUNT(*) AS cnt.\n"
+    "- If the query is unanswerable with schema, return SELECT * FROM employees WHERE 1=0.\n"
+    "- Use correct table and column names from schema.\n"
+)
+
+
+def build_sql_messages(question: str, context_docs) -> list:
+    return [
+        {"role": "system", "content": SQL_SYSTEM_PROMPT},
         {"role": "system", "content": "\n\n".join(context_docs)},
         {"role": "user", "content": question},
     ]
 
-    print  ("❗ Prompt to OpenAI:")
+
+def build_fix_messages(sql: str, errors) -> list:
+    return [
+        {"role": "system", "content": f"Fix this SQL query. Issues: {'; '.join(errors)}"},
+        {"role": "user", "content": sql},
+    ]
+
+
+def clean_sql(raw_sql: str) -> str:
+    """Remove markdown formatting if present."""
+    sql = re.sub(r"^```(sql)?\n", "", raw_sql.strip(), flags=re.IGNORECASE)
+    return re.sub(r"\n```$", "", sql).strip()
+
+
+def log_prompt_tokens(messages, stats):
+    """Debug-log the SQL prompt and its token breakdown; skipped entirely unless DEBUG is on."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    logger.debug("Prompt tokens: %d (schema %d in %d chunks, examples %d in %d, %d dropped)",
+                 message_tokens(messages), stats["schema_tokens"], stats["schema_docs"],
+                 stats["example_tokens"], stats["examples"], stats["examples_dropped"])
     for m in messages:
-        role = m["role"]
-        content = m["content"]
-        print(f"[{role}]: {content}\n")
-    
-    model_id = FINE_TUNED_MODEL or BASE_MODEL
-    resp = client.chat.completions.create(model=model_id, messages=messages, temperature=0)
-    raw_sql = resp.choices[0].message.content.strip()
+        logger.debug("[%s]: %s", m["role"], m["content"])
+
+
+def explain_errors(sql: str) -> list:
+    """Dry-run a query with EXPLAIN (planned, not executed); returns the database's complaint, if any."""
+    engine = get_engine()
+    explain = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    try:
+        with span("sql_explain"), query_connection(engine) as conn:
+            conn.execute(sql_text(explain + check_sql_safe(sql))).fetchall()
+    except Exception as e:
+        return [f"EXPLAIN failed: {str(e).splitlines()[0] if str(e) else type(e).__name__}"]
+    return []
 
-    print(f"✅ Raw SQL from OpenAI: {raw_sql}")
-    # Clean SQL (remove markdown formatting if present)
-    sql = re.sub(r"^```(sql)?\n", "", raw_sql, flags=re.IGNORECASE)
-    sql = re.sub(r"\n```$", "", sql).strip()
 
-    # Validate & repair if needed
+def sql_candidate(messages, model_id: str, temperature: float, hedge=True):
+    """One completion for the SQL prompt; returns (sql, errors), errors empty when it passes the checks."""
+    resp = llm.chat(messages, model_id, purpose="sql_generation", hedge=hedge, temperature=temperature)
+    record_usage("sql_generation", resp.usage)
+    raw_sql = resp.choices[0].message.content.strip()
+    logger.debug("Raw SQL from OpenAI (%s, t=%s): %s", model_id, temperature, raw_sql)
+    sql = clean_sql(raw_sql)
     valid, errors = validate_sql(sql)
-    if not valid:
-        fix_prompt = [
-            {"role": "system", "content": f"Fix this SQL query. Issues: {'; '.join(errors)}"},
-            {"role": "user", "content": sql},
-        ]
-        resp2 = client.chat.completions.create(model=model_id, messages=fix_prompt, temperature=0)
-        sql = resp2.choices[0].message.content.strip()
-        sql = re.sub(r"^```(sql)?\n", "", sql, flags=re.IGNORECASE)
-        sql = re.sub(r"\n```$", "", sql).strip()
-
-    print(f"✅ Final SQL: {sql}")
+    if valid and SQL_EXPLAIN_CHECK:
+        errors = explain_errors(sql)
+    return sql, errors
+
+
+def repair_sql(sql: str, errors, model_id: str) -> str:
+    with span("sql_repair", errors=len(errors)):
+        resp = llm.chat(build_fix_messages(sql, errors), model_id, purpose="sql_repair", temperature=0)
+    record_usage("sql_repair", resp.usage)
+    return clean_sql(resp.choices[0].message.content)
+
+
+def speculative_candidates(model_id: str, prompt_tokens: int) -> list:
+    """(model, temperature) per candidate, in order of preference, cut to the fan-out and token budget."""
+    candidates = [(model_id, 0.0)]
+    if model_id != BASE_MODEL:
+        candidates.append((BASE_MODEL, 0.0))
+    candidates += [(model_id, t) for t in SQL_SPECULATIVE_TEMPERATURES if t != 0.0]
+    n = min(SQL_SPECULATIVE_FANOUT, SQL_SPECULATIVE_TOKEN_BUDGET // max(prompt_tokens, 1))
+    return candidates[:max(n, 1)]
+
+
+_speculation_pool = None
+_speculation_pool_lock = threading.Lock()
+
+
+def speculation_pool() -> ThreadPoolExecutor:
+    global _speculation_pool
+    with _speculation_pool_lock:
+        if _speculation_pool is None:
+            _speculation_pool = ThreadPoolExecutor(LLM_MAX_CONNECTIONS, thread_name_prefix="sql-candidate")
+        return _speculation_pool
+
+
+def generate_sql_speculative(messages, model_id: str) -> str:
+    """
+    Run the candidates concurrently and return the first that passes the
+    checks; the others are cancelled, or abandoned if already in flight
+    (their usage is still recorded). If none passes, the first to arrive is
+    repaired as in the serial path. Candidates are not hedged: the fan-out
+    already covers a slow request.
+    """
+    candidates = speculative_candidates(model_id, message_tokens(messages))
+    futures = [speculation_pool().submit(copy_context().run, sql_candidate, messages, model, t, False)
+               for model, t in candidates]
+    first_invalid, error = None, None
+    with span("sql_generation", candidates=len(futures)) as s:
+        for arrived, future in enumerate(as_completed(futures)):
+            try:
+                sql, errors = future.result()
+            except Exception as e:  # LLMUnavailable, rate limits: the other candidates may still answer
+                error = error or e
+                continue
+            if not errors:
+                for f in futures:
+                    f.cancel()
+                s["winner"] = futures.index(future)
+                SQL_SPECULATION.inc(result="first" if arrived == 0 else "later")
+                return sql
+            first_invalid = first_invalid or (sql, errors)
+    if first_invalid is None:
+        raise error
+    SQL_SPECULATION.inc(result="repaired")
+    return repair_sql(*first_invalid, model_id)
+
+
+def generate_sql_with_openai(question: str, context=None) -> str:
+    """
+    Generate SQL using fine-tuned model + retrieved schema context. context is
+    a search_context() result already retrieved for the question (batch jobs).
+    """
+    if context is None:
+        lexical_query, q_emb = query_inputs(question)
+        context = search_context(lexical_query, q_emb, CONTEXT_CANDIDATES)
+    candidates, vectors, schema_docs = context
+    with span("context") as s:
+        context_docs, stats = build_context(question, candidates, schema_docs, vectors=vectors)
+        s["context_tokens"] = stats["context_tokens"]
+    messages = build_sql_messages(question, context_docs)
+    log_prompt_tokens(messages, stats)
+
+    model_id = FINE_TUNED_MODEL or BASE_MODEL
+    if SQL_SPECULATIVE and SQL_SPECULATIVE_FANOUT > 1:
+        sql = generate_sql_speculative(messages, model_id)
+    else:
+        with span("sql_generation"):
+            sql, errors = sql_candidate(messages, model_id, 0)
+        # Repair if needed
+        if errors:
+            sql = repair_sql(sql, errors, model_id)
+
+    logger.debug("Final SQL: %s", sql)
     return sql
 
 
+def generate_sql(question: str, context=None):
+    """
+    SQL for a question: the local classifier when it is confident, otherwise
+    generate_sql_with_openai(). Returns (sql, source) with source "local" or
+    "llm", or "local_fallback" when the LLM is unavailable and the classifier
+    has a less confident guess.
+    """
+    if LOCAL_SQL_ENABLED:
+        with span("local_sql") as s:
+            sql = local_sql.generate(question)
+            s["hit"] = sql is not None
+        if sql is not None:
+            logger.debug("Local SQL: %s", sql)
+            annotate(sql_source="local")
+            return sql, "local"
+    annotate(sql_source="llm")
+    try:
+        return generate_sql_with_openai(question, context), "llm"
+    except LLMUnavailable as e:
+        sql = local_sql.generate(question, LOCAL_SQL_FALLBACK_THRESHOLD) if LOCAL_SQL_ENABLED else None
+        if sql is None:
+            raise
+        logger.warning("%s; using the local classifier's best guess", e)
+        annotate(sql_source="local_fallback")
+        return sql, "local_fallback"
+
+
 # ------------------------
 # Run SQL safely
 # ------------------------
-def run_sql_query(sql: str):
-    forbidden = ["drop", "delete", "update", "alter", "insert"]
-    if any(f in sql.lower() for f in forbidden):
-        raise RuntimeError(f"Unsafe SQL blocked: {sql}")
+def check_sql_safe(sql: str) -> str:
+    """
+    Gate a query before execution: only a single SELECT gets through, schema
+    errors are rejected in strict mode, and a LIMIT is added if missing.
+    Returns the SQL to run.
+    """
+    check = analyze_sql(sql)
+    if not check.read_only:
+        raise RuntimeError(f"Unsafe SQL blocked: {'; '.join(check.errors)}: {sql}")
+    if check.errors and SQL_VALIDATION == "strict":
+        raise RuntimeError(f"Invalid SQL: {'; '.join(check.errors)}")
+    return with_limit(sql, SQL_DEFAULT_LIMIT) if SQL_DEFAULT_LIMIT else sql
+
+
+class ResultCollector:
+    """
+    Consumes a streamed result: keeps the first `row_cap` serialized rows and
+    folds every row into the count and per-column summary.
+    """
+
+    def __init__(self, keys, row_cap: int = SQL_ROW_CAP):
+        self.row_cap = row_cap
+        self.rows = []
+        self.summary = StreamingSummary(to_friendly_label(k) for k in keys)
+
+    def add(self, row):
+        self.summary.add(row)
+        if len(self.rows) < self.row_cap:
+            self.rows.append(serialize_row(row))
+
+    def to_meta(self) -> dict:
+        return {
+            "result": self.rows,
+            "row_count": self.summary.row_count,
+            "truncated": self.summary.row_count > len(self.rows),
+            "summary": self.summary.to_dict(),
+        }
+
+
+def run_sql_query(sql: str, row_cap: int = SQL_ROW_CAP):
+    """
+    Execute generated SQL with a server-side cursor.
+
+    Only the first `row_cap` rows are kept; the rest are streamed through to
+    get the total row count and per-column summary statistics. Returns
+    {"query", "result", "row_count", "truncated", "summary"}.
+    """
+    sql = check_sql_safe(sql)
 
     engine = get_engine()
-    with engine.connect() as conn:
-        result = conn.execute(sql_text(sql))
-        rows = result.fetchall()
-        return {"query": sql, "result": [serialize_row(r) for r in rows]}
+    if SQL_CACHE_ENABLED:
+        table_versions.maybe_probe(engine)
+        cached = sql_cache.get(sql, row_cap)
+        annotate(sql_cache="hit" if cached is not None else "miss")
+        if cached is not None:
+            return {"query": sql, **cached, "cached": True}
+        # Captured before executing, so a concurrent write leaves the entry stale.
+        tables = table_versions.snapshot(referenced_tables(sql))
+
+    with span("db_execute") as s, query_connection(engine) as conn:
+        result = conn.execution_options(stream_results=True, yield_per=SQL_FETCH_SIZE).execute(sql_text(sql))
+        collector = ResultCollector(result.keys(), row_cap)
+        for r in result:
+            collector.add(r)
+        s["rows"] = collector.summary.row_count
+
+    meta = collector.to_meta()
+    if SQL_CACHE_ENABLED:
+        sql_cache.put(sql, meta, tables, row_cap)
+    return {"query": sql, **meta}
 
 
 # ------------------------
 # Build final answer
 # ------------------------
+def fallback_answer(question: str, sql_meta: dict, reason) -> str:
+    """Answer without the LLM (it is unavailable): the result rendered locally, or the error."""
+    logger.warning("%s; rendering the answer locally", reason)
+    annotate(answer_source="local_fallback")
+    # The question was counted as an LLM answer when render_answer() first declined it.
+    answer = render_answer(question, sql_meta, mode="local", count=False)
+    return answer or f"Sorry, I can't answer that right now ({sql_meta.get('error', 'no result')})."
+
+
 def build_prompt(question: str, sql_meta: dict) -> list:
     parts = []
     parts.append("You are an assistant that answers based strictly on SQL results.")
     parts.append(f"Question: {question}")
 
     if sql_meta and sql_meta.get("result") is not None:
-        parts.append("SQL Result (rows):")
-        parts.append(json.dumps(sql_meta["result"], indent=2))
+        rows = sql_meta["result"][:PROMPT_ROW_CAP]
+        total = sql_meta.get("row_count", len(sql_meta["result"]))
+        if total > len(rows):
+            # Large result: the aggregate view covers every row, the sample only a few.
+            parts.append(f"SQL Result: {total} rows in total, showing the first {len(rows)} (truncated).")
+            parts.append("Summary statistics over all rows:")
+            parts.append(json.dumps(sql_meta.get("summary", {}).get("columns", {}), separators=(",", ":")))
+            parts.append("Sample rows (header first):")
+        else:
+            parts.append("SQL Result (header first, then one row per line):")
+        parts.append(encode_rows(rows))
     else:
         parts.append(f"Error: {sql_meta.get('error')}")
 
@@ -123,6 +428,7 @@ def build_prompt(question: str, sql_meta: dict) -> list:
         "Rules:\n"
         "- Provide a short, clear answer.\n"
         "- If rows exist, return them as an HTML <table>.\n"
+        "- If the result is truncated, say how many rows there are in total.\n"
         "- If no results, say 'No data found.'\n"
         "- Do not fabricate or guess beyond the SQL results.\n"
         "- Use <br> for line breaks if needed.\n"
@@ -134,58 +440,144 @@ def build_prompt(question: str, sql_meta: dict) -> list:
 # ------------------------
 # Main pipeline
 # ------------------------
-def answer_question(question: str):
-    print(f"❓ User asked: {question}")
-    sql_meta = None
+def resolve_sql_meta(question: str, cached=None, context=None):
+    """
+    Produce the SQL result for a question, reusing an answer-cache hit when possible.
+
+    Generator: yields (event, data) progress events and returns the sql_meta dict.
+    Rate limits are raised rather than turned into an error result, so callers can retry.
+    """
     try:
-        sql = generate_sql_with_openai(question)
-        sql_meta = run_sql_query(sql)
+        if cached and cached["fresh"]:
+            sql_meta = cached["sql_meta"]
+        elif cached:
+            yield "sql", {"sql": cached["sql"], "cache": cached["kind"]}
+            sql_meta = run_sql_query(cached["sql"])
+            answer_cache.refresh(cached["question"], sql_meta)
+        else:
+            yield "status", {"stage": "retrieving"}
+            sql, source = generate_sql(question, context)
+            yield "sql", {"sql": sql, "source": source}
+            sql_meta = run_sql_query(sql)
+    except RateLimitError:
+        raise
     except Exception as e:
         sql_meta = {"error": str(e)}
 
-    # Generate natural language answer
-    messages = build_prompt(question, sql_meta)
-    completion = client.chat.completions.create(model=BASE_MODEL, messages=messages, temperature=0)
-    answer = completion.choices[0].message.content.strip()
-
-    return answer, {"sql_meta": sql_meta}
-
-def serialize_row(row):
-    """
-    Convert row values to JSON-serializable types and auto-generate user-friendly labels.
-    """
-    new_row = {}
-    for k, v in row._mapping.items():
-        label = to_friendly_label(k)  # automatically generate friendly label
-        new_row[label] = float(v) if isinstance(v, Decimal) else v
-    return new_row
-
-# Dictionary of common columns → human-friendly names
-COLUMN_PREDICTIONS = {
-    "avg_salary": "Average Salary",
-    "salary": "Salary",
-    "dept": "Department",
-    "department": "Department",
-    "first_name": "First Name",
-    "last_name": "Last Name",
-    "city": "City",
-    "project_name": "Project Name",
-    "employee_id": "Employee ID",
-    "hire_date": "Hire Date",
-    "manager_id": "Manager ID",
-    # Add more common patterns if needed
-}
-
-def to_friendly_label(col_name):
-    """Convert DB column name to human-readable label using prediction dictionary."""
-    col_lower = col_name.lower()
-    if col_lower in COLUMN_PREDICTIONS:
-        return COLUMN_PREDICTIONS[col_lower]
-    # fallback: convert snake_case → Title Case
-    return col_name.replace("_", " ").title()
+    if "error" not in sql_meta:
+        yield "rows", {"row_count": sql_meta.get("row_count", len(sql_meta["result"])),
+                       "truncated": sql_meta.get("truncated", False)}
+    return sql_meta
+
+
+def _run_to_end(steps):
+    """Drain a generator, discarding its events, and return its return value."""
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+def answer_question(question: str, context=None):
+    """
+    Answer a question; returns (answer, meta). Concurrent calls for the same
+    normalized question share one run of the pipeline (single_flight.py), so
+    treat the result as read-only.
+    """
+    logger.info("User asked: %s", question)
+    if not COALESCE_ENABLED:
+        return _answer_question(question, context)
+    (answer, meta), shared = flights.do(normalize_text(question), lambda: _answer_question(question, context))
+    if shared:
+        annotate(coalesced=True)
+    return answer, meta
+
+
+def _answer_question(question: str, context=None):
+    # Exact repeat with a fresh result: no LLM or DB work at all.
+    # Otherwise a cache hit still skips SQL generation, and re-runs the SQL only if stale.
+    cached = answer_cache.lookup(question) if ANSWER_CACHE_ENABLED else None
+    annotate(answer_cache=cached["kind"] if cached else "miss")
+    if cached and cached["kind"] == "exact" and cached["fresh"]:
+        return cached["answer"], {"sql_meta": cached["sql_meta"], "cache": "exact"}
+
+    sql_meta = _run_to_end(resolve_sql_meta(question, cached, context))
+
+    # Render known result shapes locally; otherwise generate natural language answer
+    answer, fallback = render_answer(question, sql_meta), False
+    if answer is None:
+        messages = build_prompt(question, sql_meta)
+        try:
+            with span("summarize"):
+                completion = llm.chat(messages, BASE_MODEL, purpose="summarize", temperature=0)
+            record_usage("summarize", completion.usage)
+            answer = completion.choices[0].message.content.strip()
+        except LLMUnavailable as e:
+            answer, fallback = fallback_answer(question, sql_meta, e), True
+
+    if ANSWER_CACHE_ENABLED and "error" not in sql_meta and not fallback:
+        answer_cache.store(question, sql_meta["query"], sql_meta, answer)
+
+    return answer, {"sql_meta": sql_meta, "cache": cached["kind"] if cached else None}
+
+
+def answer_question_stream(question: str):
+    """
+    Streaming variant of answer_question().
+
+    Yields (event, data) pairs: "status" / "sql" / "rows" progress events,
+    then one "token" event per chunk of the answer as the model produces it,
+    and finally "done" with the full answer and meta.
+    """
+    logger.info("User asked (stream): %s", question)
+
+    cached = answer_cache.lookup(question) if ANSWER_CACHE_ENABLED else None
+    annotate(answer_cache=cached["kind"] if cached else "miss")
+    if cached and cached["kind"] == "exact" and cached["fresh"]:
+        yield "token", {"text": cached["answer"]}
+        yield "done", {"answer": cached["answer"], "meta": {"sql_meta": cached["sql_meta"], "cache": "exact"}}
+        return
+
+    sql_meta = yield from resolve_sql_meta(question, cached)
+
+    answer, fallback = render_answer(question, sql_meta), False
+    if answer is not None:
+        yield "token", {"text": answer}
+    else:
+        yield "status", {"stage": "answering"}
+        parts = []
+        try:
+            # Includes time the client takes to read each token; usage is not reported when streaming.
+            with span("summarize", stream=True):
+                stream = llm.chat(build_prompt(question, sql_meta), BASE_MODEL, purpose="summarize", stream=True,
+                                  temperature=0)
+                try:
+                    for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            parts.append(delta)
+                            yield "token", {"text": delta}
+                except Exception as e:
+                    # Broke off mid-answer: counts against the breaker like a failed call.
+                    raise llm.failed("summarize", e)
+            answer = "".join(parts).strip()
+        except LLMUnavailable as e:
+            # Any partial answer already went out; the local rendering follows it.
+            notice = fallback_answer(question, sql_meta, e)
+            if parts:
+                notice = "\n\n" + notice
+            answer, fallback = ("".join(parts) + notice).strip(), True
+            yield "token", {"text": notice}
+
+    if ANSWER_CACHE_ENABLED and "error" not in sql_meta and not fallback:
+        answer_cache.store(question, sql_meta["query"], sql_meta, answer)
+
+    yield "done", {"answer": answer, "meta": {"sql_meta": sql_meta, "cache": cached["kind"] if cached else None}}
 
 # Manual test
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
     q = "List all cities where HR employees live"
     ans, meta = answer_question(q)
     print("---- Answer ----")
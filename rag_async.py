@@ -0,0 +1,216 @@
+# rag_async.py
+#
+# asyncio variant of rag.answer_question(). Prompts, validation, caches and
+# result handling are shared with rag.py; only the I/O (OpenAI + database)
+# is async, so one event loop can keep many questions in flight. OpenAI calls
+# go through llm_client.allm, which shares rag.py's limits and circuit
+# breaker, and fall back the same way when the LLM is unavailable.
+
+import asyncio
+import logging
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import text as sql_text
+
+import db_engines
+import rag
+from answer_cache import ANSWER_CACHE_ENABLED
+from renderer import render_answer
+from embedding_cache import EMBED_MODEL, normalize_text
+from retriever import RETRIEVAL_MODE, embedding_cache, search_context, search_docs
+from context_builder import CONTEXT_CANDIDATES, build_context
+from sql_cache import SQL_CACHE_ENABLED
+from sql_validator import validate_sql, referenced_tables
+from table_versions import table_versions
+from metrics import annotate, record_usage, span
+from single_flight import COALESCE_ENABLED, async_flights
+from llm_client import LLMUnavailable, allm as llm
+from local_sql import LOCAL_SQL_FALLBACK_THRESHOLD
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+# Set to run generated SQL on a specific engine instead of the registry's.
+_ASYNC_ENGINE = None
+async_database_uri = db_engines.async_database_uri
+
+
+# ------------------------
+# DB connection
+# ------------------------
+def get_async_engine():
+    """Async read-only query engine (see db_engines.py), unless _ASYNC_ENGINE overrides it."""
+    return _ASYNC_ENGINE if _ASYNC_ENGINE is not None else db_engines.get_async_engine("query")
+
+
+# ------------------------
+# Retrieval
+# ------------------------
+async def embed_async(text: str):
+    vec = embedding_cache.get(text)
+    if vec is None:
+        resp = await llm.embeddings(text, EMBED_MODEL)
+        vec = embedding_cache.put(text, resp.data[0].embedding)
+    return vec
+
+
+async def query_inputs_async(question: str):
+    """Async counterpart of retriever.query_inputs()."""
+    q_emb = None
+    if RETRIEVAL_MODE != "lexical":
+        try:
+            with span("embed"):
+                q_emb = np.array([await embed_async(question)], dtype="float32")
+        except Exception as e:
+            if RETRIEVAL_MODE == "dense":
+                raise
+            logger.warning("Embedding failed (%s), using lexical retrieval only", e.__class__.__name__)
+    return (question if RETRIEVAL_MODE != "dense" else None), q_emb
+
+
+async def retrieve_async(question: str, k: int = 10):
+    """Embed + hybrid search; the search runs in a thread so large indexes do not block the loop."""
+    lexical_query, q_emb = await query_inputs_async(question)
+    return await asyncio.to_thread(search_docs, lexical_query, q_emb, k)
+
+
+async def sql_context_async(question: str):
+    """Token-budgeted SQL-generation context (see context_builder); returns (docs, stats)."""
+    lexical_query, q_emb = await query_inputs_async(question)
+    candidates, vectors, schema_docs = await asyncio.to_thread(search_context, lexical_query, q_emb, CONTEXT_CANDIDATES)
+    with span("context") as s:
+        docs, stats = build_context(question, candidates, schema_docs, vectors=vectors)
+        s["context_tokens"] = stats["context_tokens"]
+    return docs, stats
+
+
+# ------------------------
+# Generate SQL with RAG
+# ------------------------
+async def generate_sql_async(question: str) -> str:
+    """Async counterpart of rag.generate_sql(), returning only the SQL."""
+    if rag.LOCAL_SQL_ENABLED:
+        # First use loads the model and slot values, so keep it off the loop.
+        with span("local_sql") as s:
+            sql = await asyncio.to_thread(rag.local_sql.generate, question)
+            s["hit"] = sql is not None
+        if sql is not None:
+            annotate(sql_source="local")
+            return sql
+    annotate(sql_source="llm")
+    try:
+        return await generate_sql_with_openai_async(question)
+    except LLMUnavailable as e:
+        sql = (await asyncio.to_thread(rag.local_sql.generate, question, LOCAL_SQL_FALLBACK_THRESHOLD)
+               if rag.LOCAL_SQL_ENABLED else None)
+        if sql is None:
+            raise
+        logger.warning("%s; using the local classifier's best guess", e)
+        annotate(sql_source="local_fallback")
+        return sql
+
+
+async def generate_sql_with_openai_async(question: str) -> str:
+    context_docs, stats = await sql_context_async(question)
+    messages = rag.build_sql_messages(question, context_docs)
+    rag.log_prompt_tokens(messages, stats)
+    model_id = rag.FINE_TUNED_MODEL or rag.BASE_MODEL
+    with span("sql_generation"):
+        resp = await llm.chat(messages, model_id, purpose="sql_generation", temperature=0)
+    record_usage("sql_generation", resp.usage)
+    sql = rag.clean_sql(resp.choices[0].message.content)
+
+    valid, errors = validate_sql(sql)
+    if not valid:
+        with span("sql_repair", errors=len(errors)):
+            resp2 = await llm.chat(rag.build_fix_messages(sql, errors), model_id, purpose="sql_repair",
+                                   temperature=0)
+        record_usage("sql_repair", resp2.usage)
+        sql = rag.clean_sql(resp2.choices[0].message.content)
+    return sql
+
+
+# ------------------------
+# Run SQL
+# ------------------------
+async def run_sql_query_async(sql: str, row_cap: int = rag.SQL_ROW_CAP):
+    """Async counterpart of rag.run_sql_query(), sharing its result cache."""
+    sql = rag.check_sql_safe(sql)
+
+    if SQL_CACHE_ENABLED:
+        await asyncio.to_thread(table_versions.maybe_probe, rag.get_engine())
+        cached = rag.sql_cache.get(sql, row_cap)
+        annotate(sql_cache="hit" if cached is not None else "miss")
+        if cached is not None:
+            return {"query": sql, **cached, "cached": True}
+        tables = table_versions.snapshot(referenced_tables(sql))
+
+    with span("db_execute") as s:
+        async with db_engines.timed_connect_async(get_async_engine()) as conn:
+            result = await conn.stream(sql_text(sql), execution_options={"yield_per": rag.SQL_FETCH_SIZE})
+            collector = rag.ResultCollector(result.keys(), row_cap)
+            async for r in result:
+                collector.add(r)
+        s["rows"] = collector.summary.row_count
+
+    meta = collector.to_meta()
+    if SQL_CACHE_ENABLED:
+        rag.sql_cache.put(sql, meta, tables, row_cap)
+    return {"query": sql, **meta}
+
+
+# ------------------------
+# Main pipeline
+# ------------------------
+async def answer_question_async(question: str):
+    """Same contract as rag.answer_question(): returns (answer, meta), shared by concurrent identical questions."""
+    if not COALESCE_ENABLED:
+        return await _answer_question_async(question)
+    (answer, meta), shared = await async_flights.do(normalize_text(question),
+                                                   lambda: _answer_question_async(question))
+    if shared:
+        annotate(coalesced=True)
+    return answer, meta
+
+
+async def _answer_question_async(question: str):
+    cached = None
+    if ANSWER_CACHE_ENABLED:
+        # Warm the embedding cache first so the cache lookup never blocks on the network.
+        try:
+            await embed_async(question)
+            cached = rag.answer_cache.lookup(question)
+        except LLMUnavailable as e:
+            logger.warning("%s; skipping the answer cache", e)
+    annotate(answer_cache=cached["kind"] if cached else "miss")
+    if cached and cached["kind"] == "exact" and cached["fresh"]:
+        return cached["answer"], {"sql_meta": cached["sql_meta"], "cache": "exact"}
+
+    try:
+        if cached and cached["fresh"]:
+            sql_meta = cached["sql_meta"]
+        elif cached:
+            sql_meta = await run_sql_query_async(cached["sql"])
+            rag.answer_cache.refresh(cached["question"], sql_meta)
+        else:
+            sql = await generate_sql_async(question)
+            sql_meta = await run_sql_query_async(sql)
+    except Exception as e:
+        sql_meta = {"error": str(e)}
+
+    answer, fallback = render_answer(question, sql_meta), False
+    if answer is None:
+        try:
+            with span("summarize"):
+                completion = await llm.chat(rag.build_prompt(question, sql_meta), rag.BASE_MODEL,
+                                            purpose="summarize", temperature=0)
+            record_usage("summarize", completion.usage)
+            answer = completion.choices[0].message.content.strip()
+        except LLMUnavailable as e:
+            answer, fallback = rag.fallback_answer(question, sql_meta, e), True
+
+    if ANSWER_CACHE_ENABLED and "error" not in sql_meta and not fallback:
+        rag.answer_cache.store(question, sql_meta["query"], sql_meta, answer)
+
+    return answer, {"sql_meta": sql_meta, "cache": cached["kind"] if cached else None}
@@ -0,0 +1,214 @@
+# rag_batch.py
+#
+# Bulk question answering for reporting jobs. A batch is deduplicated, its
+# questions are embedded in one request and searched with one FAISS call,
+# then answered by a bounded pool of threads that back off together on rate
+# limits and run their SQL on a single shared connection. Results come back
+# in completion order.
+#
+#   python rag_batch.py questions.jsonl -o answers.jsonl --concurrency 8
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+
+from dotenv import load_dotenv
+from openai import RateLimitError
+
+import rag
+from context_builder import CONTEXT_CANDIDATES
+from embedding_cache import normalize_text
+from retriever import query_inputs_many, search_context_many
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Questions answered at once, retries of a question after a rate limit, and
+# the largest batch /api/chat/batch accepts.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", "5"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+
+
+class RateLimitGate:
+    """
+    Shared pause for all workers of a batch: after a 429 nobody sends another
+    request until the server's retry-after has passed.
+    """
+
+    def __init__(self):
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+
+def retry_delay(error, attempt: int) -> float:
+    """Seconds to wait after a rate limit: the server's retry-after if given, else exponential backoff."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[name]) * scale
+        except (KeyError, TypeError, ValueError):
+            pass
+    return min(60.0, 2 ** attempt) * (0.5 + random.random())
+
+
+def dedupe(questions):
+    """Unique questions (by normalized text, first spelling kept) and the input positions of each."""
+    unique, positions, seen = [], [], {}
+    for pos, question in enumerate(questions):
+        key = normalize_text(question)
+        if key not in seen:
+            seen[key] = len(unique)
+            unique.append(question)
+            positions.append([])
+        positions[seen[key]].append(pos)
+    return unique, positions
+
+
+class BatchJob:
+    """
+    Answers a list of questions. Iterate to get one result per input question
+    as soon as its answer is ready:
+
+        {"index", "question", "reply", "meta", "error", "duplicate"}
+
+    stats() reports counts and throughput once iteration has finished.
+    """
+
+    def __init__(self, questions, concurrency=BATCH_CONCURRENCY, max_retries=BATCH_MAX_RETRIES):
+        self.questions = [q.strip() for q in questions]
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.gate = RateLimitGate()
+        self.unique, self.positions = dedupe(self.questions)
+        self.errors = 0
+        self.rate_limited = 0
+        self.elapsed = None
+
+    def _answer(self, question, context):
+        for attempt in range(self.max_retries + 1):
+            self.gate.wait()
+            try:
+                return rag.answer_question(question, context)
+            except RateLimitError as e:
+                self.rate_limited += 1
+                if attempt == self.max_retries:
+                    raise
+                delay = retry_delay(e, attempt)
+                logger.warning("Rate limited, pausing the batch for %.1fs", delay)
+                self.gate.pause(delay)
+
+    def __iter__(self):
+        start = time.perf_counter()
+        lexical_queries, q_embs = query_inputs_many(self.unique)
+        contexts = search_context_many(lexical_queries, q_embs, CONTEXT_CANDIDATES) if self.unique else []
+
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="rag-batch")
+        try:
+            with rag.shared_connection():
+                # Each task gets a copy of this context, so it sees the shared connection and trace.
+                futures = {pool.submit(copy_context().run, self._answer, question, context): i
+                           for i, (question, context) in enumerate(zip(self.unique, contexts))}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        reply, meta = future.result()
+                        error = meta["sql_meta"].get("error")
+                    except Exception as e:
+                        logger.exception("Error answering batch question")
+                        reply, meta, error = None, {}, str(e)
+                    self.errors += error is not None
+                    for n, pos in enumerate(self.positions[i]):
+                        yield {"index": pos, "question": self.questions[pos], "reply": reply, "meta": meta,
+                               "error": error, "duplicate": n > 0}
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self.elapsed = time.perf_counter() - start
+
+    def stats(self) -> dict:
+        elapsed = self.elapsed or 0.0
+        return {
+            "questions": len(self.questions),
+            "unique": len(self.unique),
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "seconds": round(elapsed, 3),
+            "questions_per_second": round(len(self.questions) / elapsed, 2) if elapsed else None,
+        }
+
+
+def answer_batch(questions, concurrency=BATCH_CONCURRENCY):
+    """Answer every question; returns (results in input order, stats)."""
+    job = BatchJob(questions, concurrency)
+    results = sorted(job, key=lambda r: r["index"])
+    return results, job.stats()
+
+
+def _question(item):
+    if isinstance(item, dict):
+        if not isinstance(item.get("question"), str):
+            raise ValueError(f"item without a \"question\": {json.dumps(item)[:100]}")
+        return item["question"]
+    return str(item)
+
+
+def read_questions(text: str):
+    """
+    Questions from a JSON list, JSONL ({"question": ...} or a JSON string per
+    line) or plain text with one question per line. Raises ValueError for an
+    object without a "question".
+    """
+    try:
+        items = json.loads(text)
+        if isinstance(items, list):
+            return [_question(item) for item in items]
+    except json.JSONDecodeError:
+        pass
+    questions = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            item = line
+        questions.append(_question(item))
+    return questions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a file of questions; writes JSONL as answers complete.")
+    parser.add_argument("input", help="JSONL / text file with one question per line, or - for stdin")
+    parser.add_argument("-o", "--output", help="JSONL output file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper(), stream=sys.stderr)
+
+    with (sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")) as f:
+        job = BatchJob(read_questions(f.read()), args.concurrency)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for result in job:
+            out.write(json.dumps(result, default=str) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps(job.stats()), file=sys.stderr)
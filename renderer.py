@@ -0,0 +1,151 @@
+# renderer.py
+#
+# Deterministic, local rendering of SQL results, used instead of the LLM
+# summarization call when the result has a shape we can phrase ourselves.
+
+import html
+import os
+import re
+import threading
+from numbers import Number
+
+from dotenv import load_dotenv
+
+from sql_results import to_friendly_label
+
+load_dotenv()
+
+# "llm": always summarize with the LLM (default)
+# "auto": render locally when the result fits a known shape, else use the LLM
+# "local": like auto, but never call the LLM for a successful query
+RENDER_MODE = os.getenv("ANSWER_RENDER_MODE", "llm")
+
+# Single-column results up to this many values are listed inline instead of as a table.
+INLINE_LIST_MAX = 15
+# Cells longer than this read badly in a table; leave those results to the LLM.
+MAX_CELL_CHARS = 200
+
+PROSE_PATTERN = re.compile(
+    r"\b(explain|why|describe|summari[sz]e|summary|compare|insight|in words|tell me about)\b", re.IGNORECASE)
+
+_stats = {"local": 0, "llm": 0}
+_stats_lock = threading.Lock()
+
+
+def _is_number(v):
+    return isinstance(v, Number) and not isinstance(v, bool)
+
+
+def format_value(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, float):
+        return f"{v:,.2f}".rstrip("0").rstrip(".") if v != int(v) else f"{int(v):,}"
+    if isinstance(v, int) and not isinstance(v, bool):
+        return f"{v:,}" if abs(v) >= 10000 else str(v)
+    return str(v)
+
+
+def render_table(rows) -> str:
+    """HTML <table> for serialized rows (see sql_results.serialize_row); keys are already friendly labels."""
+    columns = list(rows[0].keys())
+    head = "".join(f"<th>{html.escape(c)}</th>" for c in columns)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(format_value(r.get(c)))}</td>" for c in columns) + "</tr>"
+        for r in rows
+    )
+    return f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+
+def _scalar_sentence(label, value):
+    text = html.escape(format_value(value))
+    if re.search(r"count|cnt|\bnum", label, re.IGNORECASE):
+        return f"The count is {text}."
+    label = to_friendly_label(label) if "_" in label else label
+    return f"{html.escape(label)}: {text}."
+
+
+def _group_sentence(rows, dims, measure):
+    ranked = sorted((r for r in rows if _is_number(r[measure])), key=lambda r: r[measure], reverse=True)
+    if not ranked:
+        return None
+
+    def name(r):
+        return html.escape(", ".join(format_value(r[d]) for d in dims))
+
+    what = f"{html.escape(measure)} by {html.escape(', '.join(dims))}"
+    if len(ranked) == 1:
+        return f"{what}: {name(ranked[0])} ({html.escape(format_value(ranked[0][measure]))})."
+    top, bottom = ranked[0], ranked[-1]
+    return (f"{what} ({len(rows)} groups): highest is {name(top)} ({html.escape(format_value(top[measure]))}), "
+            f"lowest is {name(bottom)} ({html.escape(format_value(bottom[measure]))}).")
+
+
+def render_result(sql_meta: dict):
+    """
+    Render a successful SQL result as HTML, or return None when its shape is unknown.
+
+    Known shapes: no rows, a single scalar, a single column, group-by
+    aggregates (text columns followed by one numeric column), and plain row
+    listings. Truncated results get a "first N of M" note.
+    """
+    rows = sql_meta.get("result")
+    if rows is None:
+        return None
+    if not rows:
+        return "No data found."
+
+    columns = list(rows[0].keys())
+    if any(isinstance(v, str) and len(v) > MAX_CELL_CHARS for r in rows for v in r.values()):
+        return None
+
+    total = sql_meta.get("row_count", len(rows))
+    note = f"<br>Showing the first {len(rows):,} of {total:,} rows." if total > len(rows) else ""
+
+    if len(rows) == 1 and len(columns) == 1 and not note:
+        return _scalar_sentence(columns[0], rows[0][columns[0]])
+
+    if len(columns) == 1:
+        values = [format_value(r[columns[0]]) for r in rows]
+        if len(values) <= INLINE_LIST_MAX and not note:
+            return f"{html.escape(columns[0])} ({len(values)}): {html.escape(', '.join(values))}."
+        return f"{total:,} {html.escape(columns[0])} values:{note}<br>{render_table(rows)}"
+
+    dims, measure = columns[:-1], columns[-1]
+    if (len(rows) > 1 and all(_is_number(r[measure]) or r[measure] is None for r in rows)
+            and not any(_is_number(r[d]) for r in rows for d in dims)):
+        sentence = _group_sentence(rows, dims, measure)
+        if sentence:
+            return f"{sentence}{note}<br>{render_table(rows)}"
+
+    return f"{total:,} row{'s' if total != 1 else ''} found.{note}<br>{render_table(rows)}"
+
+
+def render_answer(question: str, sql_meta: dict, mode: str = None, count: bool = True):
+    """
+    Local answer for this question/result, or None if the LLM should write it.
+
+    Counts each decision so stats() can report how many LLM calls were avoided;
+    pass count=False for a render of a question that was already counted.
+    """
+    mode = mode or RENDER_MODE
+    answer = None
+    if mode != "llm" and sql_meta and "error" not in sql_meta:
+        if mode == "local":
+            answer = render_result(sql_meta)
+            if answer is None and sql_meta.get("result"):
+                answer = render_table(sql_meta["result"])
+        elif not PROSE_PATTERN.search(question):
+            answer = render_result(sql_meta)
+    if count:
+        with _stats_lock:
+            _stats["local" if answer is not None else "llm"] += 1
+    return answer
+
+
+def stats() -> dict:
+    """Answers rendered locally (= LLM calls avoided) vs. sent to the LLM."""
+    with _stats_lock:
+        total = _stats["local"] + _stats["llm"]
+        return {"llm_calls_avoided": _stats["local"], "llm_calls": _stats["llm"],
+                "avoided_rate": _stats["local"] / total if total else 0.0}
@@ -1,69 +1,379 @@
 # retrieve.py
 
 import faiss
+import logging
 import numpy as np
-import pickle
-from openai import OpenAI
+import threading
+import time
 import os
 from dotenv import load_dotenv
+from embedding_cache import EmbeddingCache, EMBED_MODEL
+from ann_index import search_params
+from doc_store import DocStore
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from llm_client import llm
+from metrics import span
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+logger = logging.getLogger(__name__)
 
 INDEX_FILE = "data/faiss_index.bin"
-DOCS_FILE = "data/faiss_docs.pkl"
+DOCS_FILE = "data/faiss_docs.bin"
+VERSION_FILE = "data/faiss_index.version"
+LEXICAL_FILE_NAME = "bm25_index.npz"  # written by build_index.py next to the docs file
+
+# Memory-map the index instead of reading it onto the heap, so gunicorn
+# workers on the same host share the page cache.
+USE_MMAP = os.getenv("FAISS_MMAP", "0") == "1"
+# Seconds between checks for a newer index written by build_index.py.
+RELOAD_CHECK_INTERVAL = float(os.getenv("FAISS_RELOAD_INTERVAL", "2"))
+# "hybrid" fuses FAISS and BM25 rankings, "dense" is FAISS only, "lexical" is
+# BM25 only (no embedding call). Hybrid falls back to lexical if embedding fails.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Candidates taken from each ranking per requested doc, and the RRF constant.
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "4"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+def _embed_openai(text: str):
+    return llm.embeddings(text, EMBED_MODEL).data[0].embedding
+
+
+def _embed_openai_batch(texts):
+    resp = llm.embeddings(texts, EMBED_MODEL)
+    return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+
+embedding_cache = EmbeddingCache(_embed_openai, embed_batch_fn=_embed_openai_batch)
 
 
 def embed(text: str):
-    """Generate embeddings from OpenAI."""
-    return client.embeddings.create(model="text-embedding-3-small", input=text).data[0].embedding
+    """Generate embeddings from OpenAI, served from the embedding cache when possible."""
+    return embedding_cache.embed(text)
 
 
-def retrieve(query: str, k: int = 3, required_tables=None, mode="any", max_len=2000):
+class Retriever:
+    """
+    Holds the FAISS index, BM25 index and document store in memory for the whole process.
+
+    The files are loaded once and swapped in as a single snapshot, so readers
+    never see a new index paired with old docs. A reload happens when
+    build_index.py publishes a new version.
     """
-    Retrieve relevant documents from FAISS with validation.
+
+    def __init__(self, index_file=INDEX_FILE, docs_file=DOCS_FILE, version_file=VERSION_FILE,
+                 mmap=USE_MMAP, check_interval=RELOAD_CHECK_INTERVAL, lexical_file=None):
+        self.index_file = index_file
+        self.docs_file = docs_file
+        self.version_file = version_file
+        self.lexical_file = lexical_file or os.path.join(os.path.dirname(docs_file), LEXICAL_FILE_NAME)
+        self.mmap = mmap
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None  # (index, docs, lexical, version)
+        self._last_check = 0.0
+
+    def _current_version(self):
+        """Version token written by build_index.py, falling back to file mtimes."""
+        try:
+            with open(self.version_file, "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return f"{os.stat(self.index_file).st_mtime_ns}:{os.stat(self.docs_file).st_mtime_ns}"
+
+    def _read_index(self):
+        if self.mmap:
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+            return faiss.read_index(self.index_file, flags)
+        return faiss.read_index(self.index_file)
+
+    def _load(self):
+        # Re-read if the version changed while we were loading (a build finished mid-read).
+        for _ in range(3):
+            version = self._current_version()
+            index = self._read_index()
+            docs = DocStore.open(self.docs_file)
+            lexical = self._read_lexical(docs)
+            if self._current_version() == version:
+                break
+        id_positions(index)  # built here, once per loaded index, rather than on a query
+        logger.info("Loaded FAISS index with %d vectors (version %s)", index.ntotal, version)
+        return index, docs, lexical, version
+
+    def _read_lexical(self, docs):
+        """The BM25 index published with the docs, or one built in memory if it is missing or stale."""
+        if os.path.exists(self.lexical_file):
+            lexical = BM25Index.load(self.lexical_file)
+            if len(lexical) == len(docs) and np.array_equal(np.sort(lexical.ids), docs.ids):
+                return lexical
+        return BM25Index.build(docs)
+
+    def state(self):
+        """Return the current (index, docs, lexical) triple, reloading if a new build was published."""
+        snap = self._snapshot
+        now = time.monotonic()
+        if snap is not None and now - self._last_check < self.check_interval:
+            return snap[:3]
+
+        with self._lock:
+            snap = self._snapshot
+            if snap is None or self._current_version() != snap[3]:
+                self._snapshot = snap = self._load()
+            self._last_check = now
+        return snap[:3]
+
+    def snapshot(self):
+        """Return the current (index, docs) pair."""
+        return self.state()[:2]
+
+    def search(self, q_emb, k: int, nprobe=None, ef_search=None):
+        """
+        Search the index with a (n, dim) float32 matrix; returns (D, I, docs).
+
+        nprobe / ef_search only apply to IVF / HNSW indexes and are passed per
+        call, so concurrent requests can use different values.
+        """
+        index, docs = self.snapshot()
+        params = search_params(index, nprobe, ef_search)
+        if params is None:
+            D, I = index.search(q_emb, k)
+        else:
+            D, I = index.search(q_emb, k, params=params)
+        return D, I, docs
+
+    def rank(self, query, q_emb, n: int, nprobe=None, ef_search=None):
+        """
+        Doc ids ranked by reciprocal-rank fusion of the top-n FAISS hits for
+        q_emb and the top-n BM25 hits for query; either may be None to use the
+        other ranking alone. Returns (ids, index, docs, lexical) from one snapshot.
+        """
+        index, docs, lexical = self.state()
+        rankings = []
+        if q_emb is not None:
+            params = search_params(index, nprobe, ef_search)
+            with span("faiss_search"):
+                if params is None:
+                    _, I = index.search(q_emb, n)
+                else:
+                    _, I = index.search(q_emb, n, params=params)
+            rankings.append([int(i) for i in I[0] if i >= 0])
+        if query is not None:
+            with span("lexical_search"):
+                rankings.append(lexical.search(query, n)[0].tolist())
+        ids = rankings[0] if len(rankings) == 1 else reciprocal_rank_fusion(rankings, RRF_K)
+        return ids, index, docs, lexical
+
+    def rank_many(self, queries, q_embs, n: int, nprobe=None, ef_search=None):
+        """
+        rank() for several queries: one FAISS search over the (len(queries), dim)
+        matrix q_embs, then BM25 and fusion per query. Returns (list of ids
+        per query, index, docs, lexical) from one snapshot.
+        """
+        index, docs, lexical = self.state()
+        dense = [None] * len(queries)
+        if q_embs is not None:
+            params = search_params(index, nprobe, ef_search)
+            with span("faiss_search", batch=len(queries)):
+                if params is None:
+                    _, I = index.search(q_embs, n)
+                else:
+                    _, I = index.search(q_embs, n, params=params)
+            dense = [[int(i) for i in row if i >= 0] for row in I]
+        ranked = []
+        for query, dense_ids in zip(queries, dense):
+            rankings = [] if dense_ids is None else [dense_ids]
+            if query is not None:
+                with span("lexical_search"):
+                    rankings.append(lexical.search(query, n)[0].tolist())
+            ranked.append(rankings[0] if len(rankings) == 1 else reciprocal_rank_fusion(rankings, RRF_K))
+        return ranked, index, docs, lexical
+
+    def reload(self):
+        """Force a reload on the next access."""
+        with self._lock:
+            self._snapshot = None
+
+
+_RETRIEVER = None
+_RETRIEVER_LOCK = threading.Lock()
+
+
+def get_retriever() -> Retriever:
+    global _RETRIEVER
+    if _RETRIEVER is None:
+        with _RETRIEVER_LOCK:
+            if _RETRIEVER is None:
+                _RETRIEVER = Retriever()
+    return _RETRIEVER
+
+
+_ID_POSITIONS = (None, None)
+
+
+def id_positions(index):
+    """
+    (sorted FAISS ids, their positions) of an IndexIDMap, or None for other
+    indexes; memoized per loaded index, since building it scans every id.
+    """
+    global _ID_POSITIONS
+    cached_index, positions = _ID_POSITIONS
+    if cached_index is not index:
+        try:
+            id_map = faiss.vector_to_array(index.id_map)
+        except AttributeError:
+            positions = None
+        else:
+            order = np.argsort(id_map, kind="stable")
+            positions = (id_map[order], order)
+        _ID_POSITIONS = (index, positions)
+    return positions
+
+
+def stored_vectors(index, ids):
+    """Vectors stored in an IndexIDMap for the given ids, or None if the index can't reconstruct them."""
+    positions = id_positions(index)
+    if not ids or positions is None:
+        return None
+    sorted_ids, order = positions
+    wanted = np.asarray(ids, dtype=sorted_ids.dtype)
+    at = np.searchsorted(sorted_ids, wanted)
+    if (at >= len(sorted_ids)).any() or (sorted_ids[np.minimum(at, len(sorted_ids) - 1)] != wanted).any():
+        return None
+    try:
+        return np.vstack([index.index.reconstruct(int(p)) for p in order[at]])
+    except RuntimeError:
+        return None
+
+
+def select_docs(ranked_ids, docs, lexical, k, required_tables=None, mode="any", max_len=2000):
+    """
+    Ids of the best k docs from a ranking, dropping empty, oversized or
+    off-topic ones. The table filter is a lookup in the BM25 index's table
+    postings. Falls back to the top k unfiltered if nothing is left.
+    """
+    allowed = lexical.ids_with_tables(required_tables, mode) if required_tables else None
+    selected = []
+    for doc_id in ranked_ids:
+        text = docs.text(doc_id)
+        if not text.strip() or len(text) > max_len:
+            continue
+        if allowed is not None and doc_id not in allowed:
+            continue
+        selected.append(doc_id)
+        if len(selected) == k:
+            break
+
+    if not selected:
+        logger.warning("No validated docs found. Returning top k unfiltered docs.")
+        selected = ranked_ids[:k]
+    return selected
+
+
+def search_docs(query, q_emb, k, required_tables=None, mode="any", max_len=2000, nprobe=None, ef_search=None):
+    """Rank with whichever of query (BM25) / q_emb (FAISS) is given, then select the best k docs."""
+    ids, _, docs, lexical = get_retriever().rank(query, q_emb, max(k, k * RETRIEVAL_CANDIDATES), nprobe, ef_search)
+    return [docs.text(i) for i in select_docs(ids, docs, lexical, k, required_tables, mode, max_len)]
+
+
+def search_context(query, q_emb, k):
+    """
+    Candidates for context building, from one snapshot: (texts, vectors,
+    schema_texts). vectors are the stored embeddings of the candidates (None
+    if the index can't reconstruct them); schema_texts are all schema chunks
+    in build order.
+    """
+    ids, index, docs, lexical = get_retriever().rank(query, q_emb, max(k, k * RETRIEVAL_CANDIDATES))
+    ids = select_docs(ids, docs, lexical, k)
+    return [docs.text(i) for i in ids], stored_vectors(index, ids), schema_texts(docs)
+
+
+def search_context_many(queries, q_embs, k):
+    """search_context() for a batch of queries, with one FAISS search for all of them."""
+    ranked, index, docs, lexical = get_retriever().rank_many(queries, q_embs, max(k, k * RETRIEVAL_CANDIDATES))
+    schema = schema_texts(docs)
+    contexts = []
+    for ids in ranked:
+        ids = select_docs(ids, docs, lexical, k)
+        contexts.append(([docs.text(i) for i in ids], stored_vectors(index, ids), schema))
+    return contexts
+
+
+_SCHEMA_TEXTS = (None, [])
+
+
+def schema_texts(docs):
+    """Schema chunk texts (ids "schema-N") in build order, memoized per docs snapshot."""
+    global _SCHEMA_TEXTS
+    cached_docs, texts = _SCHEMA_TEXTS
+    if cached_docs is not docs:
+        if isinstance(docs, DocStore):
+            chunks = [docs[i] for i in docs.ids_of_type("schema")]
+        else:
+            items = docs.values() if isinstance(docs, dict) else docs
+            chunks = [d for d in items if str(d.get("id", "")).startswith("schema-")]
+        texts = [d["text"] for d in sorted(chunks, key=lambda d: int(d["id"].split("-")[1]))]
+        _SCHEMA_TEXTS = (docs, texts)
+    return texts
+
+
+def query_inputs(query: str, search_mode=None):
+    """
+    (lexical_query, q_emb) for a search mode: the query text for BM25 unless
+    dense-only, and its embedding unless lexical-only. Hybrid drops to
+    lexical if the embedding call fails.
+    """
+    search_mode = search_mode or RETRIEVAL_MODE
+    q_emb = None
+    if search_mode != "lexical":
+        try:
+            with span("embed"):
+                q_emb = np.array([embed(query)], dtype="float32")
+        except Exception as e:
+            if search_mode == "dense":
+                raise
+            logger.warning("Embedding failed (%s), using lexical retrieval only", e.__class__.__name__)
+    return (query if search_mode != "dense" else None), q_emb
+
+
+def query_inputs_many(queries, search_mode=None):
+    """
+    query_inputs() for a batch: cache misses are embedded in one request and
+    q_embs is a (len(queries), dim) matrix, or None for lexical-only (or if
+    the embedding call fails in hybrid mode).
+    """
+    search_mode = search_mode or RETRIEVAL_MODE
+    q_embs = None
+    if search_mode != "lexical":
+        try:
+            with span("embed", batch=len(queries)):
+                q_embs = np.array(embedding_cache.embed_many(list(queries)), dtype="float32")
+        except Exception as e:
+            if search_mode == "dense":
+                raise
+            logger.warning("Batch embedding failed (%s), using lexical retrieval only", e.__class__.__name__)
+    lexical_queries = list(queries) if search_mode != "dense" else [None] * len(queries)
+    return lexical_queries, q_embs
+
+
+def retrieve(query: str, k: int = 3, required_tables=None, mode="any", max_len=2000, nprobe=None, ef_search=None,
+             search_mode=None):
+    """
+    Retrieve relevant documents (FAISS + BM25) with validation.
     
     :param query: User question
     :param k: Number of docs to retrieve
     :param required_tables: List of table names to check in docs
     :param mode: "any" (doc contains any table) or "all" (doc must contain all tables)
     :param max_len: Max length of a doc to include
+    :param nprobe: IVF lists to visit (defaults to FAISS_NPROBE)
+    :param ef_search: HNSW search depth (defaults to FAISS_EF_SEARCH)
+    :param search_mode: "hybrid", "dense" or "lexical" (defaults to RETRIEVAL_MODE)
     :return: List of validated doc texts
     """
-    # Load FAISS index
-    index = faiss.read_index(INDEX_FILE)
-    print(f"✅ Loaded FAISS index with {index.ntotal} vectors")
-
-    # Load docs
-    with open(DOCS_FILE, "rb") as f:
-        docs = pickle.load(f)
+    lexical_query, q_emb = query_inputs(query, search_mode)
+    validated_docs = search_docs(lexical_query, q_emb, k, required_tables, mode, max_len, nprobe, ef_search)
 
-    # Embed query
-    q_emb = np.array([embed(query)], dtype="float32")
-    D, I = index.search(q_emb, k)
-
-    retrieved_texts = [docs[i]["text"] for i in I[0]]
-
-    # Validate docs
-    validated_docs = []
-    for doc in retrieved_texts:
-        if not doc.strip():
-            continue
-        if len(doc) > max_len:
-            continue
-        if required_tables:
-            tables_found = [table.lower() in doc.lower() for table in required_tables]
-            if mode == "all" and not all(tables_found):
-                continue
-            if mode == "any" and not any(tables_found):
-                continue
-        validated_docs.append(doc)
-
-    if not validated_docs:
-        print("⚠️ No validated docs found. Returning top k unfiltered docs.")
-        validated_docs = retrieved_texts
-
-    print(f"🔍 Retrieved {len(validated_docs)} validated documents for query: {query}")
+    logger.debug("Retrieved %d validated documents for query: %s", len(validated_docs), query)
     return validated_docs
 
 
@@ -73,4 +383,4 @@ if __name__ == "__main__":
     docs = retrieve(query, k=10, required_tables=required_tables, mode="all")
     for i, doc in enumerate(docs, 1):
         print(f"--- Doc {i} ---\n{doc}\n")
-    print(f"Total docs retrieved: {len(docs)}")
\ No newline at end of file
+    print(f"Total docs retrieved: {len(docs)}")
@@ -0,0 +1,217 @@
+# single_flight.py
+#
+# Coalesces identical in-flight requests: the first caller for a key runs
+# the computation, callers that arrive while it is running wait for it and
+# get the same result (or exception). Works across threads (SingleFlight)
+# and asyncio tasks (AsyncSingleFlight); with COALESCE_LOCK_DIR set, also
+# across worker processes on one host through a lock file per key, with the
+# leader's result left next to it for the processes that waited.
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from dotenv import load_dotenv
+
+from metrics import Counter
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+COALESCE_ENABLED = os.getenv("COALESCE", "1") == "1"
+# Directory for cross-process lock / result files (e.g. /dev/shm/ragbot); empty keeps coalescing per process.
+COALESCE_LOCK_DIR = os.getenv("COALESCE_LOCK_DIR", "")
+# Longest a process waits for another process's computation before running its own.
+COALESCE_TIMEOUT = float(os.getenv("COALESCE_TIMEOUT", "60"))
+# Seconds result files are kept for processes that were waiting on them.
+RESULT_TTL = 60.0
+
+COALESCED = Counter("rag_coalesced_requests_total",
+                    "Requests answered by another request's in-flight computation.", ("scope",))
+
+
+def flight_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class FileFlight:
+    """
+    Cross-process coalescing through flock()ed files in `directory`. The
+    holder of <key>.lock computes and writes <key>.json; a process that
+    waited on the lock uses that file if it was written after it started
+    waiting. Results must be JSON serializable.
+    """
+
+    def __init__(self, directory, timeout=COALESCE_TIMEOUT, poll=0.01):
+        self.directory = directory
+        self.timeout = timeout
+        self.poll = poll
+        self._last_prune = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key):
+        name = flight_key(key)
+        return os.path.join(self.directory, f"{name}.lock"), os.path.join(self.directory, f"{name}.json")
+
+    def acquire(self, key):
+        """
+        Wait for the key's lock. Returns (fd, result) where result is the
+        value another process finished while we waited (then fd is already
+        released and None), or (fd, None) when we hold the lock and must
+        compute. fd is None if the wait timed out.
+        """
+        lock_path, result_path = self._paths(key)
+        since = time.time()
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    logger.warning("Timed out waiting for another worker on %s", lock_path)
+                    return None, None
+                waited = True
+                time.sleep(self.poll)
+        if waited:
+            try:
+                if os.stat(result_path).st_mtime >= since:
+                    with open(result_path, encoding="utf-8") as f:
+                        result = json.load(f)
+                    self.release(fd)
+                    return None, result
+            except (FileNotFoundError, ValueError):
+                pass
+        return fd, None
+
+    def store(self, key, value):
+        _, result_path = self._paths(key)
+        tmp = f"{result_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(value, f, default=str)
+        os.replace(tmp, result_path)
+        self._prune()
+
+    def release(self, fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < RESULT_TTL:
+            return
+        self._last_prune = now
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith(".json") and now - entry.stat().st_mtime > RESULT_TTL:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+class SingleFlight:
+    """Thread-level coalescing, optionally backed by a FileFlight for other processes."""
+
+    def __init__(self, files=None):
+        self.files = files
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers with the same key; returns (value, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            COALESCED.inc(scope="thread")
+            return call.result(), True
+
+        try:
+            value, shared = self._run(key, fn)
+        except BaseException as e:
+            with self._lock:
+                del self._calls[key]
+            call.set_exception(e)
+            raise
+        with self._lock:
+            del self._calls[key]
+        call.set_result(value)
+        return value, shared
+
+    def _run(self, key, fn):
+        if self.files is None:
+            return fn(), False
+        fd, result = self.files.acquire(key)
+        if result is not None:
+            COALESCED.inc(scope="process")
+            return result, True
+        if fd is None:
+            return fn(), False
+        try:
+            value = fn()
+            self.files.store(key, value)
+            return value, False
+        finally:
+            self.files.release(fd)
+
+
+class AsyncSingleFlight:
+    """
+    asyncio coalescing: the leader's computation runs as its own task that
+    every caller awaits through shield(), so one caller being cancelled does
+    not cancel it for the others.
+    """
+
+    def __init__(self, files=None):
+        self.files = files
+        self._tasks = {}
+
+    async def do(self, key, coro_fn):
+        """Await coro_fn() once for all concurrent callers with the same key; returns (value, shared)."""
+        task = self._tasks.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            COALESCED.inc(scope="async")
+            value, _ = await asyncio.shield(task)
+            return value, True
+        task = asyncio.ensure_future(self._run(key, coro_fn))
+        self._tasks[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, so an unawaited failure is not logged as lost
+
+    async def _run(self, key, coro_fn):
+        if self.files is None:
+            return await coro_fn(), False
+        fd, result = await asyncio.to_thread(self.files.acquire, key)
+        if result is not None:
+            COALESCED.inc(scope="process")
+            return result, True
+        if fd is None:
+            return await coro_fn(), False
+        try:
+            value = await coro_fn()
+            self.files.store(key, value)
+            return value, False
+        finally:
+            self.files.release(fd)
+
+
+_files = FileFlight(COALESCE_LOCK_DIR) if COALESCE_LOCK_DIR else None
+flights = SingleFlight(_files)
+async_flights = AsyncSingleFlight(_files)
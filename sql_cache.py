@@ -0,0 +1,118 @@
+# sql_cache.py
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from sql_validator import canonicalize_sql, referenced_tables
+from table_versions import table_versions
+
+load_dotenv()
+
+SQL_CACHE_ENABLED = os.getenv("SQL_CACHE", "1") == "1"
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "500"))
+SQL_CACHE_MAX_BYTES = int(os.getenv("SQL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Results larger than this are returned but never cached.
+SQL_CACHE_MAX_ROWS = int(os.getenv("SQL_CACHE_MAX_ROWS", "5000"))
+SQL_CACHE_MAX_ENTRY_BYTES = int(os.getenv("SQL_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+
+
+class SqlResultCache:
+    """
+    Result cache for generated SQL, keyed by the canonical query text and the
+    row cap the result was collected with.
+
+    Values are the result dicts built by rag.run_sql_query() (rows plus row
+    count and summary), without the query text. Each entry remembers the
+    versions of the tables the query read; an entry is dropped on lookup if
+    any of those tables has been bumped since. The cache is LRU-bounded both
+    by entry count and by the total (JSON) size of the cached rows.
+    """
+
+    def __init__(self, max_entries=SQL_CACHE_SIZE, max_bytes=SQL_CACHE_MAX_BYTES, max_rows=SQL_CACHE_MAX_ROWS,
+                 max_entry_bytes=SQL_CACHE_MAX_ENTRY_BYTES, versions=table_versions):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.max_entry_bytes = max_entry_bytes
+        self.versions = versions
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.skipped = 0
+
+    @staticmethod
+    def key(sql: str, row_cap=None) -> tuple:
+        try:
+            return canonicalize_sql(sql), row_cap
+        except ValueError:
+            return sql.strip(), row_cap
+
+    def get(self, sql: str, row_cap=None):
+        """Cached result for this query and row cap, or None."""
+        key = self.key(sql, row_cap)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self.versions.is_current(entry["tables"]):
+                self._drop(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["value"]
+
+    def put(self, sql: str, value: dict, tables=None, row_cap=None):
+        """
+        Cache a result for this query unless its rows exceed the row or byte limit.
+
+        Pass `tables` as captured before the query ran, so a write that lands
+        mid-query leaves the entry already stale.
+        """
+        if tables is None:
+            tables = self.versions.snapshot(referenced_tables(sql))
+        if len(value["result"]) > self.max_rows:
+            self.skipped += 1
+            return False
+        size = len(json.dumps(value, default=str))
+        if size > self.max_entry_bytes:
+            self.skipped += 1
+            return False
+
+        key = self.key(sql, row_cap)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {"value": value, "tables": tables, "bytes": size}
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+        return True
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)["bytes"]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "skipped": self.skipped,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
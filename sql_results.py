@@ -0,0 +1,91 @@
+# sql_results.py
+
+import json
+from decimal import Decimal
+from numbers import Number
+
+
+def serialize_row(row):
+    """
+    Convert row values to JSON-serializable types and auto-generate user-friendly labels.
+    """
+    new_row = {}
+    for k, v in row._mapping.items():
+        label = to_friendly_label(k)  # automatically generate friendly label
+        new_row[label] = float(v) if isinstance(v, Decimal) else v
+    return new_row
+
+# Dictionary of common columns → human-friendly names
+COLUMN_PREDICTIONS = {
+    "avg_salary": "Average Salary",
+    "salary": "Salary",
+    "dept": "Department",
+    "department": "Department",
+    "first_name": "First Name",
+    "last_name": "Last Name",
+    "city": "City",
+    "project_name": "Project Name",
+    "employee_id": "Employee ID",
+    "hire_date": "Hire Date",
+    "manager_id": "Manager ID",
+    # Add more common patterns if needed
+}
+
+def to_friendly_label(col_name):
+    """Convert DB column name to human-readable label using prediction dictionary."""
+    col_lower = col_name.lower()
+    if col_lower in COLUMN_PREDICTIONS:
+        return COLUMN_PREDICTIONS[col_lower]
+    # fallback: convert snake_case → Title Case
+    return col_name.replace("_", " ").title()
+
+
+class StreamingSummary:
+    """
+    Per-column statistics accumulated one row at a time.
+
+    Every column gets a non-null count; columns whose values are all numeric
+    also get min / max / avg. Memory use is constant in the number of rows.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.row_count = 0
+        self._stats = [{"non_null": 0, "min": None, "max": None, "sum": 0.0, "numeric": True}
+                       for _ in self.columns]
+
+    def add(self, values):
+        self.row_count += 1
+        for stat, v in zip(self._stats, values):
+            if v is None:
+                continue
+            stat["non_null"] += 1
+            if not stat["numeric"]:
+                continue
+            if isinstance(v, bool) or not isinstance(v, Number):
+                stat["numeric"] = False
+                continue
+            v = float(v)
+            stat["sum"] += v
+            stat["min"] = v if stat["min"] is None else min(stat["min"], v)
+            stat["max"] = v if stat["max"] is None else max(stat["max"], v)
+
+    def to_dict(self) -> dict:
+        columns = {}
+        for name, stat in zip(self.columns, self._stats):
+            entry = {"non_null": stat["non_null"]}
+            if stat["numeric"] and stat["non_null"]:
+                entry.update(min=stat["min"], max=stat["max"], avg=round(stat["sum"] / stat["non_null"], 4))
+            columns[name] = entry
+        return {"row_count": self.row_count, "columns": columns}
+
+
+def encode_rows(rows) -> str:
+    """Compact prompt encoding: one header list followed by one value list per row."""
+    if not rows:
+        return "[]"
+    header = list(rows[0].keys())
+    lines = [json.dumps(header, ensure_ascii=False, default=str, separators=(",", ":"))]
+    lines.extend(json.dumps(list(r.values()), ensure_ascii=False, default=str, separators=(",", ":"))
+                 for r in rows)
+    return "\n".join(lines)
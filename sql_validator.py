@@ -1,3 +1,15 @@
+import os
+import re
+from difflib import get_close_matches
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Distinct SQL strings whose analysis is memoized.
+SQL_PARSE_CACHE_SIZE = int(os.getenv("SQL_PARSE_CACHE_SIZE", "2048"))
+
 SCHEMA = {
     "employees": {
         "employee_id", "first_name", "last_name", "email", "phone",
@@ -15,12 +27,611 @@ SCHEMA = {
 }
 
 
+def referenced_tables(sql: str):
+    """Schema tables mentioned anywhere in the SQL."""
+    words = set(re.findall(r"[a-z_]+", sql.lower()))
+    return sorted(t for t in SCHEMA if t in words)
+
+
+# ------------------------
+# Tokenizing / canonical form
+# ------------------------
+SQL_KEYWORDS = {
+    "select", "distinct", "from", "where", "and", "or", "not", "in", "is", "null", "like", "between",
+    "exists", "join", "inner", "left", "right", "outer", "full", "cross", "on", "using", "as", "group",
+    "by", "having", "order", "asc", "desc", "limit", "offset", "union", "all", "case", "when", "then",
+    "else", "end", "with", "true", "false", "interval", "div", "mod", "regexp", "over", "partition",
+    "insert", "update", "delete", "drop", "alter", "create", "replace", "truncate", "grant", "revoke",
+    "into", "values", "set", "rename", "call", "load", "handler", "lock", "unlock", "for", "share",
+}
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<ws>\s+)
+    | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+    | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    | (?P<quoted>`(?:[^`]|``)*`)
+    | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|\.\d+)
+    | (?P<name>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<op><=>|<=|>=|<>|!=|\|\||&&|[-+*/%=<>!~^&|])
+    | (?P<punct>[(),.;?@:])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+def scan_sql(sql: str):
+    """Yield (kind, value, start, end) for every token, comments included."""
+    pos = 0
+    while pos < len(sql):
+        m = _TOKEN_RE.match(sql, pos)
+        if m is None:
+            raise ValueError(f"Unexpected character {sql[pos]!r} at position {pos}")
+        pos = m.end()
+        kind = m.lastgroup
+        value = m.group()
+        if kind == "ws":
+            continue
+        if kind == "quoted":
+            kind, value = "name", value[1:-1].replace("``", "`")
+        if kind == "name":
+            value = value.lower()
+            if value in SQL_KEYWORDS:
+                kind = "keyword"
+        yield kind, value, m.start(), pos
+
+
+def tokenize_sql(sql: str):
+    """
+    Split SQL into (kind, value) tokens, dropping whitespace and comments.
+
+    kind is one of keyword / name / string / number / op / punct. Keywords are
+    lowercased; names are lowercased with backticks removed; literals are kept
+    verbatim.
+    """
+    return [(kind, value) for kind, value, _, _ in scan_sql(sql) if kind != "comment"]
+
+
+def compact_sql(sql: str) -> str:
+    """SQL with comments dropped and every run of whitespace collapsed to one space."""
+    out, last_end = [], None
+    for kind, _, start, end in scan_sql(sql):
+        if kind == "comment":
+            continue
+        if last_end is not None and start > last_end:
+            out.append(" ")
+        out.append(sql[start:end])
+        last_end = end
+    return "".join(out)
+
+
+def canonicalize_sql(sql: str) -> str:
+    """
+    Canonical text of a query for cache keys.
+
+    Whitespace, comments, keyword/identifier case, INNER/OUTER noise words and
+    trailing semicolons are normalized, and table aliases are renamed to t1,
+    t2, ... in order of appearance (a table referenced without an alias gets
+    one too), so `FROM employees e ... e.city` and
+    `FROM employees AS T1 ... T1.city` match. Literals and column aliases are
+    kept as written.
+    """
+    tokens = tokenize_sql(sql)
+    while tokens and tokens[-1] == ("punct", ";"):
+        tokens.pop()
+    tokens = [
+        t for i, t in enumerate(tokens)
+        if not (t in (("keyword", "inner"), ("keyword", "outer"))
+                and i + 1 < len(tokens) and tokens[i + 1] == ("keyword", "join"))
+    ]
+
+    # Pass 1: find table references after FROM / JOIN and assign canonical aliases.
+    aliases = {}
+    table_at = {}  # position of a table name -> (canonical alias, position of its written alias or None)
+    for i, (kind, value) in enumerate(tokens):
+        if (kind, value) not in (("keyword", "from"), ("keyword", "join")):
+            continue
+        j = i + 1
+        if j >= len(tokens) or tokens[j][0] != "name":
+            continue
+        if j + 2 < len(tokens) and tokens[j + 1] == ("punct", "."):
+            j += 2  # schema-qualified table
+        canonical = f"t{len(table_at) + 1}"
+        aliases.setdefault(tokens[j][1], canonical)
+        k = j + 2 if j + 1 < len(tokens) and tokens[j + 1] == ("keyword", "as") else j + 1
+        if k < len(tokens) and tokens[k][0] == "name":
+            aliases[tokens[k][1]] = canonical
+            table_at[j] = (canonical, k)
+        else:
+            table_at[j] = (canonical, None)
+    alias_positions = {k: j for j, (_, k) in table_at.items() if k is not None}
+
+    # Pass 2: emit, rewriting alias definitions and alias-qualified columns.
+    out = []
+    for i, (kind, value) in enumerate(tokens):
+        if i in table_at:
+            out.extend([value, "AS", table_at[i][0]])
+        elif i in alias_positions or (kind, value) == ("keyword", "as") and i + 1 in alias_positions:
+            continue
+        elif kind == "name" and value in aliases and i + 1 < len(tokens) and tokens[i + 1] == ("punct", "."):
+            out.append(aliases[value])
+        elif kind == "keyword":
+            out.append(value.upper())
+        else:
+            out.append(value)
+    return " ".join(out).replace(" . ", ".")
+
+
+# ------------------------
+# Parsing / validation
+# ------------------------
+# Keywords that end an expression at nesting depth 0.
+_CLAUSE_END = {
+    "from", "where", "group", "having", "order", "limit", "offset", "union", "join", "inner", "left",
+    "right", "full", "cross", "on", "using", "as", "asc", "desc", "into", "for", "lock", "with",
+}
+_JOIN_WORDS = {"inner", "left", "right", "full", "cross", "outer", "natural"}
+# Bare words inside expressions that are never column references
+# (INTERVAL / EXTRACT units, CAST / CONVERT types, window frames, niladic functions).
+_NON_COLUMNS = {
+    "microsecond", "second", "minute", "hour", "day", "week", "month", "quarter", "year",
+    "second_microsecond", "minute_second", "hour_minute", "day_hour", "day_minute", "day_second",
+    "year_month", "char", "signed", "unsigned", "decimal", "date", "datetime", "time", "integer",
+    "int", "binary", "json", "double", "float", "unbounded", "preceding", "following", "current",
+    "row", "rows", "range", "current_date", "current_time", "current_timestamp", "localtime",
+    "localtimestamp", "utc_date", "utc_time", "utc_timestamp", "separator", "rollup",
+}
+
+
+class _ParseError(ValueError):
+    pass
+
+
+class _UnsafeError(_ParseError):
+    pass
+
+
+class Query:
+    """A SELECT statement: optional CTEs, one or more UNIONed cores, and whether it ends in LIMIT."""
+
+    def __init__(self):
+        self.ctes = []  # (name, Query)
+        self.selects = []
+        self.has_limit = False
+
+
+class Select:
+    """One SELECT core: its FROM sources, column references and nested subqueries."""
+
+    def __init__(self):
+        self.sources = []  # (table name or None, alias or None, derived Query or None)
+        self.refs = []  # (clause, qualifier or None, column)
+        self.subqueries = []
+        self.outputs = set()  # names usable by ORDER BY / GROUP BY / HAVING and by an outer query
+        self.open_outputs = False  # SELECT * or an unnamed expression: output names not fully known
+        self.using = set()
+        self.has_limit = False
+
+
+class _Parser:
+    """Recursive-descent parser over tokenize_sql() tokens, building Query / Select nodes."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else (None, None)
+
+    def next(self):
+        tok = self.peek()
+        self.pos += 1
+        return tok
+
+    def accept(self, *values):
+        if self.peek()[1] in values and self.peek()[0] in ("keyword", "punct"):
+            return self.next()[1]
+        return None
+
+    def expect(self, value):
+        if self.accept(value) is None:
+            raise _ParseError(f"expected {value.upper()} near {self.near()}")
+
+    def near(self):
+        kind, value = self.peek()
+        return "end of query" if kind is None else repr(value)
+
+    # --- statements ---
+    def query(self) -> Query:
+        q = Query()
+        if self.accept("with"):
+            self.accept("recursive")
+            while True:
+                name = self.name()
+                if self.peek() == ("punct", "("):  # column list
+                    self.skip_parens()
+                self.expect("as")
+                self.expect("(")
+                q.ctes.append((name, self.query()))
+                self.expect(")")
+                if not self.accept(","):
+                    break
+        q.selects.append(self.select())
+        while self.accept("union"):
+            self.accept("all") or self.accept("distinct")
+            q.selects.append(self.select())
+        q.has_limit = q.selects[-1].has_limit
+        return q
+
+    def select(self) -> Select:
+        sel = Select()
+        self.expect("select")
+        self.accept("distinct") or self.accept("all")
+        while True:
+            self.select_item(sel)
+            if not self.accept(","):
+                break
+        if self.accept("into"):
+            raise _UnsafeError("SELECT ... INTO is not allowed")
+        if self.accept("from"):
+            self.sources(sel)
+        if self.accept("where"):
+            self.expr(sel, "where")
+        if self.accept("group"):
+            self.expect("by")
+            self.expr_list(sel, "group")
+            if self.accept("with"):
+                self.name()  # ROLLUP
+        if self.accept("having"):
+            self.expr(sel, "having")
+        if self.accept("order"):
+            self.expect("by")
+            self.expr_list(sel, "order")
+        if self.accept("limit"):
+            self.limit_value()
+            if self.accept(",") or self.accept("offset"):
+                self.limit_value()
+            sel.has_limit = True
+        if self.peek()[1] in ("for", "lock", "into"):
+            raise _UnsafeError("locking reads and SELECT ... INTO are not allowed")
+        return sel
+
+    def select_item(self, sel):
+        if self.peek() == ("op", "*"):
+            self.next()
+            sel.open_outputs = True
+            return
+        single = self.expr(sel, "select")
+        alias = None
+        if self.accept("as"):
+            alias = self.alias()
+        elif self.peek()[0] in ("name", "string"):
+            alias = self.alias()
+        if alias:
+            sel.outputs.add(alias)
+        elif single == "*":
+            sel.open_outputs = True
+        elif single:
+            sel.outputs.add(single)
+        else:
+            sel.open_outputs = True
+
+    def sources(self, sel):
+        self.source(sel)
+        while True:
+            if self.accept(","):
+                self.source(sel)
+                continue
+            words = []
+            while self.peek()[1] in _JOIN_WORDS and self.peek()[0] == "keyword":
+                words.append(self.next()[1])
+            if not words and self.peek() != ("keyword", "join"):
+                return
+            self.expect("join")
+            self.source(sel)
+            if "natural" in words:
+                sel.using.add("*")  # shared columns may be referenced unqualified
+            elif self.accept("on"):
+                self.expr(sel, "on")
+            elif self.accept("using"):
+                self.expect("(")
+                while True:
+                    column = self.name()
+                    sel.using.add(column)
+                    sel.refs.append(("using", None, column))
+                    if not self.accept(","):
+                        break
+                self.expect(")")
+
+    def source(self, sel):
+        if self.accept("("):
+            if self.peek()[1] not in ("select", "with"):
+                raise _ParseError(f"unsupported FROM clause near {self.near()}")
+            derived = self.query()
+            self.expect(")")
+            self.accept("as")
+            sel.sources.append((None, self.alias(), derived))
+            return
+        table = self.name()
+        if self.accept("."):
+            table = self.name()  # schema-qualified
+        alias = None
+        if self.accept("as") or self.peek()[0] == "name":
+            alias = self.alias()
+        sel.sources.append((table, alias, None))
+
+    def limit_value(self):
+        kind, value = self.next()
+        if kind != "number" and value != "?":
+            raise _ParseError(f"LIMIT expects a number near {value!r}")
+
+    # --- names ---
+    def name(self):
+        kind, value = self.next()
+        if kind != "name":
+            self.pos -= 1
+            raise _ParseError(f"expected a name near {self.near()}")
+        return value
+
+    def alias(self):
+        kind, value = self.next()
+        if kind == "string":
+            return value[1:-1].lower()
+        if kind != "name":
+            self.pos -= 1
+            raise _ParseError(f"expected an alias near {self.near()}")
+        return value
+
+    def skip_parens(self):
+        depth = 0
+        while True:
+            kind, value = self.next()
+            if kind is None:
+                raise _ParseError("unbalanced parentheses")
+            if (kind, value) == ("punct", "("):
+                depth += 1
+            elif (kind, value) == ("punct", ")"):
+                depth -= 1
+                if depth == 0:
+                    return
+
+    # --- expressions ---
+    def expr_list(self, sel, clause):
+        while True:
+            self.expr(sel, clause)
+            self.accept("asc") or self.accept("desc")
+            if not self.accept(","):
+                return
+
+    def expr(self, sel, clause):
+        """
+        Consume one expression, recording column references and parsing
+        subqueries. The expression itself is not built into a tree: only the
+        names it touches matter for validation. Returns the column name if the
+        expression is a single column reference ("*" for `t.*`), else None.
+        """
+        depth = 0
+        start = self.pos
+        prev_operand = False
+        interval = False
+        single = None
+        while True:
+            kind, value = self.peek()
+            if kind is None or (kind, value) == ("punct", ";"):
+                break
+            if depth == 0 and (
+                (kind, value) in (("punct", ","), ("punct", ")"))
+                or (kind == "keyword" and value in _CLAUSE_END
+                    and not (value in ("left", "right") and self.peek(1) == ("punct", "(")))
+                or (kind in ("name", "string") and prev_operand and not interval)
+            ):
+                break
+            self.next()
+            if (kind, value) == ("punct", "("):
+                if self.peek()[1] in ("select", "with") and self.peek()[0] == "keyword":
+                    sel.subqueries.append(self.query())
+                    self.expect(")")
+                    prev_operand = True
+                    continue
+                depth += 1
+                prev_operand = False
+            elif (kind, value) == ("punct", ")"):
+                depth -= 1
+                prev_operand = True
+            elif kind == "name":
+                if interval and prev_operand:
+                    interval = False  # INTERVAL <n> <unit>
+                elif self.peek() == ("punct", "("):
+                    pass  # function call
+                elif self.tokens[self.pos - 2:self.pos - 1] in ([("punct", "@")], [("punct", ":")]):
+                    pass  # variable / bind parameter
+                elif self.tokens[self.pos - 2:self.pos - 1] == [("keyword", "as")]:
+                    pass  # CAST(x AS type)
+                elif self.peek() == ("punct", "."):
+                    self.next()
+                    col_kind, column = self.next()
+                    if column != "*" and col_kind != "name":
+                        raise _ParseError(f"expected a column after '{value}.'")
+                    sel.refs.append((clause, value, column))
+                    single = column if self.pos - start == 3 else None
+                elif value not in _NON_COLUMNS:
+                    sel.refs.append((clause, None, value))
+                    single = value if self.pos - start == 1 else None
+                prev_operand = True
+            elif kind == "keyword":
+                interval = interval or value == "interval"
+                prev_operand = value in ("null", "true", "false", "end")
+            else:
+                prev_operand = kind in ("number", "string")
+        if self.pos == start:
+            raise _ParseError(f"expected an expression near {self.near()}")
+        if depth:
+            raise _ParseError("unbalanced parentheses")
+        return single if self.pos - start in (1, 3) else None
+
+
+def _output_columns(q: Query):
+    """Column names a derived table / CTE exposes, or None if they can't be known statically."""
+    first = q.selects[0]
+    return None if first.open_outputs else frozenset(first.outputs)
+
+
+class _Resolver:
+    """Checks every table and column reference of a parsed Query against SCHEMA."""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.errors = []
+        self.tables = set()
+
+    def error(self, message):
+        if message not in self.errors:
+            self.errors.append(message)
+
+    def query(self, q: Query, parent, ctes):
+        ctes = dict(ctes)
+        for name, sub in q.ctes:
+            self.query(sub, None, ctes)
+            ctes[name] = _output_columns(sub)
+        for sel in q.selects:
+            self.select(sel, parent, ctes)
+
+    def select(self, sel: Select, parent, ctes):
+        # scope: alias -> (label for messages, column set or None when unknown)
+        scope = {}
+        for table, alias, derived in sel.sources:
+            if derived is not None:
+                self.query(derived, None, ctes)
+                label, columns = alias, _output_columns(derived)
+            elif table in ctes:
+                label, columns = table, ctes[table]
+            elif table in self.schema:
+                label, columns = table, self.schema[table]
+                self.tables.add(table)
+            else:
+                self.error(f"unknown table '{table}'" + _suggest(table, self.schema))
+                label, columns = table, None
+            key = alias or table
+            if key in scope:
+                self.error(f"duplicate table alias '{key}'")
+            scope[key] = (label, columns)
+        frame = (scope, sel, parent)
+
+        for clause, qualifier, column in sel.refs:
+            if qualifier is not None:
+                self.qualified(frame, qualifier, column)
+            else:
+                self.bare(frame, clause, column)
+        for sub in sel.subqueries:
+            self.query(sub, frame, ctes)
+
+    def qualified(self, frame, qualifier, column):
+        while frame is not None:
+            scope, _, parent = frame
+            if qualifier in scope:
+                label, columns = scope[qualifier]
+                if columns is not None and column != "*" and column not in columns:
+                    self.error(f"{label} has no column '{column}'" + _suggest(column, columns))
+                return
+            frame = parent
+        self.error(f"unknown table alias '{qualifier}' in {qualifier}.{column}")
+
+    def bare(self, frame, clause, column):
+        if clause in ("group", "having", "order") and column in frame[1].outputs:
+            return  # select-list alias
+        known = set()
+        while frame is not None:
+            scope, sel, parent = frame
+            matches = [label for label, columns in scope.values() if columns is None or column in columns]
+            if any(scope[k][1] is None for k in scope):
+                return
+            if len(matches) > 1 and clause != "using" and column not in sel.using and "*" not in sel.using:
+                self.error(f"ambiguous column '{column}' (in {', '.join(matches)})")
+            if matches:
+                return
+            for _, columns in scope.values():
+                known |= columns
+            frame = parent
+        self.error(f"unknown column '{column}'" + _suggest(column, known))
+
+
+def _suggest(name, candidates):
+    close = get_close_matches(name, sorted(candidates), n=1, cutoff=0.6)
+    return f" (did you mean '{close[0]}'?)" if close else ""
+
+
+class SqlCheck:
+    """
+    Result of analyze_sql().
+
+    errors: problems found (empty when the query is valid against SCHEMA).
+    read_only: a single SELECT statement, safe to execute.
+    tables: schema tables the query reads.
+    has_limit: the outermost query already ends in LIMIT.
+    end: offset just past the last token, where a LIMIT can be appended.
+    """
+
+    __slots__ = ("errors", "read_only", "tables", "has_limit", "end")
+
+    def __init__(self, errors=(), read_only=False, tables=(), has_limit=False, end=0):
+        self.errors = tuple(errors)
+        self.read_only = read_only
+        self.tables = frozenset(tables)
+        self.has_limit = has_limit
+        self.end = end
+
+    @property
+    def valid(self):
+        return not self.errors
+
+
+@lru_cache(maxsize=SQL_PARSE_CACHE_SIZE)
+def analyze_sql(sql: str) -> SqlCheck:
+    """
+    Parse a query and check it against SCHEMA: SELECT-only, a single statement,
+    known tables, table aliases and columns (including ambiguous unqualified
+    columns). Results are memoized per SQL string.
+    """
+    try:
+        scanned = list(scan_sql(sql))
+    except ValueError as e:
+        return SqlCheck([str(e)])
+    if any(kind == "comment" and value.startswith("/*!") for kind, value, _, _ in scanned):
+        return SqlCheck(["executable comments (/*! ... */) are not allowed"])
+    scanned = [t for t in scanned if t[0] != "comment"]
+    while scanned and scanned[-1][:2] == ("punct", ";"):
+        scanned.pop()
+    if not scanned:
+        return SqlCheck(["empty query"])
+    if ("punct", ";") in (t[:2] for t in scanned):
+        return SqlCheck(["only a single statement is allowed"])
+    if scanned[0][:2] not in (("keyword", "select"), ("keyword", "with")):
+        return SqlCheck([f"only SELECT statements are allowed, got {scanned[0][1].upper()}"])
+
+    parser = _Parser([t[:2] for t in scanned])
+    try:
+        query = parser.query()
+        if parser.peek()[0] is not None:
+            raise _ParseError(f"unexpected {parser.near()}")
+    except _ParseError as e:
+        # What the parser can't read can't be shown to be read-only (or to lack a LIMIT): never run it.
+        return SqlCheck([f"could not parse SQL: {e}"], end=scanned[-1][3])
+
+    resolver = _Resolver(SCHEMA)
+    resolver.query(query, None, {})
+    return SqlCheck(resolver.errors, True, resolver.tables, query.has_limit, scanned[-1][3])
+
+
 def validate_sql(sql: str):
-    """Basic validation to catch hallucinated IDs/columns."""
-    errors = []
+    """Check generated SQL against the schema; returns (valid, errors)."""
+    check = analyze_sql(sql)
+    return check.valid, list(check.errors)
 
-    # crude check
-    if " ea.id " in sql.lower():
-        errors.append("employee_addresses has no column 'id', use employee_id")
 
-    return len(errors) == 0, errors
+def with_limit(sql: str, limit: int) -> str:
+    """Append LIMIT to a query whose outermost SELECT has none."""
+    check = analyze_sql(sql)
+    if check.has_limit or not check.read_only:
+        return sql
+    return f"{sql[:check.end]}\nLIMIT {int(limit)}"
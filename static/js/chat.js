@@ -54,8 +54,19 @@ $(function () {
 
     appendMessage("user-ask", text);
     $("#chatInput").val("");
-    $("#typingIndicator").show();
+    $("#typingIndicator").text("Thinking...").show();
 
+    if (window.fetch && window.ReadableStream && window.TextDecoder) {
+      streamAnswer(text);
+    } else {
+      askOnce(text);
+    }
+  });
+
+  // ----------------------------
+  // Non-streaming fallback
+  // ----------------------------
+  function askOnce(text) {
     $.ajax({
       url: "/api/chat",
       method: "POST",
@@ -71,7 +82,82 @@ $(function () {
         );
       },
     });
-  });
+  }
+
+  // ----------------------------
+  // Streamed answer (server-sent events over POST)
+  // ----------------------------
+  const STAGE_LABELS = {
+    retrieving: "Retrieving context...",
+    answering: "Writing answer...",
+  };
+
+  async function streamAnswer(text) {
+    let $text = null;
+    let answer = "";
+
+    function handleEvent(event, data) {
+      if (event === "status") {
+        $("#typingIndicator").text(STAGE_LABELS[data.stage] || "Thinking...").show();
+      } else if (event === "sql") {
+        $("#typingIndicator").text("Generated SQL, running query...").show();
+      } else if (event === "rows") {
+        $("#typingIndicator").text("Executed query: " + data.row_count + " rows").show();
+      } else if (event === "token") {
+        if (!$text) {
+          $text = appendMessage("assistant", "");
+        }
+        answer += data.text;
+        $text.html(answer);
+        $("#chatBox").scrollTop($("#chatBox")[0].scrollHeight);
+      } else if (event === "error") {
+        appendMessage("assistant", "⚠️ Error: " + data.error);
+      } else if (event === "done") {
+        if (!$text) {
+          appendMessage("assistant", data.reply);
+        } else {
+          $text.html(data.reply);
+        }
+        $("#typingIndicator").hide();
+      }
+    }
+
+    try {
+      const res = await fetch("/api/chat/stream", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ text }),
+      });
+      if (!res.ok) {
+        const err = await res.json().catch(() => ({}));
+        appendMessage("assistant", "⚠️ Error: " + (err.error || res.statusText));
+        return;
+      }
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf("\n\n")) !== -1) {
+          const frame = buffer.slice(0, sep);
+          buffer = buffer.slice(sep + 2);
+          let event = "message";
+          let data = "";
+          frame.split("\n").forEach(function (line) {
+            if (line.startsWith("event: ")) event = line.slice(7);
+            else if (line.startsWith("data: ")) data += line.slice(6);
+          });
+          handleEvent(event, data ? JSON.parse(data) : {});
+        }
+      }
+    } catch (err) {
+      appendMessage("assistant", "⚠️ Error: " + err);
+    }
+  }
 
   // ----------------------------
   // Handle logout
@@ -86,11 +172,13 @@ $(function () {
   // Append chat message
   // ----------------------------
   function appendMessage(sender, msg) {
-    $("#chatBox").append(
+    const $msg = $(
       `<div class="msg ${sender}"><div class="msg-text">${msg}</div></div>`
     );
+    $("#chatBox").append($msg);
     $("#chatBox").scrollTop($("#chatBox")[0].scrollHeight);
     $("#typingIndicator").hide();
+    return $msg.find(".msg-text");
   }
 
   const msg = sessionStorage.getItem("welcomeMsg");
@@ -0,0 +1,86 @@
+# table_versions.py
+
+import logging
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import text as sql_text
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Cheap per-table fingerprints: a change in either value means the table was written.
+PROBE_QUERIES = {
+    "employees": "SELECT MAX(updated_at), COUNT(*) FROM employees",
+    "employee_addresses": "SELECT MAX(address_id), COUNT(*) FROM employee_addresses",
+    "employee_projects": "SELECT MAX(project_id), COUNT(*) FROM employee_projects",
+}
+# Seconds between probes; 0 disables probing (rely on invalidate_tables() only).
+PROBE_INTERVAL = float(os.getenv("TABLE_PROBE_INTERVAL", "30"))
+
+
+class TableVersions:
+    """
+    Per-table version counters used to invalidate cached query results.
+
+    Caches record the versions of the tables an entry depends on; bumping a
+    table makes every entry that read it stale. Versions are bumped by write
+    paths via invalidate_tables(), or by a periodic probe that notices writes
+    made outside this process.
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._fingerprints = {}
+        self._last_probe = 0.0
+        self._probe_lock = threading.Lock()
+
+    def get(self, table: str) -> int:
+        return self._versions.get(table.lower(), 0)
+
+    def snapshot(self, tables) -> dict:
+        return {t.lower(): self.get(t) for t in tables}
+
+    def is_current(self, snapshot: dict) -> bool:
+        return all(self.get(t) == v for t, v in snapshot.items())
+
+    def bump(self, *tables):
+        with self._lock:
+            for t in tables:
+                t = t.lower()
+                self._versions[t] = self._versions.get(t, 0) + 1
+
+    def probe(self, conn, queries=PROBE_QUERIES):
+        """Bump every table whose fingerprint changed since the previous probe."""
+        for table, query in queries.items():
+            fingerprint = tuple(conn.execute(sql_text(query)).fetchone())
+            previous = self._fingerprints.get(table)
+            self._fingerprints[table] = fingerprint
+            if previous is not None and previous != fingerprint:
+                self.bump(table)
+
+    def maybe_probe(self, engine, interval=PROBE_INTERVAL):
+        """Probe if `interval` seconds have passed; concurrent callers skip instead of waiting."""
+        if interval <= 0 or time.monotonic() - self._last_probe < interval:
+            return
+        if not self._probe_lock.acquire(blocking=False):
+            return
+        try:
+            with engine.connect() as conn:
+                self.probe(conn)
+        except Exception as e:
+            logger.warning("Table version probe failed: %s", e)
+        finally:
+            self._last_probe = time.monotonic()
+            self._probe_lock.release()
+
+
+table_versions = TableVersions()
+
+
+def invalidate_tables(*tables):
+    """Hook for write paths: mark cached results that read these tables as stale."""
+    table_versions.bump(*tables)
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# OpenAI clients are built on first use with this key; tests never hit the network.
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+# Keep the embedding cache in memory so tests never read or write data/.
+os.environ.setdefault("EMBED_CACHE_DB", "")
+# Tests drive SQL generation through stub LLMs, not the trained classifier.
+os.environ.setdefault("LOCAL_SQL", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,32 @@
+import faiss
+import numpy as np
+import pytest
+
+import ann_index
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivf_flat", "hnsw"])
+def test_create_index_finds_exact_match(kind):
+    xb = np.random.default_rng(0).random((2000, 16), dtype="float32")
+    index = ann_index.create_index(kind, xb, np.arange(100, 2100, dtype="int64"))
+    params = ann_index.search_params(index, nprobe=64, ef_search=64)
+    _, I = index.search(xb[:5], 1, params=params) if params else index.search(xb[:5], 1)
+    assert list(I[:, 0]) == [100, 101, 102, 103, 104]
+
+
+def test_small_corpus_falls_back_to_flat():
+    assert ann_index.resolve_kind("ivf_pq", 100) == "flat"
+    assert ann_index.resolve_kind("hnsw", 10) == "hnsw"
+    with pytest.raises(ValueError):
+        ann_index.resolve_kind("lsh", 10)
+
+
+def test_search_params_by_type():
+    xb = np.random.default_rng(0).random((500, 8), dtype="float32")
+    ids = np.arange(500, dtype="int64")
+    assert ann_index.search_params(ann_index.create_index("flat", xb, ids)) is None
+    ivf = ann_index.create_index("ivf_flat", xb, ids)
+    assert ann_index.search_params(ivf, nprobe=3).nprobe == 3
+    hnsw = ann_index.create_index("hnsw", xb, ids)
+    assert isinstance(ann_index.search_params(hnsw), faiss.SearchParametersHNSW)
+    assert not ann_index.supports_remove(hnsw)
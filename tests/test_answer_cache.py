@@ -0,0 +1,54 @@
+from answer_cache import AnswerCache
+from table_versions import TableVersions
+
+VECTORS = {
+    "list me employees from marketing": [1.0, 0.0, 0.0],
+    "show marketing employees": [0.99, 0.05, 0.0],
+    "average salary by department": [0.0, 1.0, 0.0],
+}
+
+SQL = "SELECT first_name FROM employees WHERE department = 'Marketing'"
+
+
+def fake_embed(text):
+    return VECTORS[text.lower()]
+
+
+def make_cache(**kwargs):
+    return AnswerCache(fake_embed, versions=TableVersions(), **kwargs)
+
+
+def test_exact_and_semantic_hits():
+    cache = make_cache()
+    assert cache.lookup("list me employees from Marketing") is None
+    cache.store("list me employees from Marketing", SQL, {"query": SQL, "result": []}, "No data found.")
+
+    exact = cache.lookup("  LIST me employees from marketing")
+    assert exact["kind"] == "exact" and exact["fresh"]
+
+    near = cache.lookup("show marketing employees")
+    assert near["kind"] == "semantic" and near["sql"] == SQL
+
+    assert cache.lookup("average salary by department") is None
+    assert cache.stats()["exact_hits"] == 1 and cache.stats()["semantic_hits"] == 1
+
+
+def test_stale_on_ttl_and_table_invalidation():
+    cache = make_cache(ttl=-1)
+    cache.store("list me employees from marketing", SQL, {"query": SQL, "result": []}, "x")
+    assert not cache.lookup("list me employees from marketing")["fresh"]
+
+    cache = make_cache()
+    cache.store("list me employees from marketing", SQL, {"query": SQL, "result": []}, "x")
+    cache.versions.bump("employee_projects")
+    assert cache.lookup("list me employees from marketing")["fresh"]
+    cache.versions.bump("employees")
+    assert not cache.lookup("list me employees from marketing")["fresh"]
+
+
+def test_lru_eviction_removes_vectors():
+    cache = make_cache(max_entries=1)
+    cache.store("list me employees from marketing", SQL, {"query": SQL, "result": []}, "x")
+    cache.store("average salary by department", "SELECT 1", {"query": "SELECT 1", "result": []}, "y")
+    assert cache.lookup("show marketing employees") is None
+    assert cache.stats()["size"] == 1
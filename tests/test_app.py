@@ -0,0 +1,54 @@
+import json
+import os
+
+import pytest
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URI", "sqlite://")
+
+import app as app_module  # noqa: E402
+from models import User, db  # noqa: E402
+
+
+class FakeJob:
+    def __init__(self, questions, concurrency):
+        self.questions = questions
+
+    def __iter__(self):
+        for i, q in enumerate(self.questions):
+            yield {"index": i, "question": q, "reply": f"answer to {q}", "error": None, "meta": {}}
+
+    def stats(self):
+        return {"questions": len(self.questions)}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_module, "BatchJob", FakeJob)
+    with app_module.app.app_context():
+        db.create_all()
+        user = User(username="batch-test")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    client = app_module.app.test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = user_id
+    yield client
+    with app_module.app.app_context():
+        db.drop_all()
+
+
+def test_batch_accepts_a_one_line_jsonl_body_sent_as_json(client):
+    resp = client.post("/api/chat/batch", data='{"question": "How many employees?"}',
+                       content_type="application/json")
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert lines[0]["question"] == "How many employees?" and lines[-1]["stats"] == {"questions": 1}
+
+
+def test_batch_rejects_items_without_a_question(client):
+    for body, content_type in [('[{"q": "a"}]', "application/json"),
+                               ('{"question": "a"}\n{"text": "b"}', "application/x-ndjson")]:
+        resp = client.post("/api/chat/batch", data=body, content_type=content_type)
+        assert resp.status_code == 400 and "question" in resp.get_json()["error"]
+    assert client.post("/api/chat/batch", json={"questions": []}).status_code == 400
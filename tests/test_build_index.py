@@ -0,0 +1,91 @@
+import json
+
+import faiss
+import pytest
+
+import build_index
+from doc_store import DocStore
+from embedding_cache import EmbeddingCache
+
+
+class FakeBatchEmbedder:
+    def __init__(self):
+        self.inputs = []
+
+    def __call__(self, texts):
+        self.inputs.extend(texts)
+        return [[float(len(t)), float(sum(map(ord, t)) % 97), 1.0] for t in texts]
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    schema = tmp_path / "schema.txt"
+    schema.write_text("employees (\n  employee_id INT\n)\n\nemployee_projects (\n  project_id INT\n)\n")
+    training = tmp_path / "training.json"
+    training.write_text(json.dumps([
+        {"question": "list employees", "sql": "SELECT * FROM employees;"},
+        {"question": "list projects", "sql": "SELECT * FROM employee_projects;"},
+    ]))
+    for name, path in [("SCHEMA_FILE", schema), ("INDEX_FILE", tmp_path / "index.bin"),
+                       ("DOCS_FILE", tmp_path / "docs.bin"), ("VERSION_FILE", tmp_path / "index.version"),
+                       ("MANIFEST_FILE", tmp_path / "manifest.json"), ("LEXICAL_FILE", tmp_path / "bm25_index.npz")]:
+        monkeypatch.setattr(build_index, name, str(path))
+    monkeypatch.setattr(build_index, "TRAINING_FILES", [str(training)])
+
+    fake = FakeBatchEmbedder()
+    monkeypatch.setattr(build_index, "embedding_cache", EmbeddingCache(None, embed_batch_fn=fake, db_path=None))
+    return tmp_path, training, fake
+
+
+def load(tmp_path):
+    return faiss.read_index(str(tmp_path / "index.bin")), DocStore.open(tmp_path / "docs.bin")
+
+
+def test_embed_all_batches(workspace, monkeypatch):
+    _, _, fake = workspace
+    calls = []
+    monkeypatch.setattr(build_index.embedding_cache, "embed_batch_fn", lambda texts: calls.append(texts) or fake(texts))
+    vectors = build_index.embed_all([f"text {i}" for i in range(10)], batch_size=4, concurrency=2)
+    assert vectors.shape == (10, 3)
+    assert sorted(len(c) for c in calls) == [2, 4, 4]
+
+
+def test_incremental_only_embeds_changes(workspace):
+    tmp_path, training, fake = workspace
+    build_index.build()
+    index, docs = load(tmp_path)
+    assert index.ntotal == 4 and len(docs) == 4
+
+    fake.inputs.clear()
+    build_index.embedding_cache.clear()
+    training.write_text(json.dumps([
+        {"question": "list employees", "sql": "SELECT first_name FROM employees;"},
+        {"question": "list projects", "sql": "SELECT * FROM employee_projects;"},
+        {"question": "count employees", "sql": "SELECT COUNT(*) FROM employees;"},
+    ]))
+    build_index.build(incremental=True)
+
+    assert fake.inputs == [
+        "Q: list employees\nSQL: SELECT first_name FROM employees;",
+        "Q: count employees\nSQL: SELECT COUNT(*) FROM employees;",
+    ]
+    index, docs = load(tmp_path)
+    assert index.ntotal == 5
+    assert sorted(d["text"] for d in docs.values()) == sorted(d["text"] for d in build_index.load_docs())
+
+
+def test_incremental_noop_when_unchanged(workspace):
+    tmp_path, _, fake = workspace
+    build_index.build()
+    version = (tmp_path / "index.version").read_text()
+    build_index.build(incremental=True)
+    assert (tmp_path / "index.version").read_text() == version
+
+
+def test_manifest_records_built_kind(workspace):
+    tmp_path, _, fake = workspace
+    build_index.build(index_type="ivf_pq")  # 4 docs: too few to train, built as flat
+    assert build_index.load_manifest()["index_type"] == "flat"
+    version = (tmp_path / "index.version").read_text()
+    build_index.build(incremental=True, index_type="ivf_pq")
+    assert (tmp_path / "index.version").read_text() == version
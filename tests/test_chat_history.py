@@ -0,0 +1,57 @@
+import json
+
+from sqlalchemy import create_engine, insert, inspect, text
+from sqlalchemy.orm import Session
+
+from chat_history import conversation_page, exchange_rows, message_page
+from models import Conversation, Message, MessageMeta, compact_meta, db
+
+
+def make_session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.sqlite'}")
+    db.metadata.create_all(engine, tables=[db.metadata.tables[t] for t in ("user", "conversation", "message")])
+    return engine, Session(engine)
+
+
+def big_meta(rows=300):
+    result = [{"first_name": f"Name{i}", "salary": 50000 + i} for i in range(rows)]
+    return {"sql_meta": {"query": "SELECT first_name, salary FROM employees", "result": result,
+                         "row_count": rows, "summary": {"columns": {}}}, "cache": None}
+
+
+def test_meta_is_capped_and_compressed(tmp_path):
+    engine, session = make_session(tmp_path)
+    session.execute(insert(Message.__table__), exchange_rows(1, "q", "a", big_meta()))
+    session.commit()
+
+    raw = session.execute(text("SELECT meta FROM message WHERE sender = 'assistant'")).scalar()
+    assert raw.startswith("z:") and len(raw) < len(json.dumps(big_meta())) / 10
+    meta = session.execute(text("SELECT meta FROM message WHERE sender = 'assistant'")
+                           .columns(meta=MessageMeta)).scalar()
+    assert len(meta["sql_meta"]["result"]) == 20 and meta["sql_meta"]["row_count"] == 300
+    assert meta["sql_meta"]["result_stored"] == 20
+
+
+def test_plain_json_meta_still_loads():
+    loaded = MessageMeta().process_result_value('{"sql_meta": {"query": "SELECT 1"}}', None)
+    assert loaded == {"sql_meta": {"query": "SELECT 1"}}
+    assert compact_meta({"sql_meta": {"error": "boom"}}) == {"sql_meta": {"error": "boom"}}
+
+
+def test_keyset_pages(tmp_path):
+    engine, session = make_session(tmp_path)
+    session.add_all([Conversation(user_id=1), Conversation(user_id=1), Conversation(user_id=2)])
+    session.flush()
+    for i in range(5):
+        session.execute(insert(Message), exchange_rows(1, f"q{i}", f"a{i}", {"sql_meta": {"query": "SELECT 1"}}))
+    session.commit()
+
+    first = message_page(session, 1, limit=4)
+    assert [m["text"] for m in first["items"]] == ["a4", "q4", "a3", "q3"] and "meta" not in first["items"][0]
+    rest = message_page(session, 1, before=first["next_before"], limit=10, with_meta=True)
+    assert len(rest["items"]) == 6 and rest["next_before"] is None
+    assert rest["items"][0]["meta"] == {"sql_meta": {"query": "SELECT 1"}}
+    assert [c["id"] for c in conversation_page(session, 1)["items"]] == [2, 1]
+
+    indexes = {i["name"] for i in inspect(engine).get_indexes("message")}
+    assert "ix_message_conversation_id_id" in indexes
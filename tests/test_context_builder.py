@@ -0,0 +1,43 @@
+import numpy as np
+
+from context_builder import build_context, count_tokens, mmr_order, referenced_tables, schema_table
+
+SCHEMA_DOCS = [
+    "Table Schema:\nemployees (\n  employee_id INT,\n  first_name VARCHAR(50),\n  department VARCHAR(100)\n)",
+    "Table Schema:\nemployee_addresses (\n  address_id INT,\n  employee_id INT,\n  city VARCHAR(100)\n)",
+    "Table Schema:\nemployee_projects (\n  project_id INT,\n  employee_id INT,\n  project_name VARCHAR(100)\n)",
+    "Table Schema:\nRelationships:\n- employees → employee_addresses (1-to-many)",
+]
+HR = "Q: list HR employees\nSQL: SELECT first_name\nFROM employees\nWHERE department = 'HR';"
+HR_AGAIN = "Q: show me the HR staff\nSQL: select first_name from employees   where department = 'HR' -- variant"
+CITY = "Q: who lives in Pune\nSQL: SELECT e.first_name FROM employees e JOIN employee_addresses a ON e.employee_id = a.employee_id WHERE a.city = 'Pune'"
+
+
+def test_tables_from_question():
+    assert referenced_tables("employees per city") == {"employees", "employee_addresses"}
+    assert referenced_tables("which projects started last year") == {"employee_projects"}
+    assert schema_table(SCHEMA_DOCS[1]) == "employee_addresses" and schema_table(SCHEMA_DOCS[3]) is None
+
+
+def test_schema_first_dedup_and_compaction():
+    docs, stats = build_context("list HR employees", [SCHEMA_DOCS[2], HR, HR_AGAIN], SCHEMA_DOCS)
+    # employees + the general chunk, in build order, then one copy of the HR example on one line.
+    assert docs == [SCHEMA_DOCS[0], SCHEMA_DOCS[3],
+                    "Q: list HR employees\nSQL: SELECT first_name FROM employees WHERE department = 'HR';"]
+    assert stats["examples"] == 1 and stats["examples_dropped"] == 0
+
+    docs, _ = build_context("who lives in Pune", [CITY, HR], SCHEMA_DOCS)
+    assert docs[:3] == [SCHEMA_DOCS[0], SCHEMA_DOCS[1], SCHEMA_DOCS[3]]
+
+
+def test_budget():
+    examples = [f"Q: question {i}\nSQL: SELECT first_name FROM employees WHERE employee_id = {i}" for i in range(50)]
+    docs, stats = build_context("list employees", examples, SCHEMA_DOCS, budget=200)
+    assert stats["context_tokens"] <= 200 and sum(count_tokens(d) for d in docs) == stats["context_tokens"]
+    assert 0 < stats["examples"] < 50 and docs[0] == SCHEMA_DOCS[0]
+
+
+def test_mmr_drops_near_duplicate_vectors():
+    vectors = np.array([[1, 0], [0.999, 0.01], [0, 1]], dtype="float32")
+    assert mmr_order(["a", "b", "c"], vectors) == [0, 2]
+    assert mmr_order(["a", "b", "c"], vectors, dedup=1.1) == [0, 2, 1]
@@ -0,0 +1,76 @@
+import pytest
+from sqlalchemy import exc, text
+
+import db_engines
+from benchmarks.fixtures import seed_database
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    uri = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    seed_database(uri, n_employees=20)
+    monkeypatch.setenv("SQLALCHEMY_DATABASE_URI", uri)
+    monkeypatch.delenv("SQL_DATABASE_URI", raising=False)
+    monkeypatch.setattr(db_engines, "_ENGINES", {})
+    monkeypatch.setattr(db_engines, "_METRICS", {})
+    monkeypatch.setattr(db_engines, "SQL_POOL_SIZE", 3)
+    yield uri
+    db_engines.dispose_all()
+
+
+def test_query_role_uses_replica_uri(monkeypatch):
+    monkeypatch.setenv("SQLALCHEMY_DATABASE_URI", "mysql+pymysql://u:p@primary/db")
+    monkeypatch.setenv("SQL_DATABASE_URI", "mysql+pymysql://u:p@replica/db")
+    monkeypatch.delenv("ASYNC_DATABASE_URI", raising=False)
+    monkeypatch.delenv("SQL_ASYNC_DATABASE_URI", raising=False)
+    assert db_engines.database_uri("app") == "mysql+pymysql://u:p@primary/db"
+    assert db_engines.database_uri("query") == "mysql+pymysql://u:p@replica/db"
+    assert db_engines.database_uri("query", is_async=True) == "mysql+aiomysql://u:p@replica/db"
+
+
+def test_engine_options():
+    options = db_engines.engine_options("query", "mysql+pymysql://u:p@h/db")
+    assert options["pool_pre_ping"] and options["pool_size"] == db_engines.SQL_POOL_SIZE
+    assert "pool_size" not in db_engines.engine_options("app", "sqlite://")
+
+
+def test_query_engine_is_read_only(registry):
+    engine = db_engines.get_engine("query")
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM employees")).scalar() == 20
+        with pytest.raises(exc.OperationalError):
+            conn.execute(text("DELETE FROM employees"))
+    with db_engines.get_engine("app").begin() as conn:
+        conn.execute(text("DELETE FROM employee_projects"))
+
+
+def test_query_time_limit(registry, monkeypatch):
+    monkeypatch.setattr(db_engines, "SQL_MAX_EXECUTION_TIME_MS", 50)
+    engine = db_engines.get_engine("query")
+    slow = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+    with engine.connect() as conn:
+        with pytest.raises(exc.OperationalError, match="interrupted"):
+            conn.execute(text(slow))
+    # The limit is per statement: the pooled connection is still usable.
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+
+
+def test_warm_up_and_metrics(registry):
+    assert db_engines.warm_up(["query"]) == 3
+    engine = db_engines.get_engine("query")
+    with db_engines.timed_connect(engine) as conn:
+        conn.execute(text("SELECT 1"))
+    stats = db_engines.pool_stats()["query"]
+    assert stats["connects"] == 3  # the checkout above reused a warmed connection
+    assert stats["checkouts"] == 4 and stats["max_checked_out"] == 3
+    assert stats["checked_out"] == 0 and stats["timeouts"] == 0
+
+
+def test_reset_pools_keeps_engines(registry):
+    db_engines.warm_up(["query"])
+    engine = db_engines.get_engine("query")
+    assert engine.pool.checkedin() == 3
+    db_engines.reset_pools()
+    assert engine.pool.checkedin() == 0
+    assert db_engines.get_engine("query") is engine and "query" in db_engines.pool_stats()
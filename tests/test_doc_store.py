@@ -0,0 +1,49 @@
+import pickle
+
+import pytest
+
+import doc_store
+from doc_store import DocStore
+
+DOCS = {
+    0: {"id": "schema-0", "text": "Table Schema:\nemployees (...)", "type": "schema", "tables": ["employees"]},
+    3: {"id": "example-a", "text": "Q: wie viele Mitarbeiter?\nSQL: SELECT COUNT(*) FROM employees;",
+        "type": "example", "tables": ["employees"]},
+    7: {"id": "example-b", "text": "Q: projects ✓\nSQL: SELECT * FROM employee_projects e JOIN employees x;",
+        "type": "example", "tables": ["employee_projects", "employees"]},
+    9: {"id": "example-c", "text": "", "type": "example", "tables": []},
+}
+
+
+def test_round_trip_with_sparse_ids(tmp_path):
+    doc_store.write(tmp_path / "docs.bin", DOCS)
+    store = DocStore.open(tmp_path / "docs.bin")
+    assert len(store) == 4 and list(store) == [0, 3, 7, 9]
+    assert dict(store.items()) == DOCS
+    assert store.text(7) == DOCS[7]["text"]
+    assert 3 in store and 4 not in store
+    with pytest.raises(KeyError):
+        store[4]
+    assert store.ids_of_type("schema").tolist() == [0]
+    assert store.ids_of_type("example").tolist() == [3, 7, 9]
+
+
+def test_list_and_empty(tmp_path):
+    doc_store.write(tmp_path / "list.bin", [{"id": "schema-0", "text": "a"}, {"id": "example-1", "text": "b"}])
+    store = DocStore.open(tmp_path / "list.bin")
+    assert store[1] == {"id": "example-1", "text": "b", "type": "example"}
+    doc_store.write(tmp_path / "empty.bin", {})
+    assert len(DocStore.open(tmp_path / "empty.bin")) == 0
+
+
+def test_rejects_other_and_damaged_files(tmp_path):
+    with open(tmp_path / "docs.pkl", "wb") as f:
+        pickle.dump(DOCS, f)
+    with pytest.raises(ValueError, match="not a doc store"):
+        DocStore.open(tmp_path / "docs.pkl")
+
+    doc_store.write(tmp_path / "docs.bin", DOCS)
+    data = (tmp_path / "docs.bin").read_bytes()
+    (tmp_path / "short.bin").write_bytes(data[:-10])
+    with pytest.raises(ValueError, match="past the end"):
+        DocStore.open(tmp_path / "short.bin")
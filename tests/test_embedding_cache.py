@@ -0,0 +1,84 @@
+import time
+
+from embedding_cache import EmbeddingCache
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return [float(len(text)), 1.0, 2.0]
+
+
+def test_lru_hit_on_normalized_text():
+    fake = FakeEmbedder()
+    cache = EmbeddingCache(fake, db_path=None)
+    a = cache.embed("list me employees from Marketing")
+    b = cache.embed("  List me  employees from marketing ")
+    assert fake.calls == 1
+    assert list(a) == list(b)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_lru_eviction_and_ttl():
+    fake = FakeEmbedder()
+    cache = EmbeddingCache(fake, max_items=1, db_path=None)
+    cache.embed("a")
+    cache.embed("bb")
+    cache.embed("a")
+    assert fake.calls == 3
+
+    expired = EmbeddingCache(fake, ttl=-1, db_path=None)
+    expired.embed("a")
+    expired.embed("a")
+    assert fake.calls == 5
+
+
+def test_persistent_tier(tmp_path):
+    db_path = str(tmp_path / "emb.sqlite")
+    fake = FakeEmbedder()
+    EmbeddingCache(fake, db_path=db_path).embed_many(["x", "yy", "x"])
+    assert fake.calls == 2
+
+    warm = EmbeddingCache(fake, db_path=db_path)
+    vecs = warm.embed_many(["x", "yy"])
+    assert fake.calls == 2
+    assert warm.stats()["disk_hits"] == 2
+    assert vecs[1][0] == 2.0
+
+
+def test_model_is_part_of_key(tmp_path):
+    db_path = str(tmp_path / "emb.sqlite")
+    fake = FakeEmbedder()
+    EmbeddingCache(fake, model="m1", db_path=db_path).embed("x")
+    EmbeddingCache(fake, model="m2", db_path=db_path).embed("x")
+    assert fake.calls == 2
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    db_path = str(tmp_path / "emb.sqlite")
+    fake = FakeEmbedder()
+    cache = EmbeddingCache(fake, db_path=db_path, db_max_items=2)
+    for text in ["a", "bb", "ccc"]:
+        cache.embed(text)
+        time.sleep(0.01)
+    with cache._db_lock:
+        cache._prune()
+    cold = EmbeddingCache(fake, db_path=db_path, db_max_items=2)
+    cold.embed_many(["a", "bb", "ccc"])
+    assert fake.calls == 4  # "a", the oldest, was dropped
+
+    expired = EmbeddingCache(fake, db_path=db_path, db_ttl=1e-9)  # pruned on open
+    expired.embed("bb")
+    assert fake.calls == 5
+
+
+def test_memory_lookups_do_not_wait_for_disk_writes(tmp_path):
+    fake = FakeEmbedder()
+    cache = EmbeddingCache(fake, db_path=str(tmp_path / "emb.sqlite"))
+    cache.embed("warm")
+    with cache._db_lock:  # a slow disk write in progress
+        assert cache.get("warm") is not None
+    assert cache.stats()["disk_hits"] == 0
@@ -0,0 +1,67 @@
+import faiss
+import numpy as np
+
+import doc_store
+import retriever
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+DOCS = {
+    10: {"text": "Table Schema:\nemployees (employee_id, first_name, department)"},
+    11: {"text": "Table Schema:\nemployee_projects (project_id, employee_id, project_name)"},
+    12: {"text": "Q: employees living in Velezfurt\nSQL: SELECT * FROM employees e JOIN employee_addresses a "
+                 "ON e.employee_id = a.employee_id WHERE a.city = 'Velezfurt'"},
+    13: {"text": "Q: average salary per department\nSQL: SELECT department, AVG(salary) FROM employees GROUP BY department"},
+}
+
+
+def test_tokenize_splits_identifiers():
+    assert tokenize("FROM employee_projects ep") == ["from", "employee_projects", "employee", "projects", "ep"]
+
+
+def test_search_and_round_trip(tmp_path):
+    index = BM25Index.build(DOCS)
+    ids, scores = index.search("who lives in velezfurt?", 3)
+    assert ids.tolist() == [12] and scores[0] > 0
+    assert index.search("employee_projects", 1)[0].tolist() == [11]
+
+    index.save(tmp_path / "bm25.npz")
+    loaded = BM25Index.load(tmp_path / "bm25.npz")
+    assert loaded.terms == index.terms
+    assert loaded.search("average salary per department", 2)[0].tolist() == index.search("average salary per department", 2)[0].tolist()
+
+
+def test_table_lookup_and_fusion():
+    index = BM25Index.build(DOCS)
+    assert index.ids_with_tables(["employee_addresses"]) == {12}
+    assert index.ids_with_tables(["employees", "employee_projects"], mode="all") == set()
+    assert index.ids_with_tables(["employees", "employee_projects"]) == {10, 11, 12, 13}
+    assert reciprocal_rank_fusion([[1, 2, 3], [2, 4]]) == [2, 1, 4, 3]
+
+
+def test_lexical_mode_needs_no_embedding(tmp_path, monkeypatch):
+    index = faiss.IndexIDMap(faiss.IndexFlatL2(4))
+    index.add_with_ids(np.eye(4, dtype="float32"), np.array(list(DOCS), dtype="int64"))
+    faiss.write_index(index, str(tmp_path / "index.bin"))
+    doc_store.write(tmp_path / "docs.bin", DOCS)
+    monkeypatch.setattr(retriever, "_RETRIEVER", retriever.Retriever(
+        str(tmp_path / "index.bin"), str(tmp_path / "docs.bin"), str(tmp_path / "none.version")))
+
+    def unavailable(text):
+        raise ConnectionError("embedding service down")
+    monkeypatch.setattr(retriever, "embed", unavailable)
+
+    assert retriever.retrieve("Velezfurt", k=1, search_mode="lexical") == [DOCS[12]["text"]]
+    # Hybrid degrades to lexical when the embedding call fails.
+    docs = retriever.retrieve("project_name", k=2, required_tables=["employee_projects"])
+    assert docs == [DOCS[11]["text"]]
+
+
+def test_top_k_matches_full_sort_with_ties():
+    docs = {i: {"text": f"employees {('salary', 'budget', 'office')[i % 3]} row{i}"} for i in range(50)}
+    index = BM25Index.build(docs)
+    for k in (1, 5, 17, 50, 80):
+        ids, scores = index.search("employees salary", k)
+        all_ids, all_scores = index.search("employees salary", len(docs))
+        assert ids.tolist() == all_ids[:k].tolist() and np.array_equal(scores, all_scores[:k])
+    # Ties keep document order, as with a stable sort over every match.
+    assert index.search("employees", 3)[0].tolist() == [0, 1, 2]
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import pytest
+from openai import AsyncOpenAI, OpenAI
+
+import rag
+from benchmarks.stub_llm import DEFAULT_SQL, StubLLMServer
+from llm_client import LLM_HEDGES, AsyncLLMClient, CircuitBreaker, LLMClient, LLMUnavailable, TokenBucket
+from local_sql import LocalSqlGenerator
+from train_model import fit_sql_model
+
+MESSAGES = [{"role": "user", "content": "How many employees are there?"}]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def stub():
+    server = StubLLMServer(latency=0.01).start()
+    yield server
+    server.stop()
+
+
+def stub_llm(stub, **kwargs):
+    return LLMClient(OpenAI(base_url=stub.base_url, api_key="stub", max_retries=0), **kwargs)
+
+
+def test_token_bucket_paces_and_refunds():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock)
+    assert [bucket.reserve(1) for _ in range(60)] == [0.0] * 60
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    assert bucket.reserve(10, max_wait=5) is None  # nothing taken
+    clock.now = 2.0
+    assert bucket.reserve(1) == 0.0
+    bucket.refund(-30)
+    assert bucket.reserve(1) == pytest.approx(31.0)
+
+
+def test_breaker_opens_fails_fast_and_recovers(stub):
+    clock = FakeClock()
+    llm = stub_llm(stub, breaker=CircuitBreaker(failures=2, reset=10, clock=clock))
+    stub.error_rate = 1.0
+    for _ in range(2):
+        with pytest.raises(LLMUnavailable):
+            llm.chat(MESSAGES, "gpt-test")
+    assert llm.breaker.state == "open" and stub.calls["errors"] == 2
+    with pytest.raises(LLMUnavailable, match="circuit open"):
+        llm.chat(MESSAGES, "gpt-test")
+    assert stub.calls["errors"] == 2  # rejected without a request
+
+    stub.error_rate = 0.0
+    clock.now = 10.0  # half-open: one trial call, which succeeds
+    assert llm.chat(MESSAGES, "gpt-test").choices[0].message.content
+    assert llm.breaker.state == "closed"
+
+
+def test_throttled_trial_call_reopens_the_breaker(stub):
+    clock = FakeClock()
+    llm = stub_llm(stub, breaker=CircuitBreaker(failures=1, reset=10, clock=clock), max_queue_wait=0)
+    llm.requests = TokenBucket(60, clock=clock)
+    stub.error_rate = 1.0
+    with pytest.raises(LLMUnavailable):
+        llm.chat(MESSAGES, "gpt-test")
+    llm.requests.level = -10  # over the limit until t=11
+
+    clock.now = 10.0
+    with pytest.raises(LLMUnavailable, match="would queue"):
+        llm.chat(MESSAGES, "gpt-test")
+    assert llm.breaker.state == "open" and stub.calls["errors"] == 1
+
+    stub.error_rate = 0.0
+    clock.now = 20.0  # refilled: the next call is the trial, and it closes the breaker
+    assert llm.chat(MESSAGES, "gpt-test").choices[0].message.content
+    assert llm.breaker.state == "closed"
+
+
+def test_slow_call_is_hedged(stub):
+    llm = stub_llm(stub)
+    for _ in range(20):
+        llm.chat(MESSAGES, "gpt-test", purpose="sql_generation")
+    stub.slow_latency, stub.slow_next = 2.0, 1
+    hedges = LLM_HEDGES._values.get(("sql_generation", "hedge"), 0)
+    start = time.perf_counter()
+    llm.chat(MESSAGES, "gpt-test", purpose="sql_generation")
+    assert time.perf_counter() - start < 1.0  # the duplicate answered; the slow request is still running
+    assert LLM_HEDGES._values[("sql_generation", "hedge")] == hedges + 1
+
+
+def test_async_client_hedges_with_the_shared_latency_window(stub):
+    limits = stub_llm(stub)
+    for _ in range(20):
+        limits.chat(MESSAGES, "gpt-test", purpose="repair")  # recorded by the sync client, used by the async one
+    allm = AsyncLLMClient(AsyncOpenAI(base_url=stub.base_url, api_key="stub", max_retries=0), limits)
+    stub.slow_latency, stub.slow_next = 2.0, 1
+    hedges = LLM_HEDGES._values.get(("repair", "hedge"), 0)
+    start = time.perf_counter()
+    assert asyncio.run(allm.chat(MESSAGES, "gpt-test", purpose="repair")).choices[0].message.content
+    assert time.perf_counter() - start < 1.0
+    assert LLM_HEDGES._values[("repair", "hedge")] == hedges + 1
+
+
+def test_hedge_is_skipped_without_room_under_the_limits(stub):
+    llm = stub_llm(stub, rpm=21)
+    for _ in range(20):
+        llm.chat(MESSAGES, "gpt-test", purpose="summarize")
+    stub.slow_latency, stub.slow_next = 1.0, 1
+    skipped = LLM_HEDGES._values.get(("summarize", "not_admitted"), 0)
+    start = time.perf_counter()
+    llm.chat(MESSAGES, "gpt-test", purpose="summarize")  # takes the last request of the minute
+    assert time.perf_counter() - start >= 0.9
+    assert LLM_HEDGES._values[("summarize", "not_admitted")] == skipped + 1
+    assert stub.calls["chat"] == 21
+
+
+def test_sql_falls_back_to_classifier_when_llm_is_down(stub, monkeypatch):
+    model = fit_sql_model(["how many employees", "list all projects", "average salary"],
+                          ["SELECT COUNT(*) FROM employees", "SELECT * FROM employee_projects",
+                           "SELECT AVG(salary) FROM employees"])
+    monkeypatch.setattr(rag, "local_sql", LocalSqlGenerator(model=model, threshold=1.01))
+    monkeypatch.setattr(rag, "LOCAL_SQL_ENABLED", True)
+    monkeypatch.setattr(rag, "llm", stub_llm(stub))
+    context = (["Q: how many employees\nSQL: SELECT COUNT(*) FROM employees;"], None, [])
+    assert rag.generate_sql("how many employees", context) == (DEFAULT_SQL, "llm")
+
+    stub.error_rate = 1.0
+    assert rag.generate_sql("how many employees", context) == ("SELECT COUNT(*) FROM employees", "local_fallback")
+    answer = rag.fallback_answer("how many employees", {"query": "SELECT COUNT(*) FROM employees",
+                                                        "result": [{"count": 42}], "row_count": 1}, "down")
+    assert "42" in answer
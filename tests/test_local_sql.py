@@ -0,0 +1,48 @@
+import rag
+from local_sql import LocalSqlGenerator, fill_template, sql_template, template_key
+from train_model import fit_sql_model
+
+EXAMPLES = [
+    ("list employees from Marketing", "SELECT first_name, last_name FROM employees WHERE department = 'Marketing';"),
+    ("list the employees in HR", "SELECT first_name, last_name FROM employees WHERE department = 'HR';"),
+    ("show employees of Marketing department", "SELECT first_name, last_name FROM employees WHERE department = 'Marketing';"),
+    ("how many employees live in India", "SELECT COUNT(*) FROM employees e JOIN employee_addresses a "
+                                         "ON e.employee_id = a.employee_id WHERE a.country = 'India';"),
+    ("count employees from Australia", "SELECT COUNT(*) FROM employees e JOIN employee_addresses a "
+                                       "ON e.employee_id = a.employee_id WHERE a.country = 'Australia';"),
+    ("give me all unique job titles", "SELECT DISTINCT job_title FROM employees;"),
+    ("what job titles exist", "SELECT DISTINCT job_title FROM employees;"),
+]
+
+
+def make_generator(threshold=0.5):
+    model = fit_sql_model([q for q, _ in EXAMPLES], [s for _, s in EXAMPLES])
+    return LocalSqlGenerator(threshold=threshold, model=model)
+
+
+def test_templates():
+    sql, slots = sql_template("SELECT * FROM employees e WHERE e.department = 'HR' AND e.salary > 10 AND first_name LIKE 'M%'")
+    assert [(column, value) for _, _, column, value in slots] == [("department", "HR")]
+    assert fill_template(sql, slots, {"department": ["O'Brien Ops"]}).endswith(
+        "e.department = 'O''Brien Ops' AND e.salary > 10 AND first_name LIKE 'M%'")
+    assert template_key(*sql_template(EXAMPLES[0][1])) == template_key(*sql_template(EXAMPLES[1][1]))
+
+
+def test_generate_fills_slots_and_gates():
+    gen = make_generator()
+    assert gen.generate("list employees from HR") == EXAMPLES[1][1]
+    assert gen.generate("how many employees live in Australia?").endswith("a.country = 'Australia';")
+    # Two departments for a one-slot template, or a value the template can't use: leave it to the LLM.
+    assert gen.generate("list employees from HR and Marketing") is None
+    assert gen.generate("unique job titles in India") is None
+    assert make_generator(threshold=0.99).generate("list employees from HR") is None
+    stats = gen.stats()
+    assert stats["local"] == 2 and stats["slot_mismatch"] == 2
+
+
+def test_rag_prefers_local(monkeypatch):
+    monkeypatch.setattr(rag, "LOCAL_SQL_ENABLED", True)
+    monkeypatch.setattr(rag, "local_sql", make_generator())
+    monkeypatch.setattr(rag, "generate_sql_with_openai", lambda q, context=None: "SELECT 1")
+    assert rag.generate_sql("list employees from HR") == (EXAMPLES[1][1], "local")
+    assert rag.generate_sql("what is the weather") == ("SELECT 1", "llm")
@@ -0,0 +1,66 @@
+import logging
+from types import SimpleNamespace
+
+import metrics
+from metrics import Counter, Histogram, annotate, record_usage, span, trace
+
+
+def test_histogram_render():
+    h = Histogram("test_latency_seconds", "Test latency.", ("stage",), buckets=(0.1, 1.0))
+    h.observe(0.05, stage="a")
+    h.observe(0.5, stage="a")
+    h.observe(5, stage="a")
+    lines = list(h.render())
+    assert 'test_latency_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{stage="a",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{stage="a"} 3' in lines
+    metrics._registry.remove(h)
+
+
+def test_counter_escapes_labels():
+    c = Counter("test_events_total", "Test events.", ("name",))
+    c.inc(name='say "hi"')
+    c.inc(2, name='say "hi"')
+    assert 'test_events_total{name="say \\"hi\\""} 3' in list(c.render())
+    metrics._registry.remove(c)
+
+
+def test_span_records_stage_latency():
+    before = metrics.STAGE_SECONDS.count(stage="test_stage")
+    with span("test_stage") as s:
+        s["rows"] = 3
+    assert metrics.STAGE_SECONDS.count(stage="test_stage") == before + 1
+
+
+def test_sampled_trace_collects_spans(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "TRACE_SAMPLE_RATE", 1.0)
+    with caplog.at_level(logging.INFO, logger="metrics"):
+        with trace("test_request"):
+            with span("embed"):
+                pass
+            annotate(answer_cache="miss")
+            with span("db_execute") as s:
+                s["rows"] = 5
+    record = metrics.recent_traces[-1]
+    assert record["trace"] == "test_request" and record["answer_cache"] == "miss"
+    assert [s["stage"] for s in record["spans"]] == ["embed", "db_execute"]
+    assert record["spans"][1]["rows"] == 5
+    assert "test_request" in caplog.text
+
+
+def test_unsampled_trace_keeps_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "TRACE_SAMPLE_RATE", 0.0)
+    kept = len(metrics.recent_traces)
+    with trace("test_request") as current:
+        with span("embed"):
+            pass
+    assert current is None and len(metrics.recent_traces) == kept
+
+
+def test_record_usage_and_render():
+    record_usage("test_generation", SimpleNamespace(prompt_tokens=120, completion_tokens=30))
+    text = metrics.render()
+    assert 'rag_llm_tokens_total{stage="test_generation",kind="prompt"} 120' in text
+    assert 'rag_llm_tokens_total{stage="test_generation",kind="completion"} 30' in text
+    assert "# TYPE rag_stage_seconds histogram" in text
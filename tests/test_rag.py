@@ -1,20 +1,74 @@
+import itertools
 import json
-from rag import generate_sql
-from sql_validator import validate_sql
-
-DATA="data/training_data_100.json"
-
-def run_tests():
-    qs=json.load(open(DATA))
-    total=len(qs)
-    passed=0
-    for i,q in enumerate(qs):
-        question=q["question"]
-        sql,docs,err=generate_sql(question)
-        valid,_=validate_sql(sql)
-        if valid: passed+=1
-        else: print(f"❌ {i+1}. {question} -> {sql} | err {err}")
-    print(f"✅ {passed}/{total} valid SQL")
-
-if __name__=="__main__":
-    run_tests()
+import time
+
+from openai import OpenAI
+from sqlalchemy import create_engine
+
+import rag
+import retriever
+from benchmarks.fixtures import add_mysql_functions, build_stub_index, seed_database
+from benchmarks.regression import evaluate, summarize
+from benchmarks.stub_llm import DEFAULT_SQL, StubLLMServer
+from doc_store import DocStore
+from llm_client import LLMClient
+
+DATA = "data/training_data_100.json"
+DOCS = "data/faiss_docs.bin"
+
+
+def test_pipeline_regression(tmp_path, monkeypatch):
+    rows = json.load(open(DATA))[:25]
+    references = {row["question"]: row["sql"] for row in rows}
+    stub = StubLLMServer(latency=0, sql_for=lambda q: references.get(q, DEFAULT_SQL)).start()
+    try:
+        uri = f"sqlite:///{tmp_path / 'db.sqlite'}"
+        seed_database(uri, n_employees=200)
+        index_file, docs_file = build_stub_index(str(tmp_path), list(DocStore.open(DOCS).values()))
+        stub_llm = LLMClient(OpenAI(base_url=stub.base_url, api_key="stub"))
+        monkeypatch.setattr(rag, "llm", stub_llm)
+        monkeypatch.setattr(retriever, "llm", stub_llm)
+        monkeypatch.setattr(rag, "_ENGINE", add_mysql_functions(create_engine(uri)))
+        monkeypatch.setattr(rag, "SQL_CACHE_ENABLED", False)
+        monkeypatch.setattr(rag, "ANSWER_CACHE_ENABLED", False)
+        monkeypatch.setattr(retriever, "_RETRIEVER",
+                            retriever.Retriever(index_file, docs_file, str(tmp_path / "none.version")))
+
+        summary = summarize(evaluate(rows, add_mysql_functions(create_engine(uri)), stub))
+        assert summary["evaluated"] >= 24
+        assert summary["execution_accuracy"] >= 0.95, summary["failures"]
+        assert summary["calls_per_question"]["chat"] <= 2.2
+    finally:
+        stub.stop()
+
+
+def test_speculative_generation_keeps_first_valid_candidate(monkeypatch):
+    replies = itertools.chain(["SELECT nope FROM employees"], itertools.repeat(DEFAULT_SQL))
+    stub = StubLLMServer(latency=0.01, sql_for=lambda q: next(replies)).start()
+    try:
+        monkeypatch.setattr(rag, "llm", LLMClient(OpenAI(base_url=stub.base_url, api_key="stub")))
+        monkeypatch.setattr(rag, "SQL_SPECULATIVE", True)
+        monkeypatch.setattr(rag, "SQL_SPECULATIVE_FANOUT", 3)
+        context = ([], None, [])
+        assert rag.generate_sql_with_openai("How many employees?", context) == DEFAULT_SQL
+        time.sleep(0.1)  # abandoned candidates land
+        assert stub.calls["chat"] == 3  # no repair round trip
+
+        replies = itertools.repeat("SELECT nope FROM employees")
+        repaired = rag.SQL_SPECULATION._values.get(("repaired",), 0)
+        rag.generate_sql_with_openai("How many employees?", context)
+        assert stub.calls["chat"] == 3 + 3 + 1
+        assert rag.SQL_SPECULATION._values[("repaired",)] == repaired + 1
+    finally:
+        stub.stop()
+
+
+def test_speculative_candidates_respect_token_budget(monkeypatch):
+    monkeypatch.setattr(rag, "SQL_SPECULATIVE_FANOUT", 4)
+    monkeypatch.setattr(rag, "SQL_SPECULATIVE_TEMPERATURES", [0.3, 0.7])
+    monkeypatch.setattr(rag, "SQL_SPECULATIVE_TOKEN_BUDGET", 3000)
+    assert rag.speculative_candidates("ft:model", 1000) == [("ft:model", 0.0), (rag.BASE_MODEL, 0.0),
+                                                            ("ft:model", 0.3)]
+    assert rag.speculative_candidates(rag.BASE_MODEL, 1000) == [(rag.BASE_MODEL, 0.0), (rag.BASE_MODEL, 0.3),
+                                                                (rag.BASE_MODEL, 0.7)]
+    assert rag.speculative_candidates("ft:model", 5000) == [("ft:model", 0.0)]
@@ -0,0 +1,68 @@
+import asyncio
+
+from openai import AsyncOpenAI, OpenAI
+
+import rag
+import rag_async
+import retriever
+from benchmarks.fixtures import build_stub_index, seed_database
+from benchmarks.stub_llm import StubLLMServer
+from llm_client import AsyncLLMClient, CircuitBreaker, LLMClient
+
+
+def test_async_database_uri():
+    assert rag_async.async_database_uri("mysql+pymysql://u:p@h/db") == "mysql+aiomysql://u:p@h/db"
+    assert rag_async.async_database_uri("sqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+
+
+def use_stub(stub, tmp_path, monkeypatch):
+    uri = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    seed_database(uri, n_employees=20)
+    index_file, docs_file = build_stub_index(str(tmp_path), [{"id": "schema-0", "text": "employees (...)"}])
+    monkeypatch.setenv("SQLALCHEMY_DATABASE_URI", uri)
+    monkeypatch.setattr(rag_async, "_ASYNC_ENGINE", None)
+    limits = LLMClient(OpenAI(base_url=stub.base_url, api_key="stub", max_retries=0),
+                       breaker=CircuitBreaker(failures=2))
+    monkeypatch.setattr(rag_async, "llm", AsyncLLMClient(
+        AsyncOpenAI(base_url=stub.base_url, api_key="stub", max_retries=0), limits))
+    monkeypatch.setattr(rag, "SQL_CACHE_ENABLED", False)
+    monkeypatch.setattr(rag_async, "SQL_CACHE_ENABLED", False)
+    monkeypatch.setattr(rag_async, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(retriever, "_RETRIEVER",
+                        retriever.Retriever(index_file, docs_file, str(tmp_path / "none.version")))
+    return limits
+
+
+def ask(question):
+    async def run():
+        try:
+            return await rag_async.answer_question_async(question)
+        finally:
+            await rag_async.get_async_engine().dispose()
+
+    return asyncio.run(run())
+
+
+def test_answer_question_async_end_to_end(tmp_path, monkeypatch):
+    stub = StubLLMServer(latency=0).start()
+    try:
+        use_stub(stub, tmp_path, monkeypatch)
+        answer, meta = ask("list five employees")
+        assert "stub answer" in answer
+        assert meta["sql_meta"]["row_count"] == 5
+        assert stub.calls == {"embeddings": 1, "chat": 2, "errors": 0}
+    finally:
+        stub.stop()
+
+
+def test_async_pipeline_falls_back_and_shares_the_breaker(tmp_path, monkeypatch):
+    stub = StubLLMServer(latency=0).start()
+    try:
+        limits = use_stub(stub, tmp_path, monkeypatch)
+        monkeypatch.setattr(rag, "LOCAL_SQL_ENABLED", False)
+        stub.error_rate = 1.0
+        answer, meta = ask("list five employees")
+        assert answer.startswith("Sorry, I can't answer that right now")
+        assert limits.breaker.state == "open"  # the sync pipeline now fails fast too
+    finally:
+        stub.stop()
@@ -0,0 +1,82 @@
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+import openai
+import pytest
+from openai import OpenAI
+from sqlalchemy import create_engine
+
+import rag
+import rag_batch
+import retriever
+from benchmarks.fixtures import build_stub_index, seed_database
+from benchmarks.stub_llm import StubLLMServer
+from llm_client import LLMClient
+from rag_batch import BatchJob, dedupe, read_questions, retry_delay
+
+
+def test_dedupe_and_read_questions():
+    unique, positions = dedupe(["How many employees?", "how many  employees?", "List projects"])
+    assert unique == ["How many employees?", "List projects"]
+    assert positions == [[0, 1], [2]]
+    assert read_questions('["a", {"question": "b"}]') == ["a", "b"]
+    assert read_questions('{"question": "a"}\n\nplain question\n"c"\n') == ["a", "plain question", "c"]
+    with pytest.raises(ValueError, match="question"):
+        read_questions('[{"q": "a"}]')
+    with pytest.raises(ValueError, match="question"):
+        read_questions('{"question": "a"}\n{"text": "b"}')
+
+
+def test_retry_delay_uses_retry_after():
+    error = SimpleNamespace(response=SimpleNamespace(headers={"retry-after-ms": "250"}))
+    assert retry_delay(error, 0) == 0.25
+    assert 0.5 <= retry_delay(SimpleNamespace(response=None), 0) <= 1.5
+
+
+def test_batch_job_end_to_end(tmp_path, monkeypatch):
+    stub = StubLLMServer(latency=0).start()
+    try:
+        uri = f"sqlite:///{tmp_path / 'db.sqlite'}"
+        seed_database(uri, n_employees=20)
+        docs = [{"id": f"schema-{i}", "text": f"employees chunk {i}"} for i in range(6)]
+        index_file, docs_file = build_stub_index(str(tmp_path), docs)
+        stub_llm = LLMClient(OpenAI(base_url=stub.base_url, api_key="stub"))
+        monkeypatch.setattr(rag, "llm", stub_llm)
+        monkeypatch.setattr(retriever, "llm", stub_llm)
+        monkeypatch.setattr(rag, "_ENGINE", create_engine(uri))
+        monkeypatch.setattr(rag, "SQL_CACHE_ENABLED", False)
+        monkeypatch.setattr(rag, "ANSWER_CACHE_ENABLED", False)
+        monkeypatch.setattr(retriever, "_RETRIEVER",
+                            retriever.Retriever(index_file, docs_file, str(tmp_path / "none.version")))
+
+        questions = [f"batch question {i}" for i in range(10)] + ["Batch question 3"]
+        job = BatchJob(questions, concurrency=4)
+        results = list(job)
+        assert sorted(r["index"] for r in results) == list(range(11))
+        assert all(r["error"] is None and r["meta"]["sql_meta"]["row_count"] == 5 for r in results)
+        assert sum(r["duplicate"] for r in results) == 1
+        # One batched embeddings request for all unique questions, one SQL generation each.
+        assert stub.calls["embeddings"] == 1
+        assert job.stats()["unique"] == 10 and job.stats()["questions_per_second"] > 0
+    finally:
+        stub.stop()
+
+
+def test_batch_retries_rate_limits(monkeypatch):
+    calls = []
+
+    def answer(question, context=None):
+        calls.append(question)
+        if len(calls) == 1:
+            response = SimpleNamespace(request=None, status_code=429, headers={"retry-after-ms": "10"})
+            raise openai.RateLimitError("slow down", response=response, body=None)
+        return "ok", {"sql_meta": {"query": "SELECT 1"}}
+
+    monkeypatch.setattr(rag, "answer_question", answer)
+    monkeypatch.setattr(rag_batch, "query_inputs_many", lambda qs: (qs, None))
+    monkeypatch.setattr(rag_batch, "search_context_many", lambda *a: [None])
+    monkeypatch.setattr(rag, "shared_connection", nullcontext)
+    job = BatchJob(["only question"], concurrency=1)
+    results = list(job)
+    assert results[0]["reply"] == "ok" and calls == ["only question", "only question"]
+    assert job.stats()["rate_limited"] == 1
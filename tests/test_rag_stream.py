@@ -0,0 +1,59 @@
+from openai import OpenAI
+from sqlalchemy import create_engine
+
+import metrics
+import rag
+import retriever
+from benchmarks.fixtures import build_stub_index, seed_database
+from benchmarks.stub_llm import StubLLMServer, DEFAULT_ANSWER
+from llm_client import LLMClient
+
+
+def use_stub(stub, tmp_path, monkeypatch):
+    uri = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    seed_database(uri, n_employees=20)
+    index_file, docs_file = build_stub_index(str(tmp_path), [{"id": "schema-0", "text": "employees (...)"}])
+    stub_llm = LLMClient(OpenAI(base_url=stub.base_url, api_key="stub", max_retries=0))
+    monkeypatch.setattr(rag, "llm", stub_llm)
+    monkeypatch.setattr(retriever, "llm", stub_llm)
+    monkeypatch.setattr(rag, "_ENGINE", create_engine(uri))
+    monkeypatch.setattr(rag, "SQL_CACHE_ENABLED", False)
+    monkeypatch.setattr(rag, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(retriever, "_RETRIEVER",
+                        retriever.Retriever(index_file, docs_file, str(tmp_path / "none.version")))
+    return stub_llm
+
+
+def test_answer_question_stream_events(tmp_path, monkeypatch):
+    stub = StubLLMServer(latency=0).start()
+    try:
+        use_stub(stub, tmp_path, monkeypatch)
+        executed = metrics.STAGE_SECONDS.count(stage="db_execute")
+        events = list(rag.answer_question_stream("stream five employees"))
+        kinds = [e for e, _ in events]
+        assert kinds[:4] == ["status", "sql", "rows", "status"]
+        assert kinds[-1] == "done" and kinds.count("token") > 1
+        assert "".join(d["text"] for e, d in events if e == "token") == DEFAULT_ANSWER
+        assert events[2][1]["row_count"] == 5
+        assert events[-1][1]["answer"] == DEFAULT_ANSWER
+        assert metrics.STAGE_SECONDS.count(stage="db_execute") == executed + 1
+    finally:
+        stub.stop()
+
+
+def test_stream_cut_off_counts_as_failure_and_falls_back(tmp_path, monkeypatch):
+    stub = StubLLMServer(latency=0).start()
+    try:
+        stub_llm = use_stub(stub, tmp_path, monkeypatch)
+        monkeypatch.setattr(rag, "ANSWER_CACHE_ENABLED", True)
+        monkeypatch.setattr(rag, "answer_cache", rag.AnswerCache(lambda q: [1.0] * 8))
+        stub.stream_cut_after = 2
+        events = list(rag.answer_question_stream("stream five employees"))
+        tokens = [d["text"] for e, d in events if e == "token"]
+        assert "".join(tokens[:2]) == DEFAULT_ANSWER[:8]
+        assert "\n\n" in tokens[-1]  # the locally rendered result follows the partial answer
+        assert events[-1][0] == "done" and events[-1][1]["answer"] == "".join(tokens).strip()
+        assert stub_llm.breaker._consecutive == 1
+        assert rag.answer_cache.lookup("stream five employees") is None  # fallback answers are not cached
+    finally:
+        stub.stop()
@@ -0,0 +1,41 @@
+import rag
+import renderer
+from renderer import render_answer, render_result
+
+
+def test_known_shapes():
+    assert render_result({"result": []}) == "No data found."
+    assert render_result({"result": [{"Count(Distinct T1.Employee Id)": 1}]}) == "The count is 1."
+    assert render_result({"result": [{"City": "Pune"}, {"City": "Delhi"}]}) == "City (2): Pune, Delhi."
+
+    grouped = render_result({"result": [{"Department": "HR", "Average Salary": 50000.0},
+                                        {"Department": "IT", "Average Salary": 80000.5}]})
+    assert grouped.startswith("Average Salary by Department (2 groups): highest is IT (80,000.5), lowest is HR (50,000).")
+    assert "<table>" in grouped
+
+    listing = render_result({"result": [{"First Name": "A&B", "Last Name": "C"}], "row_count": 3})
+    assert listing.startswith("3 rows found.<br>Showing the first 1 of 3 rows.")
+    assert "<td>A&amp;B</td>" in listing
+
+
+def test_long_text_is_left_to_llm():
+    assert render_result({"result": [{"Notes": "x" * 500}, {"Notes": "y"}]}) is None
+
+
+def test_modes_and_stats(monkeypatch):
+    monkeypatch.setattr(renderer, "_stats", {"local": 0, "llm": 0})
+    meta = {"result": [{"City": "Pune"}]}
+    assert render_answer("cities?", meta, mode="llm") is None
+    assert render_answer("cities?", meta, mode="auto") == "City: Pune."
+    assert render_answer("explain why cities differ", meta, mode="auto") is None
+    assert render_answer("cities?", {"error": "boom"}, mode="auto") is None
+    assert render_answer("notes", {"result": [{"Notes": "x" * 500}]}, mode="local").startswith("<table>")
+    assert renderer.stats()["llm_calls_avoided"] == 2 and renderer.stats()["llm_calls"] == 3
+
+
+def test_fallback_render_is_not_counted_twice(monkeypatch):
+    monkeypatch.setattr(renderer, "_stats", {"local": 0, "llm": 0})
+    meta = {"result": [{"City": "Pune"}]}
+    assert render_answer("cities?", meta, mode="llm") is None
+    assert rag.fallback_answer("cities?", meta, "LLM down") == "City: Pune."
+    assert renderer.stats()["llm_calls_avoided"] == 0 and renderer.stats()["llm_calls"] == 1
@@ -0,0 +1,55 @@
+import os
+
+import faiss
+import numpy as np
+
+import doc_store
+from retriever import Retriever, id_positions, stored_vectors
+
+
+def write_index(tmp_path, n, dim=8):
+    index = faiss.IndexFlatL2(dim)
+    index.add(np.eye(n, dim, dtype="float32"))
+    faiss.write_index(index, str(tmp_path / "index.bin"))
+    doc_store.write(tmp_path / "docs.bin", [{"id": f"example-{i}", "text": f"doc {i}"} for i in range(n)])
+    (tmp_path / "index.version").write_text(f"v{n}")
+
+
+def make_retriever(tmp_path, **kwargs):
+    return Retriever(str(tmp_path / "index.bin"), str(tmp_path / "docs.bin"),
+                     str(tmp_path / "index.version"), check_interval=0, **kwargs)
+
+
+def test_loads_once(tmp_path):
+    write_index(tmp_path, 4)
+    r = make_retriever(tmp_path)
+    first = r.snapshot()
+    assert r.snapshot()[0] is first[0]
+
+    D, I, docs = r.search(np.eye(1, 8, 2, dtype="float32"), 1)
+    assert docs[I[0][0]]["text"] == "doc 2"
+
+
+def test_hot_reload_on_new_version(tmp_path):
+    write_index(tmp_path, 4)
+    r = make_retriever(tmp_path)
+    assert r.snapshot()[0].ntotal == 4
+
+    write_index(tmp_path, 6)
+    index, docs = r.snapshot()
+    assert index.ntotal == 6 and len(docs) == 6
+
+
+def test_mmap(tmp_path):
+    write_index(tmp_path, 4)
+    r = make_retriever(tmp_path, mmap=True)
+    assert r.snapshot()[0].ntotal == 4
+
+
+def test_stored_vectors_by_id():
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(4))
+    index.add_with_ids(np.eye(3, 4, dtype="float32"), np.array([30, 10, 20], dtype="int64"))
+    assert id_positions(index) is id_positions(index)  # built once per index
+    assert stored_vectors(index, [20, 30]).tolist() == [[0, 0, 1, 0], [1, 0, 0, 0]]
+    assert stored_vectors(index, [99]) is None and stored_vectors(index, []) is None
+    assert stored_vectors(faiss.IndexFlatL2(4), [0]) is None
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+
+from single_flight import AsyncSingleFlight, FileFlight, SingleFlight
+
+
+def run_concurrently(n, fn):
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def worker(i):
+        barrier.wait()
+        results[i] = fn(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_threads_share_one_computation():
+    flight, calls = SingleFlight(), []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"answer": 42}
+
+    results = run_concurrently(8, lambda i: flight.do("q", compute))
+    assert len(calls) == 1
+    assert all(value == {"answer": 42} for value, _ in results)
+    assert sum(shared for _, shared in results) == 7
+    # Nothing is remembered once the computation is done.
+    assert flight.do("q", lambda: 1) == (1, False)
+
+
+def test_followers_get_the_leaders_exception():
+    flight = SingleFlight()
+
+    def fail():
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    def call():
+        try:
+            flight.do("q", fail)
+        except ValueError as e:
+            return str(e)
+
+    assert run_concurrently(4, lambda i: call()) == ["boom"] * 4
+
+
+def test_async_tasks_share_one_computation():
+    flight, calls = AsyncSingleFlight(), []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("q", compute) for _ in range(10)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1 and [v for v, _ in results] == ["answer"] * 10
+
+
+def test_file_flight_shares_result_between_processes(tmp_path):
+    # Two SingleFlight instances stand in for two worker processes.
+    files = FileFlight(str(tmp_path))
+    workers, calls = [SingleFlight(files), SingleFlight(files)], []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return ["answer", {"rows": 3}]
+
+    results = run_concurrently(2, lambda i: workers[i].do("q", compute))
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True]
+    assert all(value == ["answer", {"rows": 3}] for value, _ in results)
@@ -0,0 +1,65 @@
+from sqlalchemy import create_engine, text
+
+from sql_cache import SqlResultCache
+from sql_validator import canonicalize_sql
+from table_versions import TableVersions
+
+
+def test_canonical_form_ignores_whitespace_case_and_aliases():
+    a = ("SELECT T1.first_name FROM employees AS T1 INNER JOIN employee_addresses AS T2 "
+         "ON T1.employee_id = T2.employee_id WHERE T2.country = 'Australia';")
+    b = ("select e.first_name\nfrom employees e join employee_addresses a\n"
+         "  on e.employee_id=a.employee_id -- by country\nwhere a.country = 'Australia'")
+    assert canonicalize_sql(a) == canonicalize_sql(b)
+    assert canonicalize_sql(a) != canonicalize_sql(a.replace("Australia", "India"))
+
+
+def test_hit_and_table_invalidation():
+    cache = SqlResultCache(versions=TableVersions())
+    sql = "SELECT first_name FROM employees e WHERE e.department = 'HR'"
+    cache.put(sql, {"result": [{"First Name": "Ann"}]})
+    assert cache.get("SELECT first_name FROM employees AS x WHERE x.department = 'HR';") == {"result": [{"First Name": "Ann"}]}
+
+    cache.versions.bump("employee_projects")
+    assert cache.get(sql) is not None
+    cache.versions.bump("employees")
+    assert cache.get(sql) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_limits_and_eviction():
+    cache = SqlResultCache(max_entries=2, max_rows=3, versions=TableVersions())
+    assert not cache.put("SELECT 1 FROM employees", {"result": [{"a": i} for i in range(4)]})
+    for i in range(3):
+        cache.put(f"SELECT {i} FROM employees", {"result": [{"a": i}]})
+    assert cache.get("SELECT 0 FROM employees") is None
+    assert cache.get("SELECT 2 FROM employees") == {"result": [{"a": 2}]}
+
+    small = SqlResultCache(max_bytes=40, versions=TableVersions())
+    small.put("SELECT 1 FROM employees", {"result": [{"a": "x" * 10}]})
+    small.put("SELECT 2 FROM employees", {"result": [{"a": "y" * 10}]})
+    assert small.stats()["size"] == 1
+
+
+def test_probe_bumps_changed_tables():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE employees (employee_id INTEGER, updated_at TEXT)"))
+        conn.execute(text("INSERT INTO employees VALUES (1, '2025-01-01')"))
+    queries = {"employees": "SELECT MAX(updated_at), COUNT(*) FROM employees"}
+    versions = TableVersions()
+    with engine.begin() as conn:
+        versions.probe(conn, queries)
+        versions.probe(conn, queries)
+        assert versions.get("employees") == 0
+        conn.execute(text("UPDATE employees SET updated_at = '2025-02-01'"))
+        versions.probe(conn, queries)
+    assert versions.get("employees") == 1
+
+
+def test_row_cap_is_part_of_the_key():
+    cache = SqlResultCache(versions=TableVersions())
+    sql = "SELECT first_name FROM employees"
+    cache.put(sql, {"result": [{"a": 1}], "truncated": True}, row_cap=1)
+    assert cache.get(sql, row_cap=1) == {"result": [{"a": 1}], "truncated": True}
+    assert cache.get(sql, row_cap=100) is None and cache.get(sql) is None
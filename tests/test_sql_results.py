@@ -0,0 +1,38 @@
+import os
+from decimal import Decimal
+
+from sqlalchemy import create_engine, text
+
+import rag
+from sql_results import StreamingSummary, encode_rows
+
+
+def test_streaming_summary():
+    s = StreamingSummary(["Department", "Salary"])
+    for row in [("HR", Decimal("100.5")), ("IT", 200), ("IT", None)]:
+        s.add(row)
+    out = s.to_dict()
+    assert out["row_count"] == 3
+    assert out["columns"]["Department"] == {"non_null": 3}
+    assert out["columns"]["Salary"] == {"non_null": 2, "min": 100.5, "max": 200.0, "avg": 150.25}
+
+
+def test_encode_rows_is_compact():
+    assert encode_rows([{"City": "Pune", "Cnt": 2}, {"City": "Delhi", "Cnt": 1}]) == '["City","Cnt"]\n["Pune",2]\n["Delhi",1]'
+
+
+def test_run_sql_query_caps_rows(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_path, 'db.sqlite')}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE employees (first_name TEXT, salary NUMERIC)"))
+        conn.execute(text("INSERT INTO employees VALUES (:n, :s)"), [{"n": f"e{i}", "s": i} for i in range(10)])
+    monkeypatch.setattr(rag, "_ENGINE", engine)
+    monkeypatch.setattr(rag, "SQL_CACHE_ENABLED", False)
+
+    meta = rag.run_sql_query("SELECT first_name, salary FROM employees", row_cap=3)
+    assert meta["row_count"] == 10 and meta["truncated"]
+    assert meta["result"] == [{"First Name": f"e{i}", "Salary": i} for i in range(3)]
+    assert meta["summary"]["columns"]["Salary"]["avg"] == 4.5
+
+    prompt = rag.build_prompt("list employees", meta)[0]["content"]
+    assert "10 rows in total" in prompt and '"e2"' in prompt and '"e3"' not in prompt
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+import rag
+from sql_validator import analyze_sql, validate_sql, with_limit
+
+
+def test_schema_checks():
+    assert validate_sql("SELECT e.first_name, a.city FROM employees e JOIN employee_addresses a "
+                        "ON e.employee_id = a.employee_id WHERE e.updated_at > '2024-01-01'") == (True, [])
+    assert validate_sql("SELECT ea.id FROM employee_addresses ea")[1] == ["employee_addresses has no column 'id'"]
+    assert validate_sql("SELECT first_name FROM employes")[1] == ["unknown table 'employes' (did you mean 'employees'?)"]
+    assert validate_sql("SELECT x.first_name FROM employees e")[1] == ["unknown table alias 'x' in x.first_name"]
+    assert "ambiguous column 'employee_id'" in validate_sql(
+        "SELECT employee_id FROM employees e JOIN employee_projects p ON e.employee_id = p.employee_id")[1][0]
+
+
+def test_scopes_aliases_and_subqueries():
+    ok = [
+        "SELECT department, COUNT(*) AS n FROM employees GROUP BY department HAVING n > 2 ORDER BY n DESC",
+        "SELECT e.first_name FROM employees e WHERE EXISTS "
+        "(SELECT 1 FROM employee_projects p WHERE p.employee_id = e.employee_id)",
+        "SELECT t.department FROM (SELECT department, AVG(salary) AS s FROM employees GROUP BY department) t "
+        "WHERE t.s > 1000",
+        "WITH x AS (SELECT employee_id FROM employees) SELECT x.employee_id FROM x",
+        "SELECT EXTRACT(YEAR FROM hire_date) y FROM employees WHERE hire_date > NOW() - INTERVAL 1 YEAR",
+        "SELECT employee_id FROM employees JOIN employee_addresses USING (employee_id)",
+    ]
+    for sql in ok:
+        assert validate_sql(sql) == (True, []), sql
+    assert validate_sql("SELECT t.salary FROM (SELECT department FROM employees) t")[1] == ["t has no column 'salary'"]
+
+
+def test_read_only_single_statement():
+    for sql in ["DELETE FROM employees", "SELECT 1; DROP TABLE employees",
+                "SELECT first_name FROM employees FOR UPDATE", "SELECT /*! SLEEP(5) */ 1"]:
+        assert not analyze_sql(sql).read_only, sql
+    assert analyze_sql("SELECT 1 -- ; DROP TABLE employees").read_only
+    # Unparseable: not read-only even in safe mode, and no second LIMIT appended.
+    unparseable = "SELECT first_name FROM employees WHERE (salary > 5 LIMIT 5"
+    assert not analyze_sql(unparseable).read_only
+    assert with_limit(unparseable, 100) == unparseable
+
+
+def test_limit_injection_and_check_sql_safe(monkeypatch):
+    assert with_limit("SELECT first_name FROM employees; -- all", 100) == "SELECT first_name FROM employees\nLIMIT 100"
+    assert with_limit("SELECT first_name FROM employees LIMIT 5", 100).endswith("LIMIT 5")
+
+    # `updated_at` used to be rejected by the substring check for "update".
+    assert rag.check_sql_safe("SELECT updated_at FROM employees").endswith(f"LIMIT {rag.SQL_DEFAULT_LIMIT}")
+    for sql in ["UPDATE employees SET salary = 0", "SELECT nope FROM employees"]:
+        try:
+            rag.check_sql_safe(sql)
+        except RuntimeError:
+            continue
+        raise AssertionError(sql)
+
+    monkeypatch.setattr(rag, "SQL_VALIDATION", "safe")
+    assert rag.check_sql_safe("SELECT nope FROM employees").endswith(f"LIMIT {rag.SQL_DEFAULT_LIMIT}")
+    with pytest.raises(RuntimeError, match="Unsafe SQL blocked: could not parse"):
+        rag.check_sql_safe("SELECT first_name FROM employees WHERE (salary > 5 LIMIT 5")
+
+
+def test_fast_and_cached():
+    sql = ("SELECT e.first_name, ea.city FROM employees AS e JOIN employee_addresses AS ea "
+           "ON e.employee_id = ea.employee_id WHERE ea.country = 'India' ORDER BY e.first_name")
+    analyze_sql.cache_clear()
+    start = time.perf_counter()
+    analyze_sql(sql)
+    assert time.perf_counter() - start < 0.005
+    assert analyze_sql(sql) is analyze_sql(sql)
+    assert analyze_sql.cache_info().hits >= 2
@@ -0,0 +1,97 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import train_model
+from local_sql import LocalSqlGenerator
+from train_model import (OnlineSqlModel, OnlineSqlTrainer, append_examples, current_snapshot, publish_snapshot,
+                         read_log)
+
+HR = "SELECT first_name, last_name FROM employees WHERE department = 'HR';"
+MARKETING = "SELECT first_name, last_name FROM employees WHERE department = 'Marketing';"
+TITLES = "SELECT DISTINCT job_title FROM employees;"
+INDIA = ("SELECT COUNT(*) FROM employees e JOIN employee_addresses a "
+         "ON e.employee_id = a.employee_id WHERE a.country = 'India';")
+DATA = [
+    {"question": "list employees from HR", "sql": HR, "answer": ""},
+    {"question": "show employees of Marketing department", "sql": MARKETING, "answer": ""},
+    {"question": "give me all unique job titles", "sql": TITLES, "answer": ""},
+    {"question": "what job titles exist", "sql": TITLES, "answer": ""},
+]
+
+
+def test_classes_are_templates_and_grow():
+    model = OnlineSqlModel()
+    model.partial_fit(["list employees from HR"], [HR])
+    assert model.clf is None  # one template: held back
+    model.partial_fit(["list employees from Marketing", "what job titles exist"], [MARKETING, TITLES], epochs=5)
+    assert set(model.clf.classes_) == {HR, TITLES}  # Marketing shares the HR template
+    assert model.slot_values["department"] == {"HR", "Marketing"}
+    model.partial_fit(["how many employees live in India"] * 5, [INDIA] * 5)
+    assert len(model.clf.classes_) == 3 and model.clf.classes_[-1] == INDIA
+    assert model.clf.coef_.shape == (3, model.vec.n_features)
+    assert model.clf.predict(model.vec.transform(["how many employees live in India"]))[0] == INDIA
+    assert model.clf.predict(model.vec.transform(["what job titles exist"]))[0] == TITLES
+
+
+def test_log_is_append_only_and_skips_torn_line(tmp_path):
+    log = str(tmp_path / "log.jsonl")
+    offset = append_examples(DATA[:2], log)
+    with open(log, "a") as f:
+        f.write(json.dumps(DATA[2])[:20])  # writer still busy
+    examples, end = read_log(log)
+    assert examples == DATA[:2] and end == offset
+    assert read_log(log, end)[0] == []
+
+
+def test_trainer_publishes_and_resumes(tmp_path):
+    data = tmp_path / "training_data.json"
+    data.write_text(json.dumps(DATA))
+    log, snapshots = str(tmp_path / "log.jsonl"), str(tmp_path / "online")
+    trainer = OnlineSqlTrainer(log, snapshots, str(data))
+    assert trainer.publish() == 1
+    assert trainer.add([{"question": "how many employees live in India", "sql": INDIA, "answer": "3"}]) == 2
+    assert current_snapshot(snapshots)[0] == 2 and len(read_log(log)[0]) == 1
+
+    # Logged by another process after the last snapshot: replayed on resume.
+    append_examples([{"question": "count employees from India", "sql": INDIA, "answer": "3"}], log)
+    resumed = OnlineSqlTrainer(log, snapshots, str(data))
+    assert resumed.model.examples == len(DATA) + 2
+    assert resumed.offset == read_log(log)[1]
+
+
+def test_generator_hot_reloads_snapshots(tmp_path):
+    data = tmp_path / "training_data.json"
+    data.write_text(json.dumps(DATA))
+    snapshots = str(tmp_path / "online")
+    trainer = OnlineSqlTrainer(str(tmp_path / "log.jsonl"), snapshots, str(data))
+    gen = LocalSqlGenerator(vec_path="missing", clf_path="missing", threshold=0.0, snapshot_dir=snapshots,
+                            reload_interval=0)
+    assert gen.generate("list employees from Marketing") is None  # no model yet
+    trainer.publish()
+    assert gen.generate("list employees from Marketing") == MARKETING
+    assert gen.version == 1 and INDIA not in gen.clf.classes_
+
+    trainer.add([{"question": "how many employees live in India", "sql": INDIA, "answer": "3"}] * 5)
+    assert gen.predict("how many employees live in India")[0][0].startswith("SELECT COUNT(*)")
+    assert gen.version == 2
+
+
+def test_train_sql_model_reuses_one_trainer_and_batches(tmp_path, monkeypatch):
+    data = tmp_path / "training_data.json"
+    data.write_text(json.dumps(DATA))
+    snapshots = str(tmp_path / "online")
+    trainer = OnlineSqlTrainer(str(tmp_path / "log.jsonl"), snapshots, str(data), snapshot_every=2)
+    monkeypatch.setattr(train_model, "_trainer", trainer)
+    example = {"question": "how many employees live in India", "sql": INDIA, "answer": "3"}
+    assert "1 pending" in train_model.train_sql_model(example)
+    assert current_snapshot(snapshots) is None
+    assert "snapshot 1 published" in train_model.train_sql_model(example)
+    assert train_model.online_trainer() is trainer
+
+
+def test_concurrent_publishers_get_distinct_versions(tmp_path):
+    snapshots = str(tmp_path / "online")
+    with ThreadPoolExecutor(8) as pool:
+        versions = list(pool.map(lambda i: publish_snapshot({"vec": None, "clf": i}, snapshots, keep=20), range(16)))
+    assert sorted(versions) == list(range(1, 17))
+    assert current_snapshot(snapshots)[0] == 16
@@ -0,0 +1,59 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import db_engines
+import rag
+import retriever
+import warmup
+from benchmarks.fixtures import build_stub_index
+from llm_client import LazyClient
+from local_sql import LocalSqlGenerator
+from train_model import fit_sql_model
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(warmup, "_ready", threading.Event())
+    monkeypatch.setattr(warmup, "_started", False)
+    monkeypatch.setattr(warmup, "_timings", {})
+    monkeypatch.setattr(db_engines, "DB_WARMUP", False)
+
+
+def test_warm_up_loads_state_before_ready(tmp_path, monkeypatch):
+    docs = [{"id": f"schema-{i}", "text": f"employees chunk {i}"} for i in range(3)]
+    index_file, docs_file = build_stub_index(str(tmp_path), docs)
+    loaded = retriever.Retriever(index_file, docs_file, str(tmp_path / "none.version"))
+    monkeypatch.setattr(retriever, "_RETRIEVER", loaded)
+    model = fit_sql_model(["how many employees", "list all projects"],
+                          ["SELECT COUNT(*) FROM employees", "SELECT * FROM employee_projects"])
+    monkeypatch.setattr(rag, "local_sql", LocalSqlGenerator(model=model))
+    monkeypatch.setattr(rag, "LOCAL_SQL_ENABLED", True)
+
+    assert set(warmup.warm_up()) == {"index", "tokenizer", "openai", "local_sql"}
+    assert loaded._snapshot is not None and rag.local_sql.clf is not None
+    assert not warmup.is_ready()
+    warmup.warm_up_worker()
+    assert warmup.is_ready()
+
+
+def test_failed_step_loads_later(tmp_path, monkeypatch):
+    monkeypatch.setattr(retriever, "_RETRIEVER", retriever.Retriever(
+        str(tmp_path / "missing.bin"), str(tmp_path / "missing.pkl"), str(tmp_path / "none.version")))
+    assert "index" not in warmup.warm_up()
+
+
+def test_start_background_runs_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr(warmup, "warm_up", lambda: calls.append(1))
+    warmup.start_background()
+    warmup.start_background()
+    assert warmup._ready.wait(5) and calls == [1]
+
+
+def test_lazy_client_builds_on_first_use():
+    built = []
+    client = LazyClient(lambda: built.append(1) or SimpleNamespace(name="stub"))
+    assert built == []
+    assert client.name == "stub" and client.name == "stub" and built == [1]
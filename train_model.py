@@ -1,56 +1,362 @@
-import json, joblib, os
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+import fcntl, json, os, threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
 
 MODEL_DIR = "models"
 VEC_PATH = os.path.join(MODEL_DIR, "vectorizer.pkl")
 CLF_PATH = os.path.join(MODEL_DIR, "sql_model.pkl")
-DATA_PATH = "training_data.json"
+DATA_PATH = os.path.join("data", "training_data.json")
+# Examples added after training_data.json, one JSON object per line, append-only.
+LOG_PATH = os.getenv("LOCAL_SQL_LOG", os.path.join("data", "training_log.jsonl"))
+# Versioned model snapshots (sql_model-000001.joblib, ...) and the CURRENT
+# file naming the one to serve; LocalSqlGenerator picks up a new one without a restart.
+SNAPSHOT_DIR = os.getenv("LOCAL_SQL_SNAPSHOTS", os.path.join(MODEL_DIR, "online"))
+SNAPSHOT_KEEP = 5
+# Examples added between snapshots published by OnlineSqlTrainer.add(); they
+# are learned together when the snapshot is due.
+SNAPSHOT_EVERY = int(os.getenv("LOCAL_SQL_SNAPSHOT_EVERY", "1"))
+# Hashed feature space of the online model, and passes over training_data.json when it starts from scratch.
+HASH_FEATURES = 2 ** 16
+BOOTSTRAP_EPOCHS = 5
+REQUIRED_KEYS = {"question", "sql", "answer"}
 
 
-def train_sql_model(new_example=None):
+def fit_sql_model(questions, sqls):
     """
-    Train or update the SQL NLP model.
+    Fit the question -> SQL classifier; returns (vectorizer, classifier).
 
-    Args:
-        new_example (dict): optional, {"question": "...", "sql": "...", "answer": "..."} 
-                            If given, it's added to training_data.json before training.
+    Stop words are kept ("not", "each", "per" change the query), and weak
+    regularization keeps predict_proba() sharp enough to gate on.
     """
-    os.makedirs(MODEL_DIR, exist_ok=True)
+    # Imported here: the serving process only needs the paths above (scikit-learn loads with the model).
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    vec = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True)
+    X = vec.fit_transform(questions)
+
+    clf = LogisticRegression(max_iter=2000, C=30)
+    clf.fit(X, sqls)
+    return vec, clf
+
+
+# ------------------------
+# Example log
+# ------------------------
+def check_example(example):
+    if not REQUIRED_KEYS.issubset(example.keys()):
+        raise ValueError(f"New example must contain keys: {REQUIRED_KEYS}")
+
+
+def append_examples(examples, log_path=LOG_PATH) -> int:
+    """Append examples to the log (flushed to disk); returns the log size after them."""
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    with open(log_path, "a", encoding="utf-8") as f:
+        for example in examples:
+            f.write(json.dumps(example, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def read_log(log_path=LOG_PATH, offset=0):
+    """
+    Examples logged from byte `offset` on; returns (examples, offset after the
+    last complete line). A line still being written is left for the next read.
+    """
+    if not os.path.exists(log_path):
+        return [], offset
+    examples = []
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if line.strip():
+                examples.append(json.loads(line))
+    return examples, offset
 
-    # 1. Load existing data
-    if os.path.exists(DATA_PATH):
-        with open(DATA_PATH, "r", encoding="utf-8") as f:
+
+def load_examples(data_path=DATA_PATH, log_path=LOG_PATH):
+    """training_data.json followed by the logged examples."""
+    data = []
+    if os.path.exists(data_path):
+        with open(data_path, "r", encoding="utf-8") as f:
             data = json.load(f)
-    else:
-        data = []
+    return data + read_log(log_path)[0]
+
+
+# ------------------------
+# Snapshots
+# ------------------------
+def current_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    """(version, path) of the snapshot to serve, or None if none was published."""
+    try:
+        with open(os.path.join(snapshot_dir, "CURRENT"), "r", encoding="utf-8") as f:
+            current = json.load(f)
+    except FileNotFoundError:
+        return None
+    return current["version"], os.path.join(snapshot_dir, current["file"])
+
+
+def load_snapshot(path) -> dict:
+    """{"vec", "clf", "version", "log_offset", "examples"[, "vocab", "model"]} as written by publish_snapshot()."""
+    import joblib
+    return joblib.load(path)
+
+
+def publish_snapshot(payload, snapshot_dir=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP) -> int:
+    """
+    Write payload (at least "vec" and "clf") as the next version and point
+    CURRENT at it, both atomically; older snapshots beyond `keep` are removed.
+    Publishers (in any process) take turns on a lock file, so each gets its
+    own version. Returns the version.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    fd = os.open(os.path.join(snapshot_dir, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return _publish_locked(payload, snapshot_dir, keep)
+    finally:
+        os.close(fd)  # releases the lock
+
+
+def _publish_locked(payload, snapshot_dir, keep):
+    import joblib
+
+    current = current_snapshot(snapshot_dir)
+    version = current[0] + 1 if current else 1
+    name = f"sql_model-{version:06d}.joblib"
+    tmp = os.path.join(snapshot_dir, name + ".tmp")
+    joblib.dump({**payload, "version": version}, tmp)
+    os.replace(tmp, os.path.join(snapshot_dir, name))
+
+    tmp = os.path.join(snapshot_dir, "CURRENT.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "file": name}, f)
+    os.replace(tmp, os.path.join(snapshot_dir, "CURRENT"))
+
+    snapshots = sorted(n for n in os.listdir(snapshot_dir) if n.startswith("sql_model-") and n.endswith(".joblib"))
+    for old in snapshots[:-keep]:
+        os.remove(os.path.join(snapshot_dir, old))
+    return version
+
+
+# ------------------------
+# Online model
+# ------------------------
+class OnlineSqlModel:
+    """
+    Question -> SQL classifier that learns one example at a time: a stateless
+    HashingVectorizer and an SGDClassifier (log loss) updated with
+    partial_fit(). Classes are SQL templates (see local_sql.template_key),
+    each labelled with the first query seen for it, so the class count grows
+    with new templates only, not with new slot values (collected in
+    slot_values for the generator instead). A new template adds a
+    zero-initialized row to the classifier.
+    """
 
-    # 2. Append new example if provided
+    def __init__(self, n_features=HASH_FEATURES, alpha=1e-5):
+        import numpy as np
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.vec = HashingVectorizer(ngram_range=(1, 2), n_features=n_features, alternate_sign=False, norm="l2",
+                                     dtype=np.float32)
+        self.alpha = alpha
+        self.clf = None
+        self.labels = {}  # template key -> class label (SQL)
+        self.slot_values = {}  # slot column -> values seen in training SQL
+        self.examples = 0
+        self._pending = ([], [])  # held until a second template makes the classifier trainable
+
+    def label(self, sql: str) -> str:
+        from local_sql import sql_template, template_key
+        template, slots = sql_template(sql)
+        for _, _, column, value in slots:
+            self.slot_values.setdefault(column, set()).add(value)
+        return self.labels.setdefault(template_key(template, slots), sql)
+
+    def partial_fit(self, questions, sqls, epochs=1):
+        import numpy as np
+        from sklearn.linear_model import SGDClassifier
+
+        labels = [self.label(sql) for sql in sqls]
+        self.examples += len(labels)
+        if self.clf is None:
+            self._pending[0].extend(questions)
+            self._pending[1].extend(labels)
+            if len(self.labels) < 2:
+                return self
+            questions, labels = self._pending
+            self._pending = ([], [])
+            self.clf = SGDClassifier(loss="log_loss", alpha=self.alpha)
+            self.clf.partial_fit(self.vec.transform(questions[:1]), labels[:1],
+                                 classes=np.array(list(self.labels.values()), dtype=object))
+            self.clf.classes_ = self.clf.classes_.astype(object)
+            questions, labels = questions[1:], labels[1:]
+        else:
+            self._grow()
+        if questions:
+            X = self.vec.transform(questions)
+            for _ in range(epochs):
+                self.clf.partial_fit(X, labels)
+        return self
+
+    def _grow(self):
+        """Add classifier rows for templates first seen in this batch."""
+        import numpy as np
+
+        known = set(self.clf.classes_)
+        new = [label for label in self.labels.values() if label not in known]
+        if not new:
+            return
+        coef, intercept = self.clf.coef_, self.clf.intercept_
+        if len(known) == 2:  # binary: one row scoring classes_[1] against classes_[0]
+            coef, intercept = np.vstack([-coef, coef]), np.concatenate([-intercept, intercept])
+        self.clf.classes_ = np.concatenate([self.clf.classes_, np.array(new, dtype=object)])
+        self.clf.coef_ = np.ascontiguousarray(np.vstack([coef, np.zeros((len(new), coef.shape[1]), coef.dtype)]))
+        self.clf.intercept_ = np.concatenate([intercept, np.zeros(len(new), intercept.dtype)])
+
+
+class OnlineSqlTrainer:
+    """
+    Adds examples to the local SQL model without a full retrain: each one is
+    appended to the log right away, and every `snapshot_every` examples the
+    batch is learned with one partial_fit() and a snapshot is published (the
+    classifier's per-call cost grows with the number of templates, not with
+    the batch). On start it resumes from the newest online snapshot and
+    replays the log written after it (or learns training_data.json plus the
+    whole log). One trainer process at a time: train_sql_model() keeps one
+    per process (online_trainer()), and its add() / publish() are serialized.
+    """
+
+    def __init__(self, log_path=LOG_PATH, snapshot_dir=SNAPSHOT_DIR, data_path=DATA_PATH,
+                 snapshot_every=SNAPSHOT_EVERY):
+        self.log_path = log_path
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_every = snapshot_every
+        self._lock = threading.Lock()
+        self._pending = []  # logged, learned at the next snapshot
+
+        resumed = self._latest_online()
+        if resumed is not None:
+            self.model, self.offset = resumed["model"], resumed["log_offset"]
+        else:
+            self.model, self.offset = OnlineSqlModel(), 0
+            if os.path.exists(data_path):
+                with open(data_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data:
+                    self.model.partial_fit([d["question"] for d in data], [d["sql"] for d in data],
+                                           epochs=BOOTSTRAP_EPOCHS)
+        replay, self.offset = read_log(log_path, self.offset)
+        if replay:
+            self.model.partial_fit([d["question"] for d in replay], [d["sql"] for d in replay])
+
+    def _latest_online(self):
+        """The newest snapshot holding an OnlineSqlModel (batch retrains publish plain ones)."""
+        if not os.path.isdir(self.snapshot_dir):
+            return None
+        for name in sorted(os.listdir(self.snapshot_dir), reverse=True):
+            if name.startswith("sql_model-") and name.endswith(".joblib"):
+                payload = load_snapshot(os.path.join(self.snapshot_dir, name))
+                if "model" in payload:
+                    return payload
+        return None
+
+    def add(self, examples):
+        """Log examples ({"question", "sql", "answer"}); returns the snapshot version if one was published."""
+        for example in examples:
+            check_example(example)
+        with self._lock:
+            self.offset = append_examples(examples, self.log_path)
+            self._pending.extend(examples)
+            if len(self._pending) >= self.snapshot_every:
+                return self._publish()
+        return None
+
+    @property
+    def pending(self) -> int:
+        """Examples logged since the last snapshot."""
+        return len(self._pending)
+
+    def publish(self) -> int:
+        with self._lock:
+            return self._publish()
+
+    def _publish(self):
+        if self._pending:
+            self.model.partial_fit([e["question"] for e in self._pending], [e["sql"] for e in self._pending])
+            self._pending = []
+        if self.model.clf is None:
+            return None  # fewer than two templates so far: nothing to serve
+        return publish_snapshot({"vec": self.model.vec, "clf": self.model.clf, "vocab": self.model.slot_values,
+                                 "model": self.model,
+                                 "log_offset": self.offset, "examples": self.model.examples}, self.snapshot_dir)
+
+
+_trainer = None
+_trainer_lock = threading.Lock()
+
+
+def online_trainer() -> OnlineSqlTrainer:
+    """This process's OnlineSqlTrainer, started (resumed or bootstrapped) on first use."""
+    global _trainer
+    with _trainer_lock:
+        if _trainer is None:
+            _trainer = OnlineSqlTrainer()
+        return _trainer
+
+
+def train_sql_model(new_example=None):
+    """
+    Train or update the SQL NLP model.
+
+    Args:
+        new_example (dict): optional, {"question": "...", "sql": "...", "answer": "..."}
+                            If given, it is logged and learned incrementally by
+                            this process's online_trainer(), which publishes a
+                            snapshot every LOCAL_SQL_SNAPSHOT_EVERY examples.
+                            Without it, the model is refit from training_data.json
+                            plus the log and published as a snapshot too.
+    """
     if new_example:
-        required = {"question", "sql", "answer"}
-        if not required.issubset(new_example.keys()):
-            raise ValueError(f"New example must contain keys: {required}")
-        data.append(new_example)
-        with open(DATA_PATH, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
+        check_example(new_example)
+        trainer = online_trainer()
+        version = trainer.add([new_example])
+        if version is not None:
+            return f"✅ Example added, model snapshot {version} published to {SNAPSHOT_DIR}/"
+        if trainer.model.clf is None:
+            return f"✅ Example added to {LOG_PATH}; the model needs a second SQL template before it is published"
+        return f"✅ Example added to {LOG_PATH}; learned with the next snapshot ({trainer.pending} pending)"
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
 
+    # 1. Load training_data.json and the logged examples
+    data = load_examples()
     if not data:
         raise RuntimeError("No training data found!")
 
-    # 3. Prepare training sets
+    # 2. Prepare training sets
     questions = [d["question"] for d in data]
     sqls = [d["sql"] for d in data]
 
-    # 4. Train model
-    vec = TfidfVectorizer(stop_words="english")
-    X = vec.fit_transform(questions)
-
-    clf = LogisticRegression(max_iter=2000)
-    clf.fit(X, sqls)
+    # 3. Train model
+    vec, clf = fit_sql_model(questions, sqls)
 
-    # 5. Save artifacts
+    # 4. Save artifacts
+    import joblib
     joblib.dump(vec, VEC_PATH)
     joblib.dump(clf, CLF_PATH)
+    if current_snapshot() is not None:
+        # Snapshots take precedence over the files above once published, so publish this one as well.
+        publish_snapshot({"vec": vec, "clf": clf, "log_offset": read_log()[1], "examples": len(data)})
 
     return f"✅ Model trained with {len(data)} examples. Files saved to {MODEL_DIR}/"
 
+
+if __name__ == "__main__":
+    print(train_sql_model())
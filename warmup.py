@@ -0,0 +1,107 @@
+# warmup.py
+#
+# Start-up phase for the web servers. warm_up() loads what the first
+# question would otherwise load lazily: the FAISS index, docs and BM25
+# index, schema chunks, the tokenizer, the openai modules its clients import
+# on first use, and the local SQL classifier with its slot values.
+# warm_up_worker() then opens the DB pools and marks the process ready (GET
+# /ready). Under gunicorn (gunicorn.conf.py) warm_up() runs once in the
+# master before the fork, so workers share those pages copy-on-write
+# instead of each loading its own copy.
+
+import gc
+import logging
+import threading
+import time
+
+import db_engines
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_started = False
+_start_lock = threading.Lock()
+_timings = {}
+
+
+def _steps():
+    import context_builder
+    import llm_client
+    import rag
+    import retriever
+
+    def index():
+        _, docs, _ = retriever.get_retriever().state()
+        retriever.schema_texts(docs)
+
+    steps = [("index", index), ("tokenizer", lambda: context_builder.count_tokens("warm up")),
+             ("openai", llm_client.preload)]
+    if rag.LOCAL_SQL_ENABLED:
+        steps.append(("local_sql", rag.local_sql.preload))
+    return steps
+
+
+def warm_up() -> dict:
+    """
+    Load the process-wide read-only state; returns seconds per step. A step
+    that fails is logged and left to load on first use.
+    """
+    global _started
+    _started = True
+    start = time.perf_counter()
+    for name, fn in _steps():
+        t = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            logger.warning("Warm-up: %s not loaded, it will load on first use (%s)", name, e)
+            continue
+        _timings[name] = round(time.perf_counter() - t, 3)
+    logger.info("Warmed up in %.2f s: %s", time.perf_counter() - start, _timings)
+    return dict(_timings)
+
+
+def prepare_fork():
+    """
+    In the master, after warm_up(): close DB connections so workers inherit
+    none, and take the loaded objects out of the garbage collector's view. A
+    collection writes to every object it visits, which would copy the shared
+    pages into each worker.
+    """
+    db_engines.reset_pools()
+    gc.freeze()
+
+
+def warm_up_worker():
+    """In each serving process: open its own DB pools, then report ready."""
+    if db_engines.DB_WARMUP:
+        try:
+            db_engines.warm_up()
+        except Exception as e:
+            logger.warning("Warm-up: DB pools not opened (%s)", e)
+    mark_ready()
+
+
+def start_background():
+    """
+    Warm up in a thread unless something already has (a server started
+    without the hooks); /ready flips when it is done.
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=lambda: (warm_up(), warm_up_worker()), name="warm-up", daemon=True).start()
+
+
+def mark_ready():
+    _ready.set()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def timings() -> dict:
+    return dict(_timings)